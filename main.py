@@ -4,22 +4,122 @@ H&M推荐系统主运行脚本
 
 运行完整的推荐系统流程：
 1. 数据预处理
-2. 特征工程
+2. 特征工程（LightFM、用户特征、交易聚合特征，互相独立，并发执行）
 3. 模型训练
 4. 预测推理
+
+各步骤按依赖关系组成DAG，输入和配置未变化的步骤自动跳过，失败后重新运行即可从失败处继续。
 """
 
 import os
 import sys
 import argparse
 from logzero import logger
+from typing import Any, Dict, Optional
 
 # 添加src目录到路径
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from data.preprocessing import DataPreprocessor
-from features.lfm_features import LightFMFeatureGenerator
+from features.lfm_scheduler import LightFMScheduler
 from features.user_features import UserFeatureGenerator
+from features.transaction_features import TransactionFeatureGenerator
+from data.store import get_data_store
+from models.training import RankerTrainer
+from models.inference import BatchPredictor
+from utils.config import DEFAULT_CONFIG_PATH, load_config
+from utils.pipeline import Pipeline, Step
+
+
+# --step到流水线步骤的映射
+STEP_GROUPS = {
+    'preprocess': ['preprocess'],
+    'features': ['lightfm', 'user_features', 'transaction_features'],
+    'train': ['train'],
+    'predict': ['predict'],
+}
+
+
+def run_preprocess(config: Dict[str, Any], cores: int, data_dir: str, incremental: bool, chunked: bool,
+                   columnar: bool, anchor_date: Optional[str]) -> None:
+    """步骤1: 数据预处理"""
+    preprocessor = DataPreprocessor(data_dir)
+    if incremental:
+        preprocessor.append_data(columnar=columnar)
+    else:
+        preprocessor.process_data(chunked=chunked, columnar=columnar, anchor_date=anchor_date)
+
+
+def run_lightfm(config: Dict[str, Any], cores: int, data_dir: str) -> None:
+    """步骤2a: LightFM特征（线程数为分到的核数）"""
+    config = {**config, 'lightfm': {**(config.get('lightfm') or {}), 'num_threads': cores}}
+    LightFMScheduler(data_dir, config).run()
+
+
+def run_user_features(config: Dict[str, Any], cores: int, data_dir: str) -> None:
+    """步骤2b: 用户特征"""
+    store = get_data_store(os.path.join(data_dir, 'processed'))
+    UserFeatureGenerator(data_dir, store=store).generate_all_features()
+
+
+def run_transaction_features(config: Dict[str, Any], cores: int, data_dir: str) -> None:
+    """步骤2c: 交易聚合特征"""
+    store = get_data_store(os.path.join(data_dir, 'processed'))
+    TransactionFeatureGenerator(data_dir, store=store, config=config).generate_all_features()
+
+
+def run_train(config: Dict[str, Any], cores: int, data_dir: str) -> None:
+    """步骤3: 模型训练"""
+    store = get_data_store(os.path.join(data_dir, 'processed'))
+    RankerTrainer(data_dir, store=store, config=config).train()
+
+
+def run_predict(config: Dict[str, Any], cores: int, data_dir: str) -> None:
+    """步骤4: 预测推理"""
+    store = get_data_store(os.path.join(data_dir, 'processed'))
+    predictor = BatchPredictor(data_dir, store=store, config=config)
+    predictor.predict(os.path.join(data_dir, 'submission.csv'))
+
+
+def build_pipeline(args: argparse.Namespace, config: Dict[str, Any]) -> Pipeline:
+    """
+    构建流水线：LightFM、用户特征和交易聚合特征都只依赖processed目录，可以并发执行
+
+    Args:
+        args: 命令行参数
+        config: 配置
+
+    Returns:
+        流水线
+    """
+    data_dir = args.data_dir
+    pipeline_config = config.get('pipeline') or {}
+    pipeline = Pipeline(os.path.join(data_dir, 'pipeline_state.json'), config,
+                        args.num_cores or pipeline_config.get('num_cores'))
+    num_cores = pipeline.num_cores
+
+    def path(name: str) -> str:
+        return os.path.join(data_dir, name)
+
+    feature_dirs = [path('processed'), path('lfm'), path('user_features'), path('transaction_features')]
+    pipeline.add(Step('preprocess', run_preprocess, [path('raw')], [path('processed')], params={
+        'data_dir': data_dir, 'incremental': args.incremental, 'chunked': args.chunked,
+        'columnar': not args.no_columnar, 'anchor_date': args.anchor_date,
+    }))
+    # LightFM自带多线程，其余核留给并发的特征步骤
+    lfm_cores = int((config.get('lightfm') or {}).get('num_threads') or max(num_cores - 2, 1))
+    pipeline.add(Step('lightfm', run_lightfm, [path('processed')], [path('lfm')],
+                      config_sections=['lightfm'], params={'data_dir': data_dir}, cores=lfm_cores))
+    pipeline.add(Step('user_features', run_user_features, [path('processed')], [path('user_features')],
+                      params={'data_dir': data_dir}))
+    pipeline.add(Step('transaction_features', run_transaction_features, [path('processed')],
+                      [path('transaction_features')], config_sections=['features'], params={'data_dir': data_dir}))
+    pipeline.add(Step('train', run_train, feature_dirs, [path('train'), path('models')],
+                      config_sections=['model', 'features', 'lightfm', 'catboost', 'lightgbm'],
+                      params={'data_dir': data_dir}, cores=num_cores))
+    pipeline.add(Step('predict', run_predict, feature_dirs + [path('models')], [path('submission.csv')],
+                      config_sections=['model', 'lightfm'], params={'data_dir': data_dir}, cores=num_cores))
+    return pipeline
 
 
 def main():
@@ -27,35 +127,34 @@ def main():
     parser = argparse.ArgumentParser(description='H&M推荐系统')
     parser.add_argument('--data_dir', type=str, default='data', 
                        help='数据目录路径')
-    parser.add_argument('--step', type=str, choices=['preprocess', 'features', 'train', 'all'],
+    parser.add_argument('--config', type=str, default=DEFAULT_CONFIG_PATH,
+                       help='配置文件路径')
+    parser.add_argument('--step', type=str, choices=list(STEP_GROUPS) + ['all'],
                        default='all', help='运行步骤')
+    parser.add_argument('--chunked', action='store_true',
+                       help='预处理时分块读取并向量化编码')
+    parser.add_argument('--no_columnar', action='store_true',
+                       help='预处理时不保存紧凑列式格式')
+    parser.add_argument('--incremental', action='store_true',
+                       help='增量预处理：只追加新的交易日和新的customers/articles')
+    parser.add_argument('--anchor_date', type=str, default=None,
+                       help='week/day的锚定日期（全量预处理时使用，默认最新交易日期）')
+    parser.add_argument('--lfm_warm_start', action='store_true',
+                       help='LightFM按窗口热启动训练（从最旧的窗口开始，后续窗口继续训练）')
+    parser.add_argument('--num_cores', type=int, default=None,
+                       help='并发步骤的核数预算（默认为配置中的pipeline.num_cores或CPU核数）')
+    parser.add_argument('--force', action='store_true',
+                       help='忽略已完成步骤的指纹，全部重新运行')
     
     args = parser.parse_args()
+    config = load_config(args.config)
+    if args.lfm_warm_start:
+        config.setdefault('lightfm', {})['warm_start'] = True
     
     logger.info("开始运行H&M推荐系统...")
     
-    if args.step in ['preprocess', 'all']:
-        logger.info("步骤1: 数据预处理")
-        preprocessor = DataPreprocessor(args.data_dir)
-        preprocessor.process_data()
-    
-    if args.step in ['features', 'all']:
-        logger.info("步骤2: 特征工程")
-        
-        # LightFM特征
-        logger.info("生成LightFM特征...")
-        lfm_generator = LightFMFeatureGenerator(args.data_dir)
-        lfm_generator.generate_all_features()
-        
-        # 用户特征
-        logger.info("生成用户特征...")
-        user_generator = UserFeatureGenerator(args.data_dir)
-        user_generator.generate_all_features()
-    
-    if args.step in ['train', 'all']:
-        logger.info("步骤3: 模型训练")
-        # TODO: 实现模型训练
-        logger.info("模型训练功能待实现")
+    targets = None if args.step == 'all' else STEP_GROUPS[args.step]
+    build_pipeline(args, config).run(targets, force=args.force)
     
     logger.info("H&M推荐系统运行完成！")
 
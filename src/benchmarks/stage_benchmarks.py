@@ -0,0 +1,246 @@
+"""
+各阶段性能基准
+
+在合成数据上计时并统计内存，结果追加到JSON Lines文件，便于比较不同提交之间的变化：
+- 预处理：DataPreprocessor.process_data
+- 候选生成：CandidateGenerator的各个策略以及create_candidates整体
+- LightFM用户-商品矩阵构建：build_user_item_matrix
+- 用户onehot聚合特征：create_user_ohe_agg
+
+内存为tracemalloc统计的阶段内Python/numpy分配峰值，另记录进程的RSS峰值。
+"""
+
+import os
+import gc
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Callable, Dict, List, Optional
+
+from data.preprocessing import DataPreprocessor
+from data.store import DataStore
+from data.synthetic import SCALE_PRESETS, SyntheticDataGenerator
+from features.lfm_features import LightFMFeatureGenerator
+from features.user_features import UserFeatureGenerator
+from models.candidate_generation import CandidateGenerator, candidate_params_from_config
+
+# 可选的阶段组
+STAGES = ('preprocess', 'candidates', 'lightfm_matrix', 'user_ohe_agg')
+
+
+def _git_commit() -> Optional[str]:
+    """当前代码的提交（不在git仓库中时为None）"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageBenchmark:
+    """阶段基准运行器"""
+
+    def __init__(self, data_dir: str, results_path: str, week: int = 1, memory: bool = True):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径（raw目录中需要有原始数据）
+            results_path: 结果文件（JSON Lines，每次运行追加）
+            week: 候选和特征使用的时间窗口
+            memory: 是否用tracemalloc统计内存峰值（有一定的计时开销）
+        """
+        self.data_dir = data_dir
+        self.processed_dir = os.path.join(data_dir, 'processed')
+        self.results_path = results_path
+        self.week = week
+        self.memory = memory
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, name: str, func: Callable[[], Any]) -> Any:
+        """
+        计时并统计内存
+
+        Args:
+            name: 阶段名
+            func: 无参数的函数
+
+        Returns:
+            func的返回值
+        """
+        gc.collect()
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+            if self.memory:
+                tracemalloc.stop()
+        self.results.append({
+            'stage': name,
+            'seconds': seconds,
+            'peak_mb': None if peak is None else peak / 1024 ** 2,
+            # Linux下ru_maxrss的单位为KB
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        })
+        logger.info(f"基准 {name}: {seconds:.2f}s" + ('' if peak is None else f", 峰值{peak / 1024 ** 2:.1f}MB"))
+        return result
+
+    def run_preprocess(self) -> None:
+        """预处理（默认流程和分块流程）"""
+        preprocessor = DataPreprocessor(self.data_dir)
+        self.measure('preprocess', preprocessor.process_data)
+        self.measure('preprocess_chunked', lambda: preprocessor.process_data(chunked=True))
+
+    def _store(self) -> DataStore:
+        """新的数据仓库（不复用进程内共享实例，避免缓存影响计时）"""
+        store = DataStore(self.processed_dir)
+        self.measure('load_tables', lambda: (store.table('transactions_train'), store.table('users'),
+                                             store.table('items'), store.transaction_index()))
+        return store
+
+    def run_candidates(self, store: DataStore) -> None:
+        """候选生成的各个策略，目标用户为下一周有购买的用户（与训练一致）"""
+        week = self.week
+        generator = CandidateGenerator(store=store)
+        target_users = np.unique(store.transactions_between(week - 1, 1, ['user'])['user'].values)
+
+        self.measure('candidates_repurchase',
+                     lambda: generator.create_candidates_repurchase('repurchase', target_users, week))
+        item2item2 = self.measure('candidates_item2item2',
+                                  lambda: generator.create_candidates_repurchase('item2item2', target_users, week, 12))
+        self.measure('candidates_popular_compact',
+                     lambda: generator.create_candidates_popular_compact(target_users, week, 1, 60))
+        self.measure('candidates_popular',
+                     lambda: generator.create_candidates_popular(target_users, week, 1, 60))
+        dept_items = self.measure('candidates_category_items',
+                                  lambda: generator.category_popular_items(week, 1, 6, 'department_no_idx'))
+        self.measure('candidates_category_popular',
+                     lambda: generator.create_candidates_category_popular(
+                         item2item2, week, 1, 6, 'department_no_idx', category_items=dept_items))
+        self.measure('candidates_copurchase_item2item',
+                     lambda: generator.create_candidates_item2item(target_users, week, 12))
+        self.measure('candidates_all',
+                     lambda: generator.create_candidates(target_users, week, compact=True,
+                                                         **candidate_params_from_config(None)))
+
+    def run_lightfm_matrix(self, store: DataStore) -> None:
+        """LightFM用户-商品矩阵构建"""
+        generator = LightFMFeatureGenerator(self.data_dir, store=store)
+        self.measure('lightfm_matrix', lambda: generator.build_user_item_matrix(self.week))
+
+    def run_user_ohe_agg(self, store: DataStore) -> None:
+        """用户onehot聚合特征"""
+        generator = UserFeatureGenerator(self.data_dir, store=store)
+        self.measure('user_ohe_agg', lambda: generator.create_user_ohe_agg(self.week))
+
+    def run(self, stages: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """
+        运行基准并追加保存结果
+
+        Args:
+            stages: 要运行的阶段组（见STAGES），默认全部
+            metadata: 一并记录的运行信息（如规模预设）
+
+        Returns:
+            本次运行的结果
+        """
+        stages = list(stages or STAGES)
+        self.results = []
+        if 'preprocess' in stages:
+            self.run_preprocess()
+        if any(stage != 'preprocess' for stage in stages):
+            store = self._store()
+            if 'candidates' in stages:
+                self.run_candidates(store)
+            if 'lightfm_matrix' in stages:
+                self.run_lightfm_matrix(store)
+            if 'user_ohe_agg' in stages:
+                self.run_user_ohe_agg(store)
+
+        run = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': _git_commit(),
+            'week': self.week,
+            'memory': self.memory,
+            **(metadata or {}),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.results_path)), exist_ok=True)
+        with open(self.results_path, 'a') as f:
+            f.write(json.dumps({**run, 'results': self.results}, ensure_ascii=False) + '\n')
+        logger.info(f"基准结果已保存: {self.results_path}")
+        return pd.DataFrame(self.results)
+
+
+def load_runs(results_path: str) -> List[Dict[str, Any]]:
+    """读取结果文件中的全部运行"""
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_runs(baseline: Dict[str, Any], current: Dict[str, Any]) -> pd.DataFrame:
+    """
+    比较两次运行
+
+    Args:
+        baseline: 基准运行
+        current: 当前运行
+
+    Returns:
+        current中各阶段的耗时、内存峰值以及current / baseline的比值（按current的阶段顺序）
+    """
+    columns = ['stage', 'seconds', 'peak_mb']
+    df = pd.DataFrame(baseline['results'])[columns].merge(
+        pd.DataFrame(current['results'])[columns], on='stage', how='right', suffixes=('_base', '_current')
+    )
+    df['seconds_ratio'] = df['seconds_current'] / df['seconds_base']
+    df['peak_ratio'] = df['peak_mb_current'] / df['peak_mb_base']
+    return df
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='H&M推荐系统各阶段性能基准')
+    parser.add_argument('--preset', type=str, choices=list(SCALE_PRESETS), default='small', help='合成数据规模')
+    parser.add_argument('--seed', type=int, default=42, help='合成数据随机种子')
+    parser.add_argument('--data_dir', type=str, default=None, help='数据目录，默认data/benchmark_{preset}')
+    parser.add_argument('--results', type=str, default=os.path.join('data', 'benchmark_results.jsonl'),
+                        help='结果文件（JSON Lines）')
+    parser.add_argument('--stages', type=str, nargs='+', choices=STAGES, default=None, help='要运行的阶段组')
+    parser.add_argument('--week', type=int, default=1, help='候选和特征使用的时间窗口')
+    parser.add_argument('--no_memory', action='store_true', help='不统计内存峰值（计时更准确）')
+    parser.add_argument('--regenerate', action='store_true', help='重新生成合成数据')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or os.path.join('data', f'benchmark_{args.preset}')
+    if args.regenerate or not os.path.exists(os.path.join(data_dir, 'raw', 'transactions_train.csv')):
+        SyntheticDataGenerator(data_dir, args.preset, args.seed).generate()
+
+    metadata = {'preset': args.preset, 'seed': args.seed}
+    previous = [run for run in load_runs(args.results)
+                if all(run.get(k) == v for k, v in metadata.items()) and run.get('week') == args.week]
+    benchmark = StageBenchmark(data_dir, args.results, week=args.week, memory=not args.no_memory)
+    result = benchmark.run(args.stages, metadata)
+    logger.info(f"基准结果:\n{result.to_string(index=False)}")
+
+    # 与相同规模和种子的上一次运行比较
+    if previous:
+        current = load_runs(args.results)[-1]
+        comparison = compare_runs(previous[-1], current)
+        logger.info(f"与上次运行比较 ({previous[-1]['time']}, {previous[-1]['commit']}):\n"
+                    f"{comparison.to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    main()
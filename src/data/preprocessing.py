@@ -9,11 +9,16 @@
 """
 
 import os
+import json
+import numpy as np
 import pandas as pd
 from logzero import logger
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Tuple, Optional
 import pickle
 
+from data.storage import (save_table, save_pickle, append_table, append_pickle, has_columnar_table,
+                          load_pickle, load_table)
+
 # 数据格式定义
 ARTICLES_ORIGINAL = {
     'article_id': 'object',
@@ -60,6 +65,18 @@ TRANSACTIONS_ORIGINAL = {
     'sales_channel_id': 'int64',
 }
 
+# 需要做count encoding的列
+CUSTOMERS_COUNT_ENCODING_COLUMNS = ['club_member_status', 'fashion_news_frequency']
+
+ARTICLES_COUNT_ENCODING_COLUMNS = [
+    'product_type_no', 'product_group_name', 'graphical_appearance_no',
+    'colour_group_code', 'perceived_colour_value_id', 'perceived_colour_master_id',
+    'department_no', 'index_code', 'index_group_no', 'section_no', 'garment_group_no',
+]
+
+# 增量处理状态文件（记录week/day的锚定日期、已处理的最新日期和原始交易文件已读取的字节数）
+INCREMENTAL_STATE_FILE = 'incremental_state.json'
+
 
 class DataPreprocessor:
     """数据预处理器"""
@@ -99,9 +116,234 @@ class DataPreprocessor:
         """添加标签编码列"""
         df[col_name_to] = df[col_name_from].apply(lambda x: mapping[x]).astype('int64')
     
-    def process_data(self) -> None:
-        """执行完整的数据预处理流程"""
+    def _build_lookup(self, mapping: Dict[Any, int]) -> Tuple[pd.Index, np.ndarray]:
+        """
+        将编码字典转换为哈希索引+编码数组，用于向量化查表
+        
+        Args:
+            mapping: 标签编码字典
+            
+        Returns:
+            (键索引, 对应编码数组)
+        """
+        keys = pd.Index(list(mapping.keys()))
+        values = np.fromiter(mapping.values(), dtype='int64', count=len(mapping))
+        return keys, values
+    
+    def _add_idx_column_vectorized(self, df: pd.DataFrame, col_name_from: str,
+                                   col_name_to: str, lookup: Tuple[pd.Index, np.ndarray]) -> None:
+        """添加标签编码列（向量化哈希查表，结果与_add_idx_column一致）"""
+        keys, values = lookup
+        positions = keys.get_indexer(df[col_name_from])
+        if (positions < 0).any():
+            raise KeyError(df[col_name_from].values[np.argmax(positions < 0)])
+        df[col_name_to] = values[positions]
+    
+    def _seek_transactions(self, f, offset: int) -> List[str]:
+        """
+        读取表头并定位到字节偏移处（偏移无效时定位到表头之后，从头读取）
+        
+        Args:
+            f: 以二进制模式打开的交易数据文件
+            offset: 上次已读取到的字节数（位于行首）
+            
+        Returns:
+            表头列名
+        """
+        header = f.readline().decode().rstrip('\r\n').split(',')
+        data_start = f.tell()
+        if offset > data_start:
+            f.seek(0, os.SEEK_END)
+            valid = offset <= f.tell()
+            if valid:
+                f.seek(offset - 1)
+                valid = f.read(1) == b'\n'
+            if not valid:
+                logger.warning(f"原始交易文件与上次读取时不一致，从头读取（偏移{offset}）")
+                f.seek(data_start)
+        return header
+    
+    def _iter_transactions_chunked(
+        self,
+        mp_customer_id: Dict[Any, int],
+        mp_article_id: Dict[Any, int],
+        chunksize: int,
+        path: Optional[str] = None,
+        after_date: Optional[pd.Timestamp] = None,
+        offset: int = 0
+    ) -> Iterator[pd.DataFrame]:
+        """
+        分块读取transactions并逐块完成ID编码，避免整表逐行apply
+        
+        Args:
+            mp_customer_id: customer_id编码字典
+            mp_article_id: article_id编码字典
+            chunksize: 每块行数
+            path: 交易数据路径，默认raw/transactions_train.csv
+            after_date: 只保留晚于该日期的交易（增量模式）
+            offset: 从该字节偏移处开始读取（增量模式，跳过上次已读取的部分）
+            
+        Yields:
+            编码后的交易数据块（不含时间特征）
+        """
+        customer_lookup = self._build_lookup(mp_customer_id)
+        article_lookup = self._build_lookup(mp_article_id)
+        
+        if path is None:
+            path = self._raw_transactions_path()
+        
+        with open(path, 'rb') as f:
+            header = self._seek_transactions(f, offset)
+            reader = pd.read_csv(
+                f,
+                header=None,
+                names=header,
+                dtype=TRANSACTIONS_ORIGINAL,
+                parse_dates=['t_dat'],
+                chunksize=chunksize
+            )
+            for i, chunk in enumerate(reader):
+                if after_date is not None:
+                    chunk = chunk[chunk['t_dat'] > after_date].reset_index(drop=True)
+                self._add_idx_column_vectorized(chunk, 'customer_id', 'user', customer_lookup)
+                self._add_idx_column_vectorized(chunk, 'article_id', 'item', article_lookup)
+                chunk['sales_channel_id'] = chunk['sales_channel_id'] - 1
+                logger.info(f"已处理transactions分块: {i + 1}")
+                yield chunk
+    
+    def _read_transactions_chunked(
+        self,
+        mp_customer_id: Dict[Any, int],
+        mp_article_id: Dict[Any, int],
+        chunksize: int,
+        path: Optional[str] = None,
+        after_date: Optional[pd.Timestamp] = None,
+        offset: int = 0
+    ) -> pd.DataFrame:
+        """分块读取并编码，拼接为一个DataFrame（用于增量模式，新增的交易较少）"""
+        chunks = self._iter_transactions_chunked(mp_customer_id, mp_article_id, chunksize, path, after_date, offset)
+        return pd.concat(list(chunks), ignore_index=True)
+    
+    def _write_transactions_chunked(
+        self,
+        mp_customer_id: Dict[Any, int],
+        mp_article_id: Dict[Any, int],
+        chunksize: int,
+        anchor_date: Optional[str],
+        columnar: bool
+    ) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        """
+        分块读取、编码transactions并逐块追加写出，编码阶段的峰值内存只与块大小有关
+        
+        未指定锚定日期时先单独读取一遍t_dat列得到最新交易日期。
+        编码后的块逐块写出为pickle增量文件，全部写出后拼接为完整的数据表，整表保存pickle和列式数据
+        （只有这一步需要整表内存），load_table与pd.read_pickle的读取结果都与整表写出一致。
+        
+        Args:
+            mp_customer_id: customer_id编码字典
+            mp_article_id: article_id编码字典
+            chunksize: 每块行数
+            anchor_date: week/day的锚定日期，None为最新交易日期
+            columnar: 是否同时写出紧凑列式格式
+            
+        Returns:
+            (锚定日期, 最新交易日期)
+        """
+        path = self._raw_transactions_path()
+        if anchor_date:
+            anchor = pd.Timestamp(anchor_date)
+        else:
+            reader = pd.read_csv(path, usecols=['t_dat'], parse_dates=['t_dat'], chunksize=chunksize)
+            anchor = max(chunk['t_dat'].max() for chunk in reader)
+        
+        last_date = None
+        for i, chunk in enumerate(self._iter_transactions_chunked(mp_customer_id, mp_article_id, chunksize)):
+            self._add_time_columns(chunk, anchor)
+            if i == 0:
+                save_pickle(chunk, self.processed_dir, 'transactions_train')
+            else:
+                append_pickle(chunk, self.processed_dir, 'transactions_train')
+            chunk_last = chunk['t_dat'].max()
+            if last_date is None or chunk_last > last_date:
+                last_date = chunk_last
+        
+        # 拼接为单个完整的pickle（同时清除增量文件），列式数据按整表写出，类别表与默认流程一致
+        self._save_table(load_pickle(self.processed_dir, 'transactions_train'), 'transactions_train', columnar)
+        return anchor, last_date
+    
+    def _fill_customers_na(self, customers: pd.DataFrame) -> None:
+        """处理customers缺失值"""
+        customers['FN'] = customers['FN'].fillna(0).astype('int64')
+        customers['Active'] = customers['Active'].fillna(0).astype('int64')
+        customers['club_member_status'] = customers['club_member_status'].fillna('NULL')
+        customers['fashion_news_frequency'] = customers['fashion_news_frequency'].fillna('NULL')
+    
+    def _add_time_columns(self, transactions: pd.DataFrame, anchor_date: pd.Timestamp) -> None:
+        """根据锚定日期生成week/day列（锚定日期之后的交易为负数）"""
+        days = (anchor_date - transactions['t_dat']).dt.days
+        transactions['week'] = days // 7
+        transactions['day'] = days
+    
+    def _save_table(self, df: pd.DataFrame, name: str, columnar: bool) -> None:
+        """保存数据表（pickle，以及可选的紧凑列式格式）"""
+        save_pickle(df, self.processed_dir, name)
+        if columnar:
+            save_table(df, self.processed_dir, name)
+    
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """
+        读取增量处理状态
+        
+        Returns:
+            {'anchor_date': 锚定日期, 'last_date': 已处理的最新交易日期,
+             'raw_offset': 原始交易文件已读取的字节数（未知时为0）}，不存在时返回None
+        """
+        path = os.path.join(self.processed_dir, INCREMENTAL_STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        return {
+            'anchor_date': pd.Timestamp(state['anchor_date']),
+            'last_date': pd.Timestamp(state['last_date']),
+            'raw_offset': int(state.get('raw_offset', 0)),
+        }
+    
+    def _save_state(self, anchor_date: pd.Timestamp, last_date: pd.Timestamp, raw_offset: int = 0) -> None:
+        """保存增量处理状态"""
+        with open(os.path.join(self.processed_dir, INCREMENTAL_STATE_FILE), 'w') as f:
+            json.dump({
+                'anchor_date': anchor_date.strftime('%Y-%m-%d'),
+                'last_date': last_date.strftime('%Y-%m-%d'),
+                'raw_offset': int(raw_offset),
+            }, f)
+    
+    def _raw_transactions_path(self) -> str:
+        """原始交易数据路径"""
+        return os.path.join(self.data_dir, 'raw', 'transactions_train.csv')
+    
+    def process_data(self, chunked: bool = False, chunksize: int = 5_000_000,
+                     columnar: bool = True, anchor_date: Optional[str] = None) -> None:
+        """
+        执行完整的数据预处理流程
+        
+        Args:
+            chunked: 是否使用分块读取+向量化编码，transactions逐块写出（读取结果与默认流程一致）
+            chunksize: 分块模式下每次读取的transactions行数
+            columnar: 是否同时保存紧凑列式格式（供load_table内存映射读取）
+            anchor_date: week/day的存储锚定日期，默认为最新交易日期
+                （DataStore读取时总是按最新交易日期重新计算week/day）
+        """
         logger.info("开始数据预处理...")
+        # 读取前记录原始交易文件的大小，增量追加时从这里继续读取
+        raw_offset = os.path.getsize(self._raw_transactions_path())
+        
+        if chunked:
+            def add_idx_column(df, col_name_from, col_name_to, mapping):
+                self._add_idx_column_vectorized(
+                    df, col_name_from, col_name_to, self._build_lookup(mapping))
+        else:
+            add_idx_column = self._add_idx_column
         
         # 读取原始数据
         logger.info("读取原始数据...")
@@ -113,11 +355,12 @@ class DataPreprocessor:
             os.path.join(self.data_dir, 'raw', 'customers.csv'), 
             dtype=CUSTOMERS_ORIGINAL
         )
-        transactions = pd.read_csv(
-            os.path.join(self.data_dir, 'raw', 'transactions_train.csv'),
-            dtype=TRANSACTIONS_ORIGINAL,
-            parse_dates=['t_dat']
-        )
+        if not chunked:
+            transactions = pd.read_csv(
+                self._raw_transactions_path(),
+                dtype=TRANSACTIONS_ORIGINAL,
+                parse_dates=['t_dat']
+            )
         
         # 生成ID映射
         logger.info("生成ID映射...")
@@ -137,53 +380,204 @@ class DataPreprocessor:
         
         # 处理customers数据
         logger.info("处理customers数据...")
-        self._add_idx_column(customers, 'customer_id', 'user', mp_customer_id)
+        add_idx_column(customers, 'customer_id', 'user', mp_customer_id)
         
         # 处理缺失值
-        customers['FN'] = customers['FN'].fillna(0).astype('int64')
-        customers['Active'] = customers['Active'].fillna(0).astype('int64')
-        customers['club_member_status'] = customers['club_member_status'].fillna('NULL')
-        customers['fashion_news_frequency'] = customers['fashion_news_frequency'].fillna('NULL')
+        self._fill_customers_na(customers)
         
         # 标签编码
-        for col_name in ['club_member_status', 'fashion_news_frequency']:
+        for col_name in CUSTOMERS_COUNT_ENCODING_COLUMNS:
             mp = self._count_encoding_dict(customers, col_name)
-            self._add_idx_column(customers, col_name, f'{col_name}_idx', mp)
+            add_idx_column(customers, col_name, f'{col_name}_idx', mp)
         
-        customers.to_pickle(os.path.join(self.processed_dir, 'users.pkl'))
+        self._save_table(customers, 'users', columnar)
         
         # 处理articles数据
         logger.info("处理articles数据...")
-        self._add_idx_column(articles, 'article_id', 'item', mp_article_id)
+        add_idx_column(articles, 'article_id', 'item', mp_article_id)
         
         # 标签编码
-        count_encoding_columns = [
-            'product_type_no', 'product_group_name', 'graphical_appearance_no',
-            'colour_group_code', 'perceived_colour_value_id', 'perceived_colour_master_id',
-            'department_no', 'index_code', 'index_group_no', 'section_no', 'garment_group_no',
-        ]
-        
-        for col_name in count_encoding_columns:
+        for col_name in ARTICLES_COUNT_ENCODING_COLUMNS:
             mp = self._count_encoding_dict(articles, col_name)
-            self._add_idx_column(articles, col_name, f'{col_name}_idx', mp)
+            add_idx_column(articles, col_name, f'{col_name}_idx', mp)
         
-        articles.to_pickle(os.path.join(self.processed_dir, 'items.pkl'))
+        self._save_table(articles, 'items', columnar)
         
         # 处理transactions数据
         logger.info("处理transactions数据...")
-        self._add_idx_column(transactions, 'customer_id', 'user', mp_customer_id)
-        self._add_idx_column(transactions, 'article_id', 'item', mp_article_id)
+        if chunked:
+            del customers, articles
+            anchor, last_date = self._write_transactions_chunked(
+                mp_customer_id, mp_article_id, chunksize, anchor_date, columnar
+            )
+        else:
+            self._add_idx_column(transactions, 'customer_id', 'user', mp_customer_id)
+            self._add_idx_column(transactions, 'article_id', 'item', mp_article_id)
+            
+            # 调整sales_channel_id
+            transactions['sales_channel_id'] = transactions['sales_channel_id'] - 1
+            
+            # 生成时间特征
+            if anchor_date:
+                anchor = pd.Timestamp(anchor_date)
+                self._add_time_columns(transactions, anchor)
+            else:
+                anchor = transactions['t_dat'].max()
+                transactions['week'] = (transactions['t_dat'].max() - transactions['t_dat']).dt.days // 7
+                transactions['day'] = (transactions['t_dat'].max() - transactions['t_dat']).dt.days
+            
+            self._save_table(transactions, 'transactions_train', columnar)
+            last_date = transactions['t_dat'].max()
         
-        # 调整sales_channel_id
-        transactions['sales_channel_id'] = transactions['sales_channel_id'] - 1
+        self._save_state(anchor, last_date, raw_offset)
         
-        # 生成时间特征
-        transactions['week'] = (transactions['t_dat'].max() - transactions['t_dat']).dt.days // 7
-        transactions['day'] = (transactions['t_dat'].max() - transactions['t_dat']).dt.days
+        logger.info("数据预处理完成！")
+    
+    def _extend_mapping(self, name: str, ids: pd.Series) -> Tuple[Dict[Any, int], np.ndarray]:
+        """
+        在已有ID映射末尾追加新ID，已有ID的编码保持不变
         
-        transactions.to_pickle(os.path.join(self.processed_dir, 'transactions_train.pkl'))
+        Args:
+            name: 映射名（customer_id / article_id）
+            ids: 原始数据中的全部ID
+            
+        Returns:
+            (更新后的映射字典, 新ID在ids中的布尔掩码)
+        """
+        path = os.path.join(self.processed_dir, f'mp_{name}.pkl')
+        mp_df = pd.read_pickle(path)
+        is_new = ~ids.isin(mp_df['val']).values
+        if is_new.any():
+            new_ids = ids[is_new].drop_duplicates()
+            mp_df = pd.concat([mp_df, pd.DataFrame({
+                'val': new_ids.values,
+                'idx': np.arange(len(mp_df), len(mp_df) + len(new_ids)),
+            })], ignore_index=True)
+            mp_df.to_pickle(path)
+        return dict(zip(mp_df['val'], mp_df['idx'])), is_new
+    
+    def _append_entities(
+        self,
+        name: str,
+        new_rows: pd.DataFrame,
+        id_column: str,
+        idx_column: str,
+        mapping: Dict[Any, int],
+        count_encoding_columns: list,
+        columnar: bool
+    ) -> None:
+        """
+        将新增的customers/articles追加到users/items表
         
-        logger.info("数据预处理完成！")
+        已有类别值沿用原编码，新类别值按新增数据中的频次排在原编码之后。
+        
+        Args:
+            name: 表名（users / items）
+            new_rows: 新增的原始数据
+            id_column: 原始ID列名
+            idx_column: 编码后的ID列名（user / item）
+            mapping: 更新后的ID映射
+            count_encoding_columns: 需要count encoding的列
+            columnar: 是否同步更新列式数据
+        """
+        table = pd.read_pickle(os.path.join(self.processed_dir, f'{name}.pkl'))
+        self._add_idx_column_vectorized(new_rows, id_column, idx_column, self._build_lookup(mapping))
+        
+        for col_name in count_encoding_columns:
+            existing = table[[col_name, f'{col_name}_idx']].drop_duplicates(col_name)
+            mp = dict(zip(existing[col_name], existing[f'{col_name}_idx']))
+            unseen = new_rows[~new_rows[col_name].isin(existing[col_name])]
+            if len(unseen) > 0:
+                for val, i in self._count_encoding_dict(unseen, col_name).items():
+                    mp[val] = len(existing) + i
+            self._add_idx_column_vectorized(
+                new_rows, col_name, f'{col_name}_idx', self._build_lookup(mp))
+        
+        table = pd.concat([table, new_rows[table.columns]], ignore_index=True)
+        self._save_table(table, name, columnar)
+        logger.info(f"{name}新增{len(new_rows)}条")
+    
+    def append_data(self, transactions_path: Optional[str] = None,
+                    chunksize: int = 5_000_000, columnar: bool = True) -> None:
+        """
+        增量追加新的交易日数据
+        
+        只处理晚于上次处理日期的交易，以及新出现的customers/articles。
+        已有的user/item编码保持不变，week/day使用固定的锚定日期计算，
+        因此已有行不会变化（锚定日期之后的交易week/day为负数，DataStore读取时按最新交易日期重新计算）。
+        默认的原始交易文件从上次读取到的字节偏移处继续读取，新增交易只追加写出，不重写已有数据。
+        
+        Args:
+            transactions_path: 新交易数据路径，默认raw/transactions_train.csv（只读取追加的部分）
+            chunksize: 每次读取的transactions行数
+            columnar: 是否同步更新列式数据
+        """
+        logger.info("开始增量预处理...")
+        
+        state = self.load_state()
+        if state is None:
+            # 由旧版本全量处理生成的数据：锚定日期即为其最新交易日期
+            last_date = load_table(self.processed_dir, 'transactions_train', ['t_dat'])['t_dat'].max()
+            state = {'anchor_date': last_date, 'last_date': last_date, 'raw_offset': 0}
+            self._save_state(state['anchor_date'], state['last_date'])
+        logger.info(f"锚定日期: {state['anchor_date'].date()}, 已处理至: {state['last_date'].date()}")
+        
+        # 新增articles
+        logger.info("处理新增articles...")
+        articles = pd.read_csv(
+            os.path.join(self.data_dir, 'raw', 'articles.csv'),
+            dtype=ARTICLES_ORIGINAL
+        )
+        mp_article_id, is_new = self._extend_mapping('article_id', articles['article_id'])
+        if is_new.any():
+            self._append_entities(
+                'items', articles[is_new].reset_index(drop=True), 'article_id', 'item',
+                mp_article_id, ARTICLES_COUNT_ENCODING_COLUMNS, columnar
+            )
+        del articles
+        
+        # 新增customers
+        logger.info("处理新增customers...")
+        customers = pd.read_csv(
+            os.path.join(self.data_dir, 'raw', 'customers.csv'),
+            dtype=CUSTOMERS_ORIGINAL
+        )
+        mp_customer_id, is_new = self._extend_mapping('customer_id', customers['customer_id'])
+        if is_new.any():
+            new_customers = customers[is_new].reset_index(drop=True)
+            self._fill_customers_na(new_customers)
+            self._append_entities(
+                'users', new_customers, 'customer_id', 'user',
+                mp_customer_id, CUSTOMERS_COUNT_ENCODING_COLUMNS, columnar
+            )
+        del customers
+        
+        # 新增交易
+        logger.info("处理新增transactions...")
+        raw_offset = state['raw_offset']
+        if transactions_path is None:
+            offset = raw_offset
+            raw_offset = os.path.getsize(self._raw_transactions_path())
+        else:
+            offset = 0
+        transactions = self._read_transactions_chunked(
+            mp_customer_id, mp_article_id, chunksize,
+            path=transactions_path, after_date=state['last_date'], offset=offset
+        )
+        if len(transactions) == 0:
+            logger.info("没有新的交易数据")
+            self._save_state(state['anchor_date'], state['last_date'], raw_offset)
+            return
+        self._add_time_columns(transactions, state['anchor_date'])
+        
+        # 先追加pickle再追加列式数据，列式数据不早于pickle时才会被读取
+        update_columnar = columnar and has_columnar_table(self.processed_dir, 'transactions_train')
+        append_pickle(transactions, self.processed_dir, 'transactions_train')
+        if update_columnar:
+            append_table(transactions, self.processed_dir, 'transactions_train')
+        
+        self._save_state(state['anchor_date'], transactions['t_dat'].max(), raw_offset)
+        logger.info(f"增量预处理完成！新增交易{len(transactions)}条")
 
 
 def main():
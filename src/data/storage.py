@@ -0,0 +1,402 @@
+"""
+列式存储模块
+
+将processed目录下的数据表以紧凑数据类型按列保存，每列一个.npy文件：
+- 整数列压缩为能容纳取值范围的最小类型（user/item为int32，week/day为int8/int16，
+  增量追加的交易week/day为负数）
+- 浮点列保存为float32
+- 字符串列保存为类别编码+类别表
+- 读取时支持列投影，并通过内存映射零拷贝读取，多个进程共享page cache
+
+pickle格式的数据表增量追加时不重写整个文件，新增行保存在{name}.parts目录中，读取时按顺序拼接。
+"""
+
+import io
+import os
+import json
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Dict, List, Optional
+
+# 列式存储格式版本
+STORAGE_VERSION = 1
+
+# 各数据表的紧凑数据类型定义（未列出的列按取值范围自动压缩）
+TRANSACTIONS_COMPACT = {
+    'customer_id': 'category',
+    'article_id': 'category',
+    'price': 'float32',
+    'sales_channel_id': 'int8',
+    'user': 'int32',
+    'item': 'int32',
+    'week': 'int8',
+    'day': 'int16',
+}
+
+USERS_COMPACT = {
+    'customer_id': 'category',
+    'FN': 'int8',
+    'Active': 'int8',
+    'age': 'float32',
+    'user': 'int32',
+}
+
+ITEMS_COMPACT = {
+    'article_id': 'category',
+    'item': 'int32',
+}
+
+COMPACT_SCHEMAS = {
+    'transactions_train': TRANSACTIONS_COMPACT,
+    'users': USERS_COMPACT,
+    'items': ITEMS_COMPACT,
+}
+
+
+def _table_dir(processed_dir: str, name: str) -> str:
+    """列式数据表目录"""
+    return os.path.join(processed_dir, f"{name}.cols")
+
+
+def _parts_dir(processed_dir: str, name: str) -> str:
+    """pickle数据表的增量追加目录"""
+    return os.path.join(processed_dir, f"{name}.parts")
+
+
+def _part_paths(processed_dir: str, name: str) -> List[str]:
+    """按追加顺序排列的增量pickle文件"""
+    parts_dir = _parts_dir(processed_dir, name)
+    if not os.path.isdir(parts_dir):
+        return []
+    return [os.path.join(parts_dir, f) for f in sorted(os.listdir(parts_dir)) if f.endswith('.pkl')]
+
+
+def _pickle_mtime(processed_dir: str, name: str) -> Optional[float]:
+    """pickle数据表（含增量文件）的最后修改时间，不存在时为None"""
+    paths = [os.path.join(processed_dir, f"{name}.pkl")] + _part_paths(processed_dir, name)
+    mtimes = [os.path.getmtime(p) for p in paths if os.path.exists(p)]
+    return max(mtimes) if mtimes else None
+
+
+def save_pickle(df: pd.DataFrame, processed_dir: str, name: str) -> None:
+    """
+    以pickle保存整个数据表（同时清除之前的增量文件）
+
+    Args:
+        df: 数据表
+        processed_dir: processed目录
+        name: 表名
+    """
+    df.to_pickle(os.path.join(processed_dir, f"{name}.pkl"))
+    for path in _part_paths(processed_dir, name):
+        os.remove(path)
+
+
+def append_pickle(df: pd.DataFrame, processed_dir: str, name: str) -> None:
+    """
+    向pickle数据表追加行：只写出新增的行，不读取和重写已有数据
+
+    Args:
+        df: 追加的数据，列需与已有数据表一致
+        processed_dir: processed目录
+        name: 表名
+    """
+    parts_dir = _parts_dir(processed_dir, name)
+    os.makedirs(parts_dir, exist_ok=True)
+    path = os.path.join(parts_dir, f"{len(_part_paths(processed_dir, name)):06d}.pkl")
+    df.to_pickle(path)
+    logger.info(f"pickle数据已追加{len(df)}行: {path}")
+
+
+def load_pickle(processed_dir: str, name: str) -> pd.DataFrame:
+    """
+    读取pickle数据表，并按顺序拼接增量追加的行
+
+    Args:
+        processed_dir: processed目录
+        name: 表名
+
+    Returns:
+        数据表
+    """
+    df = pd.read_pickle(os.path.join(processed_dir, f"{name}.pkl"))
+    parts = _part_paths(processed_dir, name)
+    if parts:
+        df = pd.concat([df] + [pd.read_pickle(p) for p in parts], ignore_index=True)
+    return df
+
+
+def _fits(values: np.ndarray, dtype: str) -> bool:
+    """判断整数列的取值范围能否放入目标类型"""
+    if len(values) == 0:
+        return True
+    info = np.iinfo(dtype)
+    return info.min <= values.min() and values.max() <= info.max
+
+
+def _compact_column(series: pd.Series, dtype: Optional[str]) -> pd.Series:
+    """
+    将一列转换为紧凑数据类型
+
+    Args:
+        series: 原始列
+        dtype: 目标类型，None时按列的类型自动选择
+
+    Returns:
+        转换后的列
+    """
+    kind = series.dtype.kind
+    if dtype == 'category' or (dtype is None and kind in 'OUS'):
+        return series.astype('category')
+    if kind in 'iu':
+        if dtype is not None and _fits(series.values, dtype):
+            return series.astype(dtype)
+        return pd.to_numeric(series, downcast='unsigned' if series.min() >= 0 else 'integer')
+    if kind == 'f':
+        return series.astype(dtype or 'float32')
+    return series
+
+
+def save_table(df: pd.DataFrame, processed_dir: str, name: str,
+               schema: Optional[Dict[str, str]] = None) -> None:
+    """
+    以紧凑列式格式保存数据表
+
+    Args:
+        df: 数据表
+        processed_dir: processed目录
+        name: 表名（如transactions_train）
+        schema: 紧凑类型定义，默认使用COMPACT_SCHEMAS中的定义
+    """
+    if schema is None:
+        schema = COMPACT_SCHEMAS.get(name, {})
+
+    table_dir = _table_dir(processed_dir, name)
+    os.makedirs(table_dir, exist_ok=True)
+
+    columns = []
+    for col in df.columns:
+        series = _compact_column(df[col], schema.get(col))
+        column_meta = {'name': col, 'dtype': str(series.dtype)}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            categories = categories.to_numpy(dtype=str if categories.dtype.kind == 'O' else None)
+            np.save(os.path.join(table_dir, f"{col}.categories.npy"), categories)
+            np.save(os.path.join(table_dir, f"{col}.npy"), series.cat.codes.to_numpy())
+            column_meta['dtype'] = 'category'
+        else:
+            np.save(os.path.join(table_dir, f"{col}.npy"), series.to_numpy())
+        columns.append(column_meta)
+
+    # 最后写入meta，meta存在即表示数据完整
+    with open(os.path.join(table_dir, 'meta.json'), 'w') as f:
+        json.dump({'version': STORAGE_VERSION, 'num_rows': len(df), 'columns': columns}, f)
+
+    logger.info(f"列式数据已保存: {table_dir}")
+
+
+def _append_npy(path: str, values: np.ndarray) -> bool:
+    """
+    在.npy文件末尾原地追加一维数据并更新头部的shape
+
+    Args:
+        path: .npy文件路径
+        values: 追加的数据（类型需与文件一致）
+
+    Returns:
+        是否追加成功（头部长度变化时返回False，需要整列重写）
+    """
+    fmt = np.lib.format
+    with open(path, 'r+b') as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = fmt.read_array_header_1_0(f)
+            write_header = fmt.write_array_header_1_0
+        else:
+            shape, fortran_order, dtype = fmt.read_array_header_2_0(f)
+            write_header = fmt.write_array_header_2_0
+        data_offset = f.tell()
+
+        header = {
+            'descr': fmt.dtype_to_descr(dtype),
+            'fortran_order': fortran_order,
+            'shape': (shape[0] + len(values),),
+        }
+        buffer = io.BytesIO()
+        write_header(buffer, header)
+        if buffer.tell() != data_offset or len(shape) != 1:
+            return False
+
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        f.seek(0)
+        f.write(buffer.getvalue())
+    return True
+
+
+def _append_categories(table_dir: str, col: str, values: pd.Series) -> np.ndarray:
+    """
+    将新类别追加到类别表末尾，并返回values对应的类别编码
+
+    Args:
+        table_dir: 列式数据表目录
+        col: 列名
+        values: 追加的原始值
+
+    Returns:
+        类别编码（缺失值为-1）
+    """
+    categories_path = os.path.join(table_dir, f"{col}.categories.npy")
+    categories = np.load(categories_path)
+    codes = pd.Index(categories).get_indexer(values)
+    unseen = (codes < 0) & values.notna().values
+    if unseen.any():
+        new_categories = pd.unique(values[unseen])
+        if categories.dtype.kind == 'U':
+            new_categories = np.asarray(new_categories, dtype=str)
+        categories = np.concatenate([categories, new_categories])
+        np.save(categories_path, categories)
+        codes = pd.Index(categories).get_indexer(values)
+    return codes
+
+
+def append_table(df: pd.DataFrame, processed_dir: str, name: str) -> None:
+    """
+    向已有列式数据表追加行
+
+    各列原地追加；新数据超出已有紧凑类型的范围时，该列整体重新压缩保存。
+    类别列的新类别追加在类别表末尾，已有编码不变。
+
+    Args:
+        df: 追加的数据，列需与已有数据表一致
+        processed_dir: processed目录
+        name: 表名
+    """
+    table_dir = _table_dir(processed_dir, name)
+    with open(os.path.join(table_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    names = [c['name'] for c in meta['columns']]
+    if list(df.columns) != names:
+        raise ValueError(f"追加数据的列与{name}不一致: {list(df.columns)} != {names}")
+
+    for column_meta in meta['columns']:
+        col = column_meta['name']
+        path = os.path.join(table_dir, f"{col}.npy")
+        if column_meta['dtype'] == 'category':
+            values = _append_categories(table_dir, col, df[col])
+        else:
+            values = df[col].to_numpy()
+
+        dtype = np.load(path, mmap_mode='r').dtype
+        if dtype.kind in 'iu' and not _fits(values, str(dtype)):
+            # 超出已有类型范围，整列重新压缩
+            merged = pd.Series(np.concatenate([np.load(path), values]))
+            np.save(path, _compact_column(merged, None).to_numpy())
+        elif not _append_npy(path, values.astype(dtype)):
+            np.save(path, np.concatenate([np.load(path), values.astype(dtype)]))
+
+    meta['num_rows'] += len(df)
+    with open(os.path.join(table_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    logger.info(f"列式数据已追加{len(df)}行: {table_dir}")
+
+
+def has_columnar_table(processed_dir: str, name: str) -> bool:
+    """
+    判断列式数据表是否存在且不早于同名pickle
+
+    Args:
+        processed_dir: processed目录
+        name: 表名
+
+    Returns:
+        是否可以使用列式数据
+    """
+    meta_path = os.path.join(_table_dir(processed_dir, name), 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    pickle_mtime = _pickle_mtime(processed_dir, name)
+    if pickle_mtime is not None and pickle_mtime > os.path.getmtime(meta_path):
+        return False
+    return True
+
+
+def table_mtime(processed_dir: str, name: str) -> float:
+    """
+    数据表的最后修改时间（pickle和列式数据中较新的一个），用于判断派生产物是否过期
+
+    Args:
+        processed_dir: processed目录
+        name: 表名
+
+    Returns:
+        修改时间戳，数据表不存在时为0
+    """
+    meta_path = os.path.join(_table_dir(processed_dir, name), 'meta.json')
+    mtimes = [_pickle_mtime(processed_dir, name)]
+    if os.path.exists(meta_path):
+        mtimes.append(os.path.getmtime(meta_path))
+    return max([m for m in mtimes if m is not None], default=0.0)
+
+
+def table_columns(processed_dir: str, name: str) -> List[str]:
+    """
+    获取数据表的列名（不读取数据）
+
+    Args:
+        processed_dir: processed目录
+        name: 表名
+
+    Returns:
+        列名列表
+    """
+    if has_columnar_table(processed_dir, name):
+        with open(os.path.join(_table_dir(processed_dir, name), 'meta.json')) as f:
+            return [c['name'] for c in json.load(f)['columns']]
+    return list(pd.read_pickle(os.path.join(processed_dir, f"{name}.pkl")).columns)
+
+
+def load_table(processed_dir: str, name: str, columns: Optional[List[str]] = None,
+               mmap: bool = True) -> pd.DataFrame:
+    """
+    读取processed目录下的数据表
+
+    优先读取列式数据（按列投影、内存映射零拷贝），不存在时回退到pickle（拼接增量追加的行）。
+    内存映射读取得到的列是只读的，需要修改时请先copy。
+
+    Args:
+        processed_dir: processed目录
+        name: 表名（transactions_train / users / items）
+        columns: 需要读取的列，None表示全部
+        mmap: 是否使用内存映射
+
+    Returns:
+        数据表
+    """
+    if not has_columnar_table(processed_dir, name):
+        df = load_pickle(processed_dir, name)
+        return df if columns is None else df[columns]
+
+    table_dir = _table_dir(processed_dir, name)
+    with open(os.path.join(table_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    column_meta = {c['name']: c for c in meta['columns']}
+    if columns is None:
+        columns = [c['name'] for c in meta['columns']]
+
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for col in columns:
+        if col not in column_meta:
+            raise KeyError(f"列不存在: {name}.{col}")
+        values = np.load(os.path.join(table_dir, f"{col}.npy"), mmap_mode=mmap_mode)
+        if column_meta[col]['dtype'] == 'category':
+            categories = np.load(os.path.join(table_dir, f"{col}.categories.npy"))
+            values = pd.Categorical.from_codes(values, categories=categories)
+        data[col] = values
+
+    return pd.DataFrame(data, copy=False)
@@ -0,0 +1,203 @@
+"""
+数据缓存模块
+
+进程内共享的数据仓库，供各个流程阶段复用：
+- 基础数据表（transactions_train / users / items）懒加载，整个进程只读取一次
+- 交易的week/day按最新交易日期重新计算：增量追加的交易在存储中相对固定的锚定日期（为负数），
+  读取后week 0始终为最近7天
+- 交易按时间分区建立索引，week/day窗口为零拷贝切片
+- 其他派生视图按key记忆化，并按内存占用做LRU淘汰，总大小不超过上限
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from logzero import logger
+from typing import Callable, Dict, Hashable, List, Optional
+
+from data.storage import load_table
+from data.transaction_index import TransactionIndex
+
+# 交易索引中保留的列
+INDEX_COLUMNS = ['user', 'item', 'week', 'day', 'price', 'sales_channel_id']
+
+
+def rebase_time_columns(transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    将week/day改为相对最新交易日期（最新交易日期的day为0，week = day // 7）
+
+    全量预处理使用默认锚定日期时day的最小值已经是0，原样返回，不复制内存映射的列。
+
+    Args:
+        transactions: 交易数据，需包含day列
+
+    Returns:
+        week/day重新计算后的交易数据
+    """
+    if len(transactions) == 0 or 'day' not in transactions.columns:
+        return transactions
+    day = transactions['day'].values
+    shift = int(day.min())
+    if shift == 0:
+        return transactions
+
+    logger.info(f"交易week/day按最新交易日期重新计算（偏移{-shift}天）")
+    day = day.astype(np.int32) - shift
+    dtype = transactions['day'].dtype
+    if np.issubdtype(dtype, np.integer) and day.max() <= np.iinfo(dtype).max:
+        day = day.astype(dtype)
+    transactions = transactions.assign(day=day)
+    if 'week' in transactions.columns:
+        transactions['week'] = (day // 7).astype(transactions['week'].dtype)
+    return transactions
+
+
+class DataStore:
+    """数据仓库"""
+
+    def __init__(self, processed_dir: str, max_cache_bytes: int = 4 * 1024 ** 3, mmap: bool = True):
+        """
+        初始化数据仓库
+
+        Args:
+            processed_dir: processed目录
+            max_cache_bytes: 派生视图缓存的内存上限（字节）
+            mmap: 基础数据表是否使用内存映射读取
+        """
+        self.processed_dir = processed_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.mmap = mmap
+        self._tables: Dict[str, pd.DataFrame] = {}
+        self._transaction_index: Optional[TransactionIndex] = None
+        self._views: 'OrderedDict[Hashable, pd.DataFrame]' = OrderedDict()
+        self._view_sizes: Dict[Hashable, int] = {}
+        self._cache_bytes = 0
+
+    def table(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        获取基础数据表（首次访问时读取，之后常驻）
+
+        Args:
+            name: 表名（transactions_train / users / items）
+            columns: 需要的列，None表示全部
+
+        Returns:
+            数据表
+        """
+        if name not in self._tables:
+            logger.info(f"读取数据表: {name}")
+            df = load_table(self.processed_dir, name, mmap=self.mmap)
+            if name == 'transactions_train':
+                df = rebase_time_columns(df)
+            self._tables[name] = df
+        df = self._tables[name]
+        return df if columns is None else df[columns]
+
+    @property
+    def n_users(self) -> int:
+        """用户数"""
+        return len(self.table('users'))
+
+    @property
+    def n_items(self) -> int:
+        """商品数"""
+        return len(self.table('items'))
+
+    def transaction_index(self) -> TransactionIndex:
+        """交易的时间分区索引（首次访问时构建）"""
+        if self._transaction_index is None:
+            transactions = self.table('transactions_train')
+            columns = [c for c in INDEX_COLUMNS if c in transactions.columns]
+            self._transaction_index = TransactionIndex(transactions, columns)
+        return self._transaction_index
+
+    def view(self, key: Hashable, builder: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        获取记忆化的派生视图
+
+        Args:
+            key: 视图key
+            builder: 缓存未命中时构建视图的函数
+
+        Returns:
+            派生视图
+        """
+        if key in self._views:
+            self._views.move_to_end(key)
+            return self._views[key]
+
+        df = builder()
+        size = int(df.memory_usage(index=True).sum())
+        if size > self.max_cache_bytes:
+            # 单个视图超过上限时不缓存
+            return df
+
+        while self._cache_bytes + size > self.max_cache_bytes:
+            self._evict()
+        self._views[key] = df
+        self._view_sizes[key] = size
+        self._cache_bytes += size
+        return df
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的派生视图"""
+        key, _ = self._views.popitem(last=False)
+        self._cache_bytes -= self._view_sizes.pop(key)
+        logger.debug(f"淘汰缓存视图: {key}")
+
+    def transactions_since(self, week: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        获取 week >= week 的交易（交易索引上的零拷贝切片）
+
+        Args:
+            week: 起始周
+            columns: 需要的列，None表示索引中的全部列
+
+        Returns:
+            交易数据
+        """
+        return self.transaction_index().since(week, columns)
+
+    def transactions_between(self, week_start: int, num_weeks: int,
+                             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        获取 week_start <= week < week_start + num_weeks 的交易（交易索引上的零拷贝切片）
+
+        Args:
+            week_start: 起始周
+            num_weeks: 周数
+            columns: 需要的列，None表示索引中的全部列
+
+        Returns:
+            交易数据
+        """
+        return self.transaction_index().between(week_start, num_weeks, columns)
+
+    def clear(self) -> None:
+        """清空全部缓存"""
+        self._tables.clear()
+        self._transaction_index = None
+        self._views.clear()
+        self._view_sizes.clear()
+        self._cache_bytes = 0
+
+
+_stores: Dict[str, DataStore] = {}
+
+
+def get_data_store(processed_dir: str, **kwargs) -> DataStore:
+    """
+    获取进程内共享的数据仓库（同一processed目录只创建一次）
+
+    Args:
+        processed_dir: processed目录
+        **kwargs: 首次创建时传给DataStore的参数
+
+    Returns:
+        数据仓库
+    """
+    key = os.path.abspath(processed_dir)
+    if key not in _stores:
+        _stores[key] = DataStore(processed_dir, **kwargs)
+    return _stores[key]
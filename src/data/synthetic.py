@@ -0,0 +1,316 @@
+"""
+合成数据生成模块
+
+生成与Kaggle原始数据格式一致的articles.csv / customers.csv / transactions_train.csv，
+用于在没有真实数据时运行和压测各阶段：
+- 列与数据类型与ARTICLES_ORIGINAL / CUSTOMERS_ORIGINAL / TRANSACTIONS_ORIGINAL一致
+- 规模预设从tiny到full（约10.5万商品、137万用户、3100万交易）
+- 商品热度服从幂律，并随上架时间衰减；用户活跃度为重尾分布；
+  一次购物包含多件商品，用户偏好固定的商品大类，并有一定比例重购最近买过的商品
+- 给定种子时结果完全确定；交易按时间分块生成并追加写入，内存只与块大小有关
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, Iterator
+
+from data.preprocessing import ARTICLES_ORIGINAL, CUSTOMERS_ORIGINAL
+
+# 规模预设：商品数、用户数、交易数、天数
+SCALE_PRESETS = {
+    'tiny': {'n_articles': 2_000, 'n_customers': 10_000, 'n_transactions': 200_000, 'n_days': 180},
+    'small': {'n_articles': 10_000, 'n_customers': 100_000, 'n_transactions': 2_000_000, 'n_days': 365},
+    'medium': {'n_articles': 50_000, 'n_customers': 500_000, 'n_transactions': 10_000_000, 'n_days': 734},
+    'full': {'n_articles': 105_542, 'n_customers': 1_371_980, 'n_transactions': 31_788_324, 'n_days': 734},
+}
+
+# 与真实数据一致的最后交易日期
+END_DATE = '2020-09-22'
+
+# 商品属性的取值个数（与真实数据的量级一致）
+ATTRIBUTE_CARDINALITY = {
+    'product_type_no': 131,
+    'product_group_name': 19,
+    'graphical_appearance_no': 30,
+    'colour_group_code': 50,
+    'perceived_colour_value_id': 8,
+    'perceived_colour_master_id': 20,
+    'department_no': 299,
+    'index_code': 10,
+    'index_group_no': 5,
+    'section_no': 56,
+    'garment_group_no': 21,
+}
+
+
+def _hex_ids(rng: np.random.Generator, n: int, num_bytes: int = 32) -> np.ndarray:
+    """n个不重复的十六进制ID（与真实customer_id / postal_code的格式一致）"""
+    ids = np.frombuffer(rng.bytes(n * num_bytes), dtype=np.uint8).reshape(n, num_bytes)
+    table = np.array([f'{i:02x}' for i in range(256)], dtype=object)
+    return table[ids].sum(axis=1)
+
+
+def _power_law_weights(rng: np.random.Generator, n: int, exponent: float) -> np.ndarray:
+    """幂律权重：随机排列的 rank^-exponent"""
+    return rng.permutation((np.arange(n) + 1.0) ** -exponent)
+
+
+class SyntheticDataGenerator:
+    """H&M格式的合成数据生成器"""
+
+    def __init__(self, data_dir: str, preset: str = 'small', seed: int = 42,
+                 repurchase_rate: float = 0.15, chunk_days: int = 28, **overrides):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径（写入其中的raw目录）
+            preset: 规模预设（tiny / small / medium / full）
+            seed: 随机种子
+            repurchase_rate: 交易中重购用户最近买过的商品的比例
+            chunk_days: 交易每次生成并写出的天数
+            **overrides: 覆盖预设中的n_articles / n_customers / n_transactions / n_days
+        """
+        if preset not in SCALE_PRESETS:
+            raise ValueError(f"不支持的规模预设: {preset}")
+        self.data_dir = data_dir
+        self.raw_dir = os.path.join(data_dir, 'raw')
+        self.scale = {**SCALE_PRESETS[preset], **overrides}
+        self.seed = seed
+        self.repurchase_rate = repurchase_rate
+        self.chunk_days = chunk_days
+
+    def _rng(self, stream: int) -> np.random.Generator:
+        """各部分独立的随机数流，修改一部分的生成逻辑不影响其余部分"""
+        return np.random.default_rng([self.seed, stream])
+
+    def articles(self) -> pd.DataFrame:
+        """
+        商品表：同一product_code的各个颜色款式共享类别属性
+
+        Returns:
+            与ARTICLES_ORIGINAL列一致的DataFrame，另有内部使用的price和index_group列
+        """
+        rng = self._rng(0)
+        n = self.scale['n_articles']
+        n_products = max(n * 10 // 22, 1)
+        product = np.sort(rng.integers(0, n_products, n))
+        variant = np.arange(n) - np.searchsorted(product, product)
+        product_code = 108775 + product * 17
+
+        # 类别层级：product_type -> product_group，department -> section -> index -> index_group
+        c = ATTRIBUTE_CARDINALITY
+        type_group = rng.integers(0, c['product_group_name'], c['product_type_no'])
+        department_section = rng.integers(0, c['section_no'], c['department_no'])
+        section_index = rng.integers(0, c['index_code'], c['section_no'])
+        index_group = np.arange(c['index_code']) % c['index_group_no']
+        department_garment = rng.integers(0, c['garment_group_no'], c['department_no'])
+        colour_value = rng.integers(0, c['perceived_colour_value_id'], c['colour_group_code'])
+        colour_master = rng.integers(0, c['perceived_colour_master_id'], c['colour_group_code'])
+
+        def draw(cardinality: int, size: int, exponent: float = 1.0) -> np.ndarray:
+            weights = _power_law_weights(rng, cardinality, exponent)
+            return rng.choice(cardinality, size, p=weights / weights.sum())
+
+        product_type = draw(c['product_type_no'], n_products)[product]
+        department = draw(c['department_no'], n_products)[product]
+        appearance = draw(c['graphical_appearance_no'], n_products, 1.5)[product]
+        colour = draw(c['colour_group_code'], n, 1.2)
+        section = department_section[department]
+        index = section_index[section]
+
+        columns = {
+            'article_id': np.array([f'0{p}{v:03d}' for p, v in zip(product_code, variant)], dtype=object),
+            'product_code': product_code,
+            'product_type_no': 250 + product_type,
+            'product_group_name': type_group[product_type],
+            'graphical_appearance_no': 1010001 + appearance,
+            'colour_group_code': 1 + colour,
+            'perceived_colour_value_id': colour_value[colour],
+            'perceived_colour_master_id': colour_master[colour],
+            'department_no': 1201 + department * 3,
+            'index_code': np.array(list('ABCDEFGHIJ'), dtype=object)[index],
+            'index_group_no': 1 + index_group[index],
+            'section_no': 2 + section,
+            'garment_group_no': 1001 + department_garment[department],
+        }
+        df = pd.DataFrame(columns)
+        df['prod_name'] = 'Product ' + df['product_code'].astype(str)
+        df['product_type_name'] = 'Type ' + df['product_type_no'].astype(str)
+        df['product_group_name'] = 'Group ' + df['product_group_name'].astype(str)
+        df['graphical_appearance_name'] = 'Appearance ' + df['graphical_appearance_no'].astype(str)
+        df['colour_group_name'] = 'Colour ' + df['colour_group_code'].astype(str)
+        df['perceived_colour_value_name'] = 'Value ' + df['perceived_colour_value_id'].astype(str)
+        df['perceived_colour_master_name'] = 'Master ' + df['perceived_colour_master_id'].astype(str)
+        df['department_name'] = 'Department ' + df['department_no'].astype(str)
+        df['index_name'] = 'Index ' + df['index_code']
+        df['index_group_name'] = 'Index group ' + df['index_group_no'].astype(str)
+        df['section_name'] = 'Section ' + df['section_no'].astype(str)
+        df['garment_group_name'] = 'Garment ' + df['garment_group_no'].astype(str)
+        df['detail_desc'] = np.where(rng.random(n) < 0.004, None,
+                                     df['prod_name'] + ' in ' + df['colour_group_name'])
+
+        # 内部使用：同款商品价格相近
+        product_price = np.clip(rng.lognormal(np.log(0.025), 0.6, n_products), 0.001, 0.5)
+        df['price'] = product_price[product] * rng.uniform(0.9, 1.1, n)
+        df['index_group'] = index_group[index]
+        return df
+
+    def customers(self) -> pd.DataFrame:
+        """
+        用户表
+
+        Returns:
+            与CUSTOMERS_ORIGINAL列一致的DataFrame
+        """
+        rng = self._rng(1)
+        n = self.scale['n_customers']
+        fn = rng.random(n) < 0.35
+        active = fn & (rng.random(n) < 0.97)
+        status = rng.choice(np.array(['ACTIVE', 'PRE-CREATE', 'LEFT CLUB', None], dtype=object), n,
+                            p=[0.927, 0.067, 0.001, 0.005])
+        news = rng.choice(np.array(['NONE', 'Regularly', 'Monthly', None], dtype=object), n,
+                          p=[0.64, 0.348, 0.001, 0.011])
+        age = np.where(rng.random(n) < 0.6, rng.normal(26, 5, n), rng.normal(50, 10, n))
+        age = np.clip(np.round(age), 16, 99)
+        postal_codes = _hex_ids(rng, max(n // 4, 1))
+        return pd.DataFrame({
+            'customer_id': _hex_ids(rng, n),
+            'FN': np.where(fn, 1.0, np.nan),
+            'Active': np.where(active, 1.0, np.nan),
+            'club_member_status': status,
+            'fashion_news_frequency': news,
+            'age': np.where(rng.random(n) < 0.012, np.nan, age),
+            'postal_code': postal_codes[rng.zipf(1.5, n) % len(postal_codes)],
+        })
+
+    def transactions(self, articles: pd.DataFrame, customers: pd.DataFrame) -> Iterator[pd.DataFrame]:
+        """
+        按时间分块生成交易
+
+        每天的购物次数带有周内和季节波动；每次购物属于一个用户（活跃度为重尾分布），包含若干件商品。
+        商品按当天的热度抽取（上架后热度按商品各自的寿命指数衰减），多数时候来自用户偏好的大类；
+        有repurchase_rate的概率改为该用户最近买过的商品。
+
+        Args:
+            articles: articles()的结果
+            customers: customers()的结果
+
+        Yields:
+            与TRANSACTIONS_ORIGINAL列一致、另有t_dat列的DataFrame，按日期排列
+        """
+        rng = self._rng(2)
+        n_articles, n_customers = len(articles), len(customers)
+        n_days = self.scale['n_days']
+        dates = pd.date_range(end=END_DATE, periods=n_days).strftime('%Y-%m-%d').values
+
+        # 商品：上架日、寿命、基础热度
+        launch = rng.integers(-120, n_days, n_articles)
+        lifetime = rng.lognormal(np.log(60), 0.7, n_articles)
+        popularity = _power_law_weights(rng, n_articles, 0.9)
+        index_group = articles['index_group'].values
+        n_groups = int(index_group.max()) + 1
+        base_price = articles['price'].values
+
+        # 用户：活跃度、偏好的大类、线上购物倾向
+        activity = rng.lognormal(0, 1.2, n_customers)
+        activity_cumsum = np.cumsum(activity)
+        preferred_group = rng.integers(0, n_groups, n_customers)
+        online = rng.beta(2, 1, n_customers)
+        last_article = np.full(n_customers, -1, dtype=np.int64)
+
+        # 每天的购物次数：交易数 / 平均每次购物的件数
+        basket_size_p = 0.4
+        day = np.arange(n_days)
+        day_weight = (1 + 0.25 * np.sin(2 * np.pi * day / 7)) * (1 + 0.3 * np.sin(2 * np.pi * (day + 100) / 365))
+        expected_baskets = self.scale['n_transactions'] * basket_size_p * day_weight / day_weight.sum()
+        baskets_per_day = rng.poisson(expected_baskets)
+
+        for chunk_start in range(0, n_days, self.chunk_days):
+            parts = []
+            for d in range(chunk_start, min(chunk_start + self.chunk_days, n_days)):
+                age_days = d - launch
+                weight = np.where(age_days >= 0, popularity * np.exp(-np.maximum(age_days, 0) / lifetime), 0.0)
+
+                n_baskets = baskets_per_day[d]
+                basket_user = np.searchsorted(activity_cumsum, rng.random(n_baskets) * activity_cumsum[-1])
+                basket_channel = np.where(rng.random(n_baskets) < online[basket_user], 2, 1)
+                sizes = rng.geometric(basket_size_p, n_baskets)
+                user = np.repeat(basket_user, sizes)
+                channel = np.repeat(basket_channel, sizes)
+                n = len(user)
+
+                # 偏好大类内按热度抽取，其余在全部商品中抽取
+                article = np.empty(n, dtype=np.int64)
+                in_group = rng.random(n) < 0.7
+                overall = np.cumsum(weight)
+                rest = ~in_group
+                article[rest] = np.searchsorted(overall, rng.random(int(rest.sum())) * overall[-1], side='right')
+                for g in range(n_groups):
+                    mask = in_group & (preferred_group[user] == g)
+                    if not mask.any():
+                        continue
+                    cumsum = np.cumsum(np.where(index_group == g, weight, 0.0))
+                    cumsum = cumsum if cumsum[-1] > 0 else overall
+                    article[mask] = np.searchsorted(cumsum, rng.random(int(mask.sum())) * cumsum[-1], side='right')
+                article = np.minimum(article, n_articles - 1)
+
+                # 重购：改为该用户在今天之前最近买过的商品
+                repurchase = (rng.random(n) < self.repurchase_rate) & (last_article[user] >= 0)
+                article[repurchase] = last_article[user[repurchase]]
+                last_article[user] = article
+
+                discount = np.where(rng.random(n) < 0.3, rng.uniform(0.5, 0.9, n), 1.0)
+                order = np.argsort(user, kind='stable')
+                parts.append(pd.DataFrame({
+                    't_dat': dates[d],
+                    'customer_id': customers['customer_id'].values[user[order]],
+                    'article_id': articles['article_id'].values[article[order]],
+                    'price': np.round(base_price[article[order]] * discount[order], 6),
+                    'sales_channel_id': channel[order],
+                }))
+            yield pd.concat(parts, ignore_index=True)
+
+    def generate(self) -> Dict[str, Any]:
+        """
+        生成并写出三个原始数据文件
+
+        Returns:
+            实际生成的规模（n_articles / n_customers / n_transactions / n_days）
+        """
+        os.makedirs(self.raw_dir, exist_ok=True)
+        logger.info(f"生成合成数据: {self.scale} (seed: {self.seed})")
+
+        articles = self.articles()
+        articles[list(ARTICLES_ORIGINAL)].to_csv(os.path.join(self.raw_dir, 'articles.csv'), index=False)
+        customers = self.customers()
+        customers[list(CUSTOMERS_ORIGINAL)].to_csv(os.path.join(self.raw_dir, 'customers.csv'), index=False)
+
+        path = os.path.join(self.raw_dir, 'transactions_train.csv')
+        n_transactions = 0
+        for i, chunk in enumerate(self.transactions(articles, customers)):
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            n_transactions += len(chunk)
+            logger.info(f"交易已写出: {chunk['t_dat'].iloc[-1]} ({n_transactions}行)")
+
+        logger.info(f"合成数据已保存: {self.raw_dir}")
+        return {'n_articles': len(articles), 'n_customers': len(customers),
+                'n_transactions': n_transactions, 'n_days': self.scale['n_days']}
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='生成H&M格式的合成数据')
+    parser.add_argument('--data_dir', type=str, default='data', help='数据目录路径（写入raw目录）')
+    parser.add_argument('--preset', type=str, choices=list(SCALE_PRESETS), default='small', help='规模预设')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    SyntheticDataGenerator(args.data_dir, args.preset, args.seed).generate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+交易时间分区索引模块
+
+交易按(day, user)排序后按列保存，并记录每周/每天的起始偏移：
+- 任意周/天的时间窗口都是一段连续的行，O(1)零拷贝切片
+- 窗口内按用户分组的偏移表按需构建并缓存，用于按用户查找交易
+"""
+
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Dict, List, Optional, Tuple
+
+
+def _run_starts(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """已排序数组中每段相同值的(值, 起始下标)"""
+    if len(values) == 0:
+        return values[:0], np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    return values[starts], starts
+
+
+class UserWindow:
+    """时间窗口内按用户排序的交易"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        """
+        初始化
+
+        Args:
+            columns: 窗口内的交易列（会按user稳定排序）
+        """
+        order = np.argsort(columns['user'], kind='stable')
+        self.columns = {k: v[order] for k, v in columns.items()}
+        user = self.columns['user']
+        self.users, starts = _run_starts(user)
+        self.offsets = np.append(starts, len(user))
+
+    def frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """按用户排序的窗口交易（零拷贝）"""
+        columns = columns or list(self.columns)
+        return pd.DataFrame({c: self.columns[c] for c in columns}, copy=False)
+
+    def user_range(self, user: int) -> Tuple[int, int]:
+        """用户的交易在frame中的行区间[start, end)，没有交易时start == end"""
+        i = np.searchsorted(self.users, user)
+        if i == len(self.users) or self.users[i] != user:
+            return 0, 0
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def users_range(self, first_user: int, last_user: int) -> Tuple[int, int]:
+        """用户ID在[first_user, last_user]内的交易在frame中的行区间"""
+        lo = np.searchsorted(self.users, first_user, side='left')
+        hi = np.searchsorted(self.users, last_user, side='right')
+        return int(self.offsets[lo]), int(self.offsets[hi])
+
+
+class TransactionIndex:
+    """按时间分区的交易索引"""
+
+    def __init__(self, transactions: pd.DataFrame, columns: Optional[List[str]] = None):
+        """
+        按(day, user)排序构建索引
+
+        week由day决定（week = day // 7），因此按day排序后week也有序。
+
+        Args:
+            transactions: 交易数据，需包含week, day, user列
+            columns: 需要保留的列，默认全部
+        """
+        columns = columns or list(transactions.columns)
+        for c in ['user', 'week', 'day']:
+            if c not in columns:
+                columns = columns + [c]
+
+        order = np.lexsort((transactions['user'].values, transactions['day'].values))
+        self.columns = {c: transactions[c].values[order] for c in columns}
+        self.num_rows = len(order)
+        del order
+
+        week = self.columns['week']
+        if np.any(week[1:] < week[:-1]):
+            raise ValueError("week与day的顺序不一致，无法按day排序建立周索引")
+
+        # 每个week/day的起始行
+        self.weeks, self.week_offsets = _run_starts(week)
+        self.days, self.day_offsets = _run_starts(self.columns['day'])
+
+        # 只缓存最近一次使用的按用户分组窗口，控制内存
+        self._user_window_key: Optional[Tuple[int, int]] = None
+        self._user_window: Optional[UserWindow] = None
+        logger.info(f"交易索引已构建: {self.num_rows}行, {len(self.weeks)}周")
+
+    def _week_position(self, week: int) -> int:
+        """第一个week >= week的行"""
+        i = np.searchsorted(self.weeks, week, side='left')
+        return self.num_rows if i == len(self.weeks) else int(self.week_offsets[i])
+
+    def _day_position(self, day: int) -> int:
+        """第一个day >= day的行"""
+        i = np.searchsorted(self.days, day, side='left')
+        return self.num_rows if i == len(self.days) else int(self.day_offsets[i])
+
+    def week_range(self, week_start: int, num_weeks: Optional[int] = None) -> Tuple[int, int]:
+        """
+        week_start <= week < week_start + num_weeks 的行区间（num_weeks为None表示不设上限）
+
+        Returns:
+            [start, end)
+        """
+        start = self._week_position(week_start)
+        end = self.num_rows if num_weeks is None else self._week_position(week_start + num_weeks)
+        return start, end
+
+    def day_range(self, day_start: int, num_days: Optional[int] = None) -> Tuple[int, int]:
+        """
+        day_start <= day < day_start + num_days 的行区间（num_days为None表示不设上限）
+
+        Returns:
+            [start, end)
+        """
+        start = self._day_position(day_start)
+        end = self.num_rows if num_days is None else self._day_position(day_start + num_days)
+        return start, end
+
+    def slice(self, start: int, end: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        行区间[start, end)的交易（零拷贝）
+
+        Args:
+            start: 起始行
+            end: 结束行
+            columns: 需要的列，默认全部
+
+        Returns:
+            交易数据
+        """
+        columns = columns or list(self.columns)
+        return pd.DataFrame({c: self.columns[c][start:end] for c in columns}, copy=False)
+
+    def since(self, week: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """week >= week 的交易（零拷贝）"""
+        return self.slice(*self.week_range(week), columns)
+
+    def between(self, week_start: int, num_weeks: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """week_start <= week < week_start + num_weeks 的交易（零拷贝）"""
+        return self.slice(*self.week_range(week_start, num_weeks), columns)
+
+    def days_between(self, day_start: int, num_days: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """day_start <= day < day_start + num_days 的交易（零拷贝）"""
+        return self.slice(*self.day_range(day_start, num_days), columns)
+
+    def by_user(self, week_start: int, num_weeks: Optional[int] = None) -> UserWindow:
+        """
+        时间窗口内按用户分组的交易（缓存最近一次使用的窗口）
+
+        Args:
+            week_start: 开始周
+            num_weeks: 周数，None表示不设上限
+
+        Returns:
+            UserWindow
+        """
+        key = self.week_range(week_start, num_weeks)
+        if key != self._user_window_key:
+            start, end = key
+            self._user_window = UserWindow({c: v[start:end] for c, v in self.columns.items()})
+            self._user_window_key = key
+        return self._user_window
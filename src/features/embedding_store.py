@@ -0,0 +1,217 @@
+"""
+嵌入存储模块
+
+将LightFM模型的用户/商品表示导出为连续的float32数组，按稠密ID索引：
+- 每个(模型类型, 窗口, 维度)导出一次，保存为.npy文件
+- 读取时使用内存映射，不需要反序列化模型，多个进程共享page cache
+- 按ID数组批量gather，特征拼接和向量召回直接读取
+"""
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, Optional, Tuple
+
+# 每组嵌入保存的数组
+EMBEDDING_ARRAYS = ('user_embeddings', 'user_biases', 'item_embeddings', 'item_biases')
+
+
+def lightfm_feature_dim(config: Optional[Dict[str, Any]]) -> int:
+    """
+    排序特征和向量召回使用的LightFM维度
+
+    lightfm.feature_dim优先；未设置时为embedding_dim，embedding_dim为列表时取第一个。
+
+    Args:
+        config: 配置
+
+    Returns:
+        嵌入维度
+    """
+    lfm_config = (config or {}).get('lightfm') or {}
+    dim = lfm_config.get('feature_dim')
+    if dim is None:
+        dims = lfm_config.get('embedding_dim', 16)
+        dim = dims[0] if isinstance(dims, (list, tuple)) else dims
+    return int(dim)
+
+
+class Embeddings:
+    """一个LightFM模型的用户/商品表示"""
+
+    def __init__(
+        self,
+        user_embeddings: np.ndarray,
+        user_biases: np.ndarray,
+        item_embeddings: np.ndarray,
+        item_biases: np.ndarray
+    ):
+        """
+        初始化
+
+        Args:
+            user_embeddings: 用户表示 (n_user, dim)
+            user_biases: 用户偏置 (n_user,)
+            item_embeddings: 商品表示 (n_item, dim)
+            item_biases: 商品偏置 (n_item,)
+        """
+        self.user_embeddings = user_embeddings
+        self.user_biases = user_biases
+        self.item_embeddings = item_embeddings
+        self.item_biases = item_biases
+
+    @property
+    def dim(self) -> int:
+        return self.user_embeddings.shape[1]
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_biases)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_biases)
+
+    @staticmethod
+    def _gather(embeddings: np.ndarray, biases: np.ndarray, ids: Optional[np.ndarray]) -> np.ndarray:
+        """按ID取出[表示, 偏置]，返回 (n, dim + 1) 的float32数组"""
+        if ids is None:
+            ids = np.arange(len(biases))
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.empty((len(ids), embeddings.shape[1] + 1), dtype=np.float32)
+        np.take(embeddings, ids, axis=0, out=out[:, :-1])
+        np.take(biases, ids, out=out[:, -1])
+        return out
+
+    def users(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        按用户ID取出[表示, 偏置]
+
+        Args:
+            ids: 用户ID数组，None表示全部用户
+
+        Returns:
+            (n, dim + 1) 的float32数组，最后一列为偏置
+        """
+        return self._gather(self.user_embeddings, self.user_biases, ids)
+
+    def items(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        按商品ID取出[表示, 偏置]
+
+        Args:
+            ids: 商品ID数组，None表示全部商品
+
+        Returns:
+            (n, dim + 1) 的float32数组，最后一列为偏置
+        """
+        return self._gather(self.item_embeddings, self.item_biases, ids)
+
+    def user_frame(self, ids: Optional[np.ndarray] = None, prefix: str = 'user_rep_') -> pd.DataFrame:
+        """
+        用户表示的DataFrame（列为user, {prefix}0..{prefix}dim，最后一列为偏置）
+
+        Args:
+            ids: 用户ID数组，None表示全部用户
+            prefix: 表示列名前缀
+
+        Returns:
+            DataFrame
+        """
+        values = self.users(ids)
+        df = pd.DataFrame(values, columns=[f"{prefix}{i}" for i in range(values.shape[1])], copy=False)
+        df.insert(0, 'user', np.arange(self.n_users) if ids is None else np.asarray(ids))
+        return df
+
+
+class EmbeddingStore:
+    """LightFM嵌入存储"""
+
+    def __init__(self, lfm_dir: str):
+        """
+        初始化
+
+        Args:
+            lfm_dir: LightFM模型目录（嵌入保存在其下的子目录）
+        """
+        self.lfm_dir = lfm_dir
+        self._cache: Dict[Tuple[str, int, int], Embeddings] = {}
+
+    def model_path(self, week: int, dim: int, model_type: str = 'i_i') -> str:
+        """模型文件路径"""
+        return os.path.join(self.lfm_dir, f"lfm_{model_type}_week{week}_dim{dim}_model.pkl")
+
+    def embedding_dir(self, week: int, dim: int, model_type: str = 'i_i') -> str:
+        """嵌入目录"""
+        return os.path.join(self.lfm_dir, f"emb_{model_type}_week{week}_dim{dim}")
+
+    def is_up_to_date(self, week: int, dim: int, model_type: str = 'i_i') -> bool:
+        """嵌入是否已导出且不早于模型文件"""
+        emb_dir = self.embedding_dir(week, dim, model_type)
+        paths = [os.path.join(emb_dir, f"{name}.npy") for name in EMBEDDING_ARRAYS]
+        if not all(os.path.exists(p) for p in paths):
+            return False
+        model_path = self.model_path(week, dim, model_type)
+        if not os.path.exists(model_path):
+            return True
+        return min(os.path.getmtime(p) for p in paths) >= os.path.getmtime(model_path)
+
+    def export(self, model, week: int, dim: int, model_type: str = 'i_i') -> None:
+        """
+        导出模型的用户/商品表示
+
+        Args:
+            model: LightFM模型
+            week: 时间窗口
+            dim: 嵌入维度
+            model_type: 模型类型
+        """
+        user_biases, user_embeddings = model.get_user_representations(None)
+        item_biases, item_embeddings = model.get_item_representations(None)
+        arrays = {
+            'user_embeddings': user_embeddings,
+            'user_biases': user_biases,
+            'item_embeddings': item_embeddings,
+            'item_biases': item_biases,
+        }
+
+        emb_dir = self.embedding_dir(week, dim, model_type)
+        os.makedirs(emb_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(emb_dir, f"{name}.npy"), np.ascontiguousarray(array, dtype=np.float32))
+        self._cache.pop((model_type, week, dim), None)
+        logger.info(f"嵌入已导出: {emb_dir}")
+
+    def export_model(self, week: int, dim: int, model_type: str = 'i_i') -> None:
+        """从模型文件导出嵌入（已是最新时跳过）"""
+        if self.is_up_to_date(week, dim, model_type):
+            return
+        with open(self.model_path(week, dim, model_type), 'rb') as f:
+            model = pickle.load(f)
+        self.export(model, week, dim, model_type)
+
+    def load(self, week: int, dim: int, model_type: str = 'i_i', mmap: bool = True) -> Embeddings:
+        """
+        读取嵌入（未导出或已过期时先从模型文件导出）
+
+        Args:
+            week: 时间窗口
+            dim: 嵌入维度
+            model_type: 模型类型
+            mmap: 是否使用内存映射
+
+        Returns:
+            Embeddings
+        """
+        key = (model_type, week, dim)
+        if key not in self._cache:
+            self.export_model(week, dim, model_type)
+            emb_dir = self.embedding_dir(week, dim, model_type)
+            arrays = {
+                name: np.load(os.path.join(emb_dir, f"{name}.npy"), mmap_mode='r' if mmap else None)
+                for name in EMBEDDING_ARRAYS
+            }
+            self._cache[key] = Embeddings(**arrays)
+        return self._cache[key]
@@ -0,0 +1,323 @@
+"""
+特征拼接模块
+
+按稠密ID直接索引，把各来源的特征拼到候选表上：
+- 用户特征、商品特征保存为按稠密ID对齐的float32数组，候选的特征为 block[user] / block[item]
+- 用户-商品特征按打包的int64 key排序保存，用二分查找定位
+- LightFM的用户·商品内积按行计算
+- 输出连续的float32特征矩阵和列清单（manifest），可以直接交给CatBoost/LightGBM，
+  也可以分块写入内存映射文件，不构建中间的宽DataFrame
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, List, Optional
+
+from data.store import DataStore, get_data_store
+from features.embedding_store import EmbeddingStore
+from models.candidate_set import pack_user_item
+
+# 特征来源类型
+SOURCE_KINDS = ('user', 'item', 'user_item', 'user_item_dot', 'candidate')
+
+
+def dense_block(df: pd.DataFrame, id_column: str, n: int, columns: Optional[List[str]] = None) -> np.ndarray:
+    """
+    将按ID的特征表转为按稠密ID对齐的float32数组
+
+    Args:
+        df: 特征表
+        id_column: ID列
+        n: ID总数
+        columns: 特征列，默认除ID列外的全部列
+
+    Returns:
+        (n, len(columns)) 的float32数组，缺失的ID为NaN
+    """
+    columns = columns or [c for c in df.columns if c != id_column]
+    block = np.full((n, len(columns)), np.nan, dtype=np.float32)
+    block[df[id_column].values] = df[columns].to_numpy(dtype=np.float32)
+    return block
+
+
+class FeatureAssembler:
+    """按稠密ID索引的特征拼接器"""
+
+    def __init__(self):
+        """初始化（之后用add_*添加特征来源）"""
+        self._sources: List[Dict[str, Any]] = []
+
+    def _add(self, kind: str, name: str, columns: List[str], **data) -> None:
+        """添加特征来源"""
+        assert kind in SOURCE_KINDS, kind
+        if any(source['name'] == name for source in self._sources):
+            raise ValueError(f"特征来源重复: {name}")
+        self._sources.append({'kind': kind, 'name': name, 'columns': list(columns), **data})
+
+    def add_user_features(self, name: str, values: np.ndarray, columns: List[str]) -> None:
+        """
+        添加用户特征
+
+        Args:
+            name: 来源名
+            values: (n_user, k) 数组，行按稠密用户ID对齐
+            columns: 特征列名
+        """
+        self._add('user', name, columns, values=np.ascontiguousarray(values, dtype=np.float32))
+
+    def add_item_features(self, name: str, values: np.ndarray, columns: List[str]) -> None:
+        """
+        添加商品特征
+
+        Args:
+            name: 来源名
+            values: (n_item, k) 数组，行按稠密商品ID对齐
+            columns: 特征列名
+        """
+        self._add('item', name, columns, values=np.ascontiguousarray(values, dtype=np.float32))
+
+    def add_user_item_features(self, name: str, user: np.ndarray, item: np.ndarray, values: np.ndarray,
+                               columns: List[str], fill_value: float = 0.0) -> None:
+        """
+        添加用户-商品特征
+
+        Args:
+            name: 来源名
+            user: 用户ID
+            item: 商品ID
+            values: (n, k) 数组，与user/item逐行对应
+            columns: 特征列名
+            fill_value: 不存在的用户-商品组合的取值
+        """
+        keys = pack_user_item(user, item)
+        order = np.argsort(keys, kind='stable')
+        self._add('user_item', name, columns, keys=keys[order],
+                  values=np.ascontiguousarray(np.asarray(values, dtype=np.float32)[order]),
+                  fill_value=fill_value)
+
+    def add_user_item_dot(self, name: str, user_values: np.ndarray, item_values: np.ndarray) -> None:
+        """
+        添加用户·商品内积特征（如LightFM的[表示, 偏置]，内积加偏置即为模型打分）
+
+        Args:
+            name: 来源名（同时作为特征列名）
+            user_values: (n_user, d) 用户向量
+            item_values: (n_item, d) 商品向量
+        """
+        self._add('user_item_dot', name, [name],
+                  user_values=np.asarray(user_values, dtype=np.float32),
+                  item_values=np.asarray(item_values, dtype=np.float32))
+
+    def add_candidate_columns(self, columns: List[str]) -> None:
+        """
+        添加候选表自带的数值列（如各策略的排名、分数）
+
+        Args:
+            columns: 候选表中的列名
+        """
+        self._add('candidate', 'candidate', columns)
+
+    @property
+    def columns(self) -> List[str]:
+        """特征矩阵的列名"""
+        return [c for source in self._sources for c in source['columns']]
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        列清单
+
+        Returns:
+            columns: 全部列名；sources: 各来源的名称、类型和列区间[start, end)
+        """
+        sources = []
+        offset = 0
+        for source in self._sources:
+            width = len(source['columns'])
+            sources.append({
+                'name': source['name'],
+                'kind': source['kind'],
+                'start': offset,
+                'end': offset + width,
+            })
+            offset += width
+        return {'columns': self.columns, 'sources': sources}
+
+    def _fill(self, out: np.ndarray, user: np.ndarray, item: np.ndarray,
+              candidates: Optional[pd.DataFrame]) -> None:
+        """按来源把一批候选的特征写入out"""
+        offset = 0
+        for source in self._sources:
+            width = len(source['columns'])
+            target = out[:, offset:offset + width]
+            kind = source['kind']
+            if kind == 'user':
+                target[:] = source['values'][user]
+            elif kind == 'item':
+                target[:] = source['values'][item]
+            elif kind == 'user_item':
+                keys = source['keys']
+                query = pack_user_item(user, item)
+                position = np.searchsorted(keys, query)
+                position[position == len(keys)] = 0
+                found = keys[position] == query if len(keys) else np.zeros(len(query), dtype=bool)
+                target[:] = source['fill_value']
+                target[found] = source['values'][position[found]]
+            elif kind == 'user_item_dot':
+                target[:, 0] = np.einsum('ij,ij->i', source['user_values'][user], source['item_values'][item])
+            else:
+                if candidates is None:
+                    raise ValueError("候选表自带的特征列需要传入candidates")
+                for i, column in enumerate(source['columns']):
+                    target[:, i] = candidates[column].to_numpy(dtype=np.float32)
+            offset += width
+
+    def assemble(self, user: np.ndarray, item: np.ndarray, candidates: Optional[pd.DataFrame] = None,
+                 out: Optional[np.ndarray] = None, batch_size: int = 1_000_000) -> np.ndarray:
+        """
+        拼接候选的特征矩阵
+
+        Args:
+            user: 候选的用户ID
+            item: 候选的商品ID
+            candidates: 候选表（只在使用add_candidate_columns时需要，与user/item逐行对应）
+            out: 输出数组（可以是内存映射数组），None表示新建
+            batch_size: 每批候选数，控制临时内存
+
+        Returns:
+            (n, len(columns)) 的连续float32特征矩阵
+        """
+        user = np.asarray(user, dtype=np.int64)
+        item = np.asarray(item, dtype=np.int64)
+        if out is None:
+            out = np.empty((len(user), len(self.columns)), dtype=np.float32)
+        for start in range(0, len(user), batch_size):
+            end = min(start + batch_size, len(user))
+            batch = None if candidates is None else candidates.iloc[start:end]
+            self._fill(out[start:end], user[start:end], item[start:end], batch)
+        return out
+
+    def assemble_to_file(self, path: str, user: np.ndarray, item: np.ndarray,
+                         candidates: Optional[pd.DataFrame] = None, batch_size: int = 1_000_000) -> None:
+        """
+        拼接特征矩阵并分块写入.npy文件，列清单保存为同名.json
+
+        Args:
+            path: 特征矩阵路径（.npy）
+            user: 候选的用户ID
+            item: 候选的商品ID
+            candidates: 候选表
+            batch_size: 每批候选数
+        """
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                        shape=(len(user), len(self.columns)))
+        self.assemble(user, item, candidates, out=out, batch_size=batch_size)
+        out.flush()
+        del out
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump(self.manifest(), f, ensure_ascii=False)
+        logger.info(f"特征矩阵已保存: {path} ({len(user)}行, {len(self.columns)}列)")
+
+
+def build_feature_assembler(
+    data_dir: str,
+    week: int,
+    store: Optional[DataStore] = None,
+    lfm_dim: Optional[int] = 16,
+    candidate_columns: Optional[List[str]] = None,
+    allow_missing: bool = False
+) -> FeatureAssembler:
+    """
+    由特征生成阶段的产物构建参考周的特征拼接器
+
+    产物缺失时特征列会随周变化，训练和推理的列不再一致，因此默认列出全部缺失的产物后报错。
+
+    Args:
+        data_dir: 数据目录路径
+        week: 参考周
+        store: 共享数据仓库，默认使用进程内共享实例
+        lfm_dim: LightFM嵌入维度，None表示不使用LightFM特征
+        candidate_columns: 候选表自带的数值列
+        allow_missing: 为True时跳过缺失的产物（记录警告）而不报错
+
+    Returns:
+        特征拼接器
+    """
+    missing: List[str] = []
+
+    def exists(path: str) -> bool:
+        if os.path.exists(path):
+            return True
+        missing.append(path)
+        return False
+
+    store = store if store is not None else get_data_store(os.path.join(data_dir, 'processed'))
+    n_users, n_items = store.n_users, store.n_items
+    assembler = FeatureAssembler()
+
+    # 商品属性
+    items = store.table('items')
+    item_columns = [c for c in items.columns if c.endswith('_idx')]
+    assembler.add_item_features('item_attributes', dense_block(items, 'item', n_items, item_columns),
+                                item_columns)
+
+    # 用户onehot聚合特征
+    user_features_dir = os.path.join(data_dir, 'user_features')
+    for col in item_columns:
+        path = os.path.join(user_features_dir, f'user_ohe_agg_week{week}_{col}.pkl')
+        if exists(path):
+            df = pd.read_pickle(path)
+            columns = [c for c in df.columns if c != 'user']
+            assembler.add_user_features(f'user_ohe_agg_{col}', dense_block(df, 'user', n_users, columns), columns)
+
+    # 交易聚合特征
+    transaction_dir = os.path.join(data_dir, 'transaction_features')
+    for kind, id_column, n in [('user', 'user', n_users), ('item', 'item', n_items)]:
+        path = os.path.join(transaction_dir, f'{kind}_transaction_week{week}.pkl')
+        if exists(path):
+            df = pd.read_pickle(path)
+            columns = [c for c in df.columns if c != id_column]
+            block = dense_block(df, id_column, n, columns)
+            if kind == 'user':
+                assembler.add_user_features(f'{kind}_transaction', block, columns)
+            else:
+                assembler.add_item_features(f'{kind}_transaction', block, columns)
+    path = os.path.join(transaction_dir, f'user_item_transaction_week{week}.pkl')
+    if exists(path):
+        df = pd.read_pickle(path)
+        columns = [c for c in df.columns if c not in ('user', 'item')]
+        assembler.add_user_item_features('user_item_transaction', df['user'].values, df['item'].values,
+                                         df[columns].to_numpy(dtype=np.float32), columns)
+
+    # LightFM嵌入和打分
+    if lfm_dim is not None:
+        embedding_store = EmbeddingStore(os.path.join(data_dir, 'lfm'))
+        if os.path.isdir(embedding_store.embedding_dir(week, lfm_dim)) or \
+                exists(embedding_store.model_path(week, lfm_dim)):
+            embeddings = embedding_store.load(week, lfm_dim)
+            users, items_rep = embeddings.users(), embeddings.items()
+            assembler.add_user_features(
+                'lfm_user', users, [f'user_rep_{i}' for i in range(users.shape[1])]
+            )
+            assembler.add_item_features(
+                'lfm_item', items_rep, [f'item_rep_{i}' for i in range(items_rep.shape[1])]
+            )
+            # [表示, 用户偏置, 1]·[表示, 1, 商品偏置] 即为LightFM打分
+            user_dot = np.hstack([users, np.ones((len(users), 1), dtype=np.float32)])
+            item_dot = np.hstack([items_rep[:, :-1], np.ones((len(items_rep), 1), dtype=np.float32),
+                                  items_rep[:, -1:]])
+            assembler.add_user_item_dot('lfm_score', user_dot, item_dot)
+
+    if missing:
+        message = f"week{week}的特征产物缺失:\n" + '\n'.join(missing)
+        if not allow_missing:
+            raise FileNotFoundError(message + "\n请先运行特征生成步骤")
+        logger.warning(message + "\n已跳过，特征列将与产物齐全时不同")
+
+    if candidate_columns:
+        assembler.add_candidate_columns(candidate_columns)
+
+    logger.info(f"特征拼接器: {len(assembler.manifest()['sources'])}个来源, {len(assembler.columns)}列")
+    return assembler
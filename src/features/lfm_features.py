@@ -1,84 +1,233 @@
 """
 LightFM特征生成模块
 
-使用LightFM矩阵分解生成用户和商品的低维表示
+使用LightFM矩阵分解生成用户和商品的低维表示：
+- 用户-商品矩阵直接由整数数组构建为CSR，多个窗口按周累加（后缀和）得到
+- 可选热启动：从最旧（数据最少）的窗口开始训练，之后每个窗口
+  在上一个窗口的模型上用fit_partial继续训练较少的epoch
+- 训练后将用户/商品表示导出到嵌入存储，读取时不需要反序列化模型
 """
 
 import os
+import copy
+import json
+import time
 import pickle
 import pandas as pd
 import numpy as np
 from lightfm import LightFM
 from scipy import sparse
 from logzero import logger
-from typing import Tuple
+from typing import Any, Dict, Iterator, List, Tuple, Optional
+
+from data.storage import table_mtime
+from data.store import DataStore, get_data_store
+from features.embedding_store import EmbeddingStore
+from features.windowed import suffix_window_aggregates
+
+# 默认LightFM参数
+DEFAULT_LIGHTFM_PARAMS = {
+    'learning_schedule': 'adadelta',
+    'loss': 'bpr',
+    'learning_rate': 0.005,
+    'random_state': 42,
+}
+
+# config.yaml中lightfm段里不属于模型参数的训练/调度项
+LIGHTFM_TRAINING_KEYS = (
+    'epochs', 'embedding_dim', 'warm_start', 'warm_start_epochs',
+    'num_threads', 'max_parallel_jobs', 'weeks',
+)
 
 
 class LightFMFeatureGenerator:
     """LightFM特征生成器"""
     
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None):
         """
         初始化特征生成器
         
         Args:
             data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（使用其中的lightfm段），None表示使用默认参数
         """
         self.data_dir = data_dir
         self.processed_dir = os.path.join(data_dir, "processed")
         self.lfm_dir = os.path.join(data_dir, "lfm")
         os.makedirs(self.lfm_dir, exist_ok=True)
+        self.store = store if store is not None else get_data_store(self.processed_dir)
+        self.embeddings = EmbeddingStore(self.lfm_dir)
+        
+        lfm_config = dict((config or {}).get('lightfm') or {})
         
         # LightFM参数
-        self.lightfm_params = {
-            'learning_schedule': 'adadelta',
-            'loss': 'bpr',
-            'learning_rate': 0.005,
-            'random_state': 42,
+        self.lightfm_params = DEFAULT_LIGHTFM_PARAMS.copy()
+        self.lightfm_params.update({k: v for k, v in lfm_config.items() if k not in LIGHTFM_TRAINING_KEYS})
+        self.epochs = int(lfm_config.get('epochs', 100))
+        # 热启动时每个窗口继续训练的epoch数
+        self.warm_start_epochs = int(lfm_config.get('warm_start_epochs', 20))
+        # 与LightFMScheduler一致：null为CPU核数
+        self.num_threads = int(lfm_config.get('num_threads') or os.cpu_count() or 1)
+    
+    def model_path(self, week: int, dim: int, model_type: str = 'i_i') -> str:
+        """模型文件路径"""
+        return os.path.join(self.lfm_dir, f"lfm_{model_type}_week{week}_dim{dim}_model.pkl")
+    
+    def _meta_path(self, week: int, dim: int) -> str:
+        """模型训练参数记录文件路径"""
+        return os.path.join(self.lfm_dir, f"lfm_i_i_week{week}_dim{dim}_meta.json")
+    
+    def training_meta(self, dim: int, init_week: Optional[int] = None) -> Dict[str, Any]:
+        """
+        决定模型产物的训练参数
+        
+        Args:
+            dim: 嵌入维度
+            init_week: 热启动的初始模型窗口，None表示从头训练
+        """
+        return {
+            'params': {**self.lightfm_params, 'no_components': dim},
+            'epochs': self.epochs if init_week is None else self.warm_start_epochs,
+            'init_week': init_week,
         }
-        self.epochs = 100
     
-    def create_user_item_matrix(self, week: int, dim: int) -> None:
+    def is_up_to_date(self, week: int, dim: int, init_week: Optional[int] = None) -> bool:
+        """
+        模型产物是否存在、训练参数一致且不早于交易数据
+        
+        Args:
+            week: 时间窗口
+            dim: 嵌入维度
+            init_week: 热启动的初始模型窗口
+            
+        Returns:
+            是否可以跳过训练
+        """
+        model_path = self.model_path(week, dim)
+        meta_path = self._meta_path(week, dim)
+        if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+            return False
+        with open(meta_path) as f:
+            if json.load(f) != self.training_meta(dim, init_week):
+                return False
+        return os.path.getmtime(model_path) >= table_mtime(self.processed_dir, 'transactions_train')
+    
+    def load_model(self, week: int, dim: int) -> LightFM:
+        """读取已保存的模型"""
+        with open(self.model_path(week, dim), 'rb') as f:
+            return pickle.load(f)
+    
+    def _count_matrix(self, tr_data: pd.DataFrame) -> Dict[str, sparse.csr_matrix]:
+        """一段交易的用户-商品购买次数矩阵"""
+        user = tr_data['user'].values.astype(np.int32)
+        item = tr_data['item'].values.astype(np.int32)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(user), dtype=np.float32), (user, item)),
+            shape=(self.store.n_users, self.store.n_items)
+        )
+        return {'matrix': matrix}
+    
+    @staticmethod
+    def _binarize(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+        """购买次数矩阵转为0/1矩阵（重复购买记为1）"""
+        matrix = matrix.copy()
+        matrix.data[:] = 1
+        return matrix
+    
+    def build_user_item_matrix(self, week: int) -> sparse.csr_matrix:
+        """
+        由 week >= week 的交易构建用户-商品矩阵（重复购买记为1）
+        
+        Args:
+            week: 时间窗口
+            
+        Returns:
+            CSR矩阵 (n_user, n_item)
+        """
+        tr_data = self.store.transactions_since(week, ['user', 'item'])
+        return self._binarize(self._count_matrix(tr_data)['matrix'])
+    
+    def iter_user_item_matrices(self, weeks: List[int]) -> Iterator[Tuple[int, sparse.csr_matrix]]:
+        """
+        依次构建多个窗口的用户-商品矩阵（按周累加，只遍历一次交易）
+        
+        Args:
+            weeks: 时间窗口
+            
+        Yields:
+            (week, CSR矩阵)，按week从大到小
+        """
+        for week, total in suffix_window_aggregates(self.store, weeks, self._count_matrix, ['user', 'item']):
+            yield week, self._binarize(total['matrix'])
+    
+    def _fit(self, model: LightFM, matrix: sparse.csr_matrix, epochs: int, name: str) -> None:
+        """
+        逐epoch训练模型并记录耗时
+        
+        Args:
+            model: LightFM模型（未训练时从头开始，否则继续训练）
+            matrix: 用户-商品矩阵
+            epochs: epoch数
+            name: 日志中的模型名
+        """
+        start = time.time()
+        for epoch in range(epochs):
+            epoch_start = time.time()
+            model.fit_partial(matrix, epochs=1, num_threads=self.num_threads)
+            logger.debug(f"{name} epoch {epoch + 1}/{epochs}: {time.time() - epoch_start:.2f}s")
+        elapsed = time.time() - start
+        logger.info(f"{name} 训练完成: {epochs}个epoch, {elapsed:.1f}s ({elapsed / max(epochs, 1):.2f}s/epoch)")
+    
+    def create_user_item_matrix(self, week: int, dim: int,
+                                init_model: Optional[LightFM] = None,
+                                init_week: Optional[int] = None,
+                                user_item_matrix: Optional[sparse.csr_matrix] = None) -> LightFM:
         """
         创建用户-商品矩阵并训练LightFM模型
         
         Args:
             week: 时间窗口
             dim: 嵌入维度
+            init_model: 热启动的初始模型（不会被修改），None表示从头训练self.epochs个epoch
+            init_week: 初始模型的窗口（记录在训练参数中）
+            user_item_matrix: 已构建的用户-商品矩阵，None表示由交易构建
+            
+        Returns:
+            训练好的模型
         """
         path_prefix = os.path.join(self.lfm_dir, f"lfm_i_i_week{week}_dim{dim}")
         logger.info(f"生成LightFM特征: {path_prefix}")
         
-        # 读取数据
-        transactions = pd.read_pickle(os.path.join(self.processed_dir, "transactions_train.pkl"))
-        users = pd.read_pickle(os.path.join(self.processed_dir, "users.pkl"))
-        items = pd.read_pickle(os.path.join(self.processed_dir, "items.pkl"))
-        
-        n_user = len(users)
-        n_item = len(items)
-        
-        # 创建用户-商品矩阵
-        tr_data = transactions.query(f"@week <= week")[['user', 'item']].drop_duplicates(ignore_index=True)
-        user_item_matrix = sparse.lil_matrix((n_user, n_item))
-        user_item_matrix[tr_data['user'], tr_data['item']] = 1
+        if user_item_matrix is None:
+            user_item_matrix = self.build_user_item_matrix(week)
         
         # 训练LightFM模型
-        lightfm_params = self.lightfm_params.copy()
-        lightfm_params['no_components'] = dim
-        
-        model = LightFM(**lightfm_params)
-        model.fit(user_item_matrix, epochs=self.epochs, num_threads=4, verbose=True)
+        if init_model is None:
+            lightfm_params = self.lightfm_params.copy()
+            lightfm_params['no_components'] = dim
+            model = LightFM(**lightfm_params)
+            epochs = self.epochs
+        else:
+            model = copy.deepcopy(init_model)
+            epochs = self.warm_start_epochs
+        self._fit(model, user_item_matrix, epochs, os.path.basename(path_prefix))
         
-        # 保存模型
-        save_path = f"{path_prefix}_model.pkl"
+        # 保存模型和训练参数
+        save_path = self.model_path(week, dim)
         with open(save_path, 'wb') as f:
             pickle.dump(model, f)
+        with open(self._meta_path(week, dim), 'w') as f:
+            json.dump(self.training_meta(dim, init_week if init_model is not None else None), f)
+        self.embeddings.export(model, week, dim)
         
         logger.info(f"LightFM模型已保存: {save_path}")
+        return model
     
     def generate_embeddings(self, model_type: str, week: int, dim: int) -> pd.DataFrame:
         """
-        生成用户嵌入特征
+        生成用户嵌入特征（从嵌入存储读取）
         
         Args:
             model_type: 模型类型
@@ -86,43 +235,31 @@ class LightFMFeatureGenerator:
             dim: 嵌入维度
             
         Returns:
-            用户嵌入特征DataFrame
-        """
-        # 加载模型
-        model_path = os.path.join(self.lfm_dir, f"lfm_{model_type}_week{week}_dim{dim}_model.pkl")
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
-        
-        # 获取用户表示
-        biases, embeddings = model.get_user_representations(None)
-        n_user = len(biases)
-        
-        # 合并嵌入和偏置
-        user_features = np.hstack([embeddings, biases.reshape(n_user, 1)])
-        user_embeddings = pd.DataFrame(
-            user_features, 
-            columns=[f"user_rep_{i}" for i in range(dim + 1)]
-        )
-        user_embeddings = pd.concat([
-            pd.DataFrame({'user': range(n_user)}), 
-            user_embeddings
-        ], axis=1)
-        
-        return user_embeddings
+            用户嵌入特征DataFrame：user, user_rep_0..user_rep_{dim}（最后一列为偏置）
+        """
+        return self.embeddings.load(week, dim, model_type).user_frame()
     
-    def generate_all_features(self, dim: int = 16) -> None:
+    def generate_all_features(self, dim: int = 16, warm_start: bool = False) -> None:
         """
         为所有时间窗口生成LightFM特征
         
+        week越大窗口越小（week >= week的交易），且week的数据包含week + 1的数据。
+        热启动时从week 13开始从头训练，之后每个窗口在上一个模型上继续训练。
+        
         Args:
             dim: 嵌入维度
+            warm_start: 是否热启动
         """
         logger.info("开始生成LightFM特征...")
+        start = time.time()
         
-        for week in range(1, 14):
-            self.create_user_item_matrix(week, dim)
+        model = None
+        for week, matrix in self.iter_user_item_matrices(list(range(14))):
+            trained = self.create_user_item_matrix(week, dim, init_model=model, init_week=week + 1,
+                                                   user_item_matrix=matrix)
+            model = trained if warm_start else None
         
-        logger.info("LightFM特征生成完成！")
+        logger.info(f"LightFM特征生成完成！总耗时: {time.time() - start:.1f}s")
 
 
 def main():
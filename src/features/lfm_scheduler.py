@@ -0,0 +1,142 @@
+"""
+LightFM并行训练调度模块
+
+将多个窗口/维度的LightFM训练任务放到进程池中并行执行：
+- 全局线程预算按并发任务数平分，每个任务的LightFM使用分到的线程数
+- 模型参数和调度参数来自config.yaml的lightfm段
+- 模型产物已是最新（训练参数一致且不早于交易数据）的任务直接跳过，只补齐缺少的导出嵌入
+- 热启动时同一维度的窗口前后依赖，作为一条任务链在一个进程中按顺序训练
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logzero import logger
+from typing import Any, Dict, List, Optional, Tuple
+
+from features.lfm_features import LightFMFeatureGenerator
+
+
+def _run_chain(
+    data_dir: str,
+    config: Dict[str, Any],
+    dim: int,
+    weeks: List[int],
+    warm_start: bool,
+    num_threads: int
+) -> Tuple[int, List[int], float]:
+    """
+    子进程：按顺序训练一条任务链
+
+    Args:
+        data_dir: 数据目录
+        config: 配置
+        dim: 嵌入维度
+        weeks: 窗口（从旧到新）
+        warm_start: 是否热启动（后一个窗口在前一个窗口的模型上继续训练）
+        num_threads: 分到的线程数
+
+    Returns:
+        (维度, 实际训练的窗口, 耗时)
+    """
+    start = time.time()
+    generator = LightFMFeatureGenerator(data_dir, config=config)
+    generator.num_threads = num_threads
+
+    trained = []
+    model = None
+    stale = False
+    # 窗口从旧到新，矩阵按周累加得到
+    matrices = generator.iter_user_item_matrices(weeks)
+    for i, (week, matrix) in enumerate(matrices):
+        init_week = weeks[i - 1] if warm_start and i > 0 else None
+        # 前一个窗口重新训练后，依赖它的窗口也需要重新训练
+        stale = stale or not generator.is_up_to_date(week, dim, init_week)
+        if stale:
+            init_model = None
+            if init_week is not None:
+                init_model = model if model is not None else generator.load_model(init_week, dim)
+            model = generator.create_user_item_matrix(week, dim, init_model=init_model, init_week=init_week,
+                                                      user_item_matrix=matrix)
+            trained.append(week)
+        else:
+            logger.info(f"LightFM模型已是最新，跳过: week{week} dim{dim}")
+            generator.embeddings.export_model(week, dim)
+            model = None
+    return dim, trained, time.time() - start
+
+
+class LightFMScheduler:
+    """LightFM多窗口并行训练调度器"""
+
+    def __init__(self, data_dir: str, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化调度器
+
+        Args:
+            data_dir: 数据目录路径
+            config: 配置，使用其中的lightfm段：
+                weeks: 最旧的窗口（训练week 0..weeks，week 0用于推理），默认13
+                embedding_dim: 嵌入维度，可以是单个整数或列表
+                warm_start: 是否热启动
+                num_threads: 全局线程预算，默认为CPU核数
+                max_parallel_jobs: 最大并发任务数
+        """
+        self.data_dir = data_dir
+        self.config = config or {}
+        lfm_config = self.config.get('lightfm') or {}
+
+        dims = lfm_config.get('embedding_dim', 16)
+        self.dims = [int(d) for d in (dims if isinstance(dims, (list, tuple)) else [dims])]
+        self.weeks = list(range(int(lfm_config.get('weeks', 13)), -1, -1))
+        self.warm_start = bool(lfm_config.get('warm_start', False))
+        self.thread_budget = int(lfm_config.get('num_threads') or os.cpu_count() or 1)
+        self.max_parallel_jobs = int(lfm_config.get('max_parallel_jobs') or self.thread_budget)
+
+    def jobs(self) -> List[Tuple[int, List[int]]]:
+        """
+        任务列表
+
+        热启动时每个维度是一条包含全部窗口的任务链，否则每个(窗口, 维度)是一个独立任务。
+
+        Returns:
+            (维度, 窗口列表) 的列表
+        """
+        if self.warm_start:
+            return [(dim, self.weeks) for dim in self.dims]
+        return [(dim, [week]) for dim in self.dims for week in self.weeks]
+
+    def run(self) -> None:
+        """执行全部任务"""
+        generator = LightFMFeatureGenerator(self.data_dir, config=self.config)
+        jobs = []
+        for dim, weeks in self.jobs():
+            # 主进程先过滤掉已是最新的任务（热启动的任务链只在全部最新时跳过）
+            init_weeks = [weeks[i - 1] if self.warm_start and i > 0 else None for i in range(len(weeks))]
+            if all(generator.is_up_to_date(w, dim, iw) for w, iw in zip(weeks, init_weeks)):
+                logger.info(f"LightFM模型已是最新，跳过: weeks{weeks} dim{dim}")
+                # 补齐旧模型缺少的导出嵌入
+                for week in weeks:
+                    generator.embeddings.export_model(week, dim)
+                continue
+            jobs.append((dim, weeks))
+
+        if not jobs:
+            logger.info("全部LightFM模型已是最新")
+            return
+
+        # 线程预算按并发任务数平分
+        num_workers = max(1, min(self.max_parallel_jobs, len(jobs), self.thread_budget))
+        threads_per_job = max(1, self.thread_budget // num_workers)
+        logger.info(f"LightFM并行训练: {len(jobs)}个任务, {num_workers}个进程, 每个任务{threads_per_job}个线程")
+
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [
+                pool.submit(_run_chain, self.data_dir, self.config, dim, weeks, self.warm_start, threads_per_job)
+                for dim, weeks in jobs
+            ]
+            for future in as_completed(futures):
+                dim, trained, elapsed = future.result()
+                logger.info(f"LightFM任务完成: dim{dim}, 训练窗口{trained}, {elapsed:.1f}s")
+        logger.info(f"LightFM并行训练完成！总耗时: {time.time() - start:.1f}s")
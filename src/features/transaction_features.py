@@ -0,0 +1,278 @@
+"""
+交易聚合特征模块
+
+按config.yaml中features段配置的窗口，生成用户/商品/用户-商品的交易聚合特征：
+- 用户、商品的价格统计和销售渠道（user/item_transaction_feature_weeks）
+- 商品首次/最近销售距今的天数（item_age_feature_weeks）
+- 用户、商品、用户-商品的购买量（*_volume_feature_weeks），按多个跨度输出
+
+全部为按稠密ID的数组分组归约（bincount / reduceat），不做pandas的groupby+merge。
+交易索引按时间排序，参考周之前的各个窗口都是同一段交易的前缀，
+每个参考周只取一次交易切片，所有窗口和跨度在一次遍历中得到。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, List, Optional
+
+from data.store import DataStore, get_data_store
+from models.candidate_kernels import run_starts
+from models.candidate_set import pack_user_item, unpack_user_item
+
+# 各特征族的默认窗口（周数），可被config.yaml的features段覆盖
+DEFAULT_FEATURE_WEEKS = {
+    'user_transaction_feature_weeks': 50,
+    'item_transaction_feature_weeks': 16,
+    'item_age_feature_weeks': 40,
+    'user_volume_feature_weeks': 50,
+    'item_volume_feature_weeks': 20,
+    'user_item_volume_feature_weeks': 16,
+}
+
+TRANSACTION_COLUMNS = ['user', 'item', 'week', 'day', 'price', 'sales_channel_id']
+
+
+def volume_spans(num_weeks: int) -> List[int]:
+    """
+    购买量特征的跨度：1, 2, 4, ... 直到num_weeks（包含num_weeks）
+
+    Args:
+        num_weeks: 最大跨度
+
+    Returns:
+        跨度列表（升序）
+    """
+    spans = []
+    span = 1
+    while span < num_weeks:
+        spans.append(span)
+        span *= 2
+    return spans + [num_weeks]
+
+
+def grouped_stats(ids: np.ndarray, values: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+    """
+    按稠密ID分组统计
+
+    Args:
+        ids: 分组ID（0..n-1）
+        values: 数值
+        n: 分组数
+
+    Returns:
+        count, mean, std（ddof=1，与pandas一致）, min, max；没有样本的分组为NaN（count为0）
+    """
+    values = values.astype(np.float64)
+    count = np.bincount(ids, minlength=n)
+    total = np.bincount(ids, weights=values, minlength=n)
+    square = np.bincount(ids, weights=values * values, minlength=n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        var = (square - count * mean * mean) / (count - 1)
+    std = np.sqrt(np.maximum(var, 0))
+    std[count < 2] = np.nan
+
+    minimum = np.full(n, np.nan)
+    maximum = np.full(n, np.nan)
+    if len(ids):
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        sorted_values = values[order]
+        starts = run_starts(sorted_ids)
+        minimum[sorted_ids[starts]] = np.minimum.reduceat(sorted_values, starts)
+        maximum[sorted_ids[starts]] = np.maximum.reduceat(sorted_values, starts)
+
+    return {'count': count, 'mean': mean, 'std': std, 'min': minimum, 'max': maximum}
+
+
+class TransactionFeatureGenerator:
+    """交易聚合特征生成器"""
+
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        """
+        初始化特征生成器
+
+        Args:
+            data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（使用其中的features段），None表示使用默认窗口
+        """
+        self.data_dir = data_dir
+        self.processed_dir = os.path.join(data_dir, "processed")
+        self.features_dir = os.path.join(data_dir, "transaction_features")
+        os.makedirs(self.features_dir, exist_ok=True)
+        self.store = store if store is not None else get_data_store(self.processed_dir)
+
+        feature_config = (config or {}).get('features') or {}
+        self.feature_weeks = {
+            key: int(feature_config.get(key, default)) for key, default in DEFAULT_FEATURE_WEEKS.items()
+        }
+
+    def _window(self, week: int) -> Dict[str, np.ndarray]:
+        """
+        参考周的交易：week <= 交易周 < week + 最大窗口，按时间从新到旧排序
+
+        Returns:
+            列名到数组的字典，另有rel_week（交易周 - week）
+        """
+        num_weeks = max(self.feature_weeks.values())
+        tr = self.store.transaction_index().between(week, num_weeks, TRANSACTION_COLUMNS)
+        columns = {c: tr[c].values for c in TRANSACTION_COLUMNS}
+        columns['rel_week'] = columns['week'].astype(np.int64) - week
+        return columns
+
+    @staticmethod
+    def _prefix_end(rel_week: np.ndarray, num_weeks: int) -> int:
+        """前num_weeks周的交易在窗口中的结束行（rel_week升序）"""
+        return int(np.searchsorted(rel_week, num_weeks, side='left'))
+
+    def _volumes(self, ids: np.ndarray, rel_week: np.ndarray, n: int, num_weeks: int,
+                 prefix: str) -> Dict[str, np.ndarray]:
+        """
+        各跨度的购买量：每个跨度在上一个跨度的计数上累加新增的几周
+
+        Args:
+            ids: 分组ID（按rel_week升序排列的交易）
+            rel_week: 交易周 - 参考周
+            n: 分组数
+            num_weeks: 最大跨度
+            prefix: 特征名前缀
+
+        Returns:
+            特征名 -> float32数组
+        """
+        features = {}
+        counts = np.zeros(n, dtype=np.int64)
+        end = 0
+        for span in volume_spans(num_weeks):
+            new_end = self._prefix_end(rel_week, span)
+            counts += np.bincount(ids[end:new_end], minlength=n)
+            end = new_end
+            features[f'{prefix}_volume_{span}w'] = counts.astype(np.float32)
+        return features
+
+    def _price_channel_features(self, ids: np.ndarray, window: Dict[str, np.ndarray], end: int,
+                                n: int, prefix: str) -> Dict[str, np.ndarray]:
+        """价格统计和线上渠道占比"""
+        price = grouped_stats(ids[:end], window['price'][:end], n)
+        channel = grouped_stats(ids[:end], window['sales_channel_id'][:end], n)
+        features = {f'{prefix}_price_{k}': price[k] for k in ['mean', 'std', 'min', 'max']}
+        features[f'{prefix}_sales_channel_mean'] = channel['mean']
+        features[f'{prefix}_transaction_count'] = price['count']
+        return {k: v.astype(np.float32) for k, v in features.items()}
+
+    def user_features(self, week: int, window: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        用户特征，行按稠密用户ID对齐
+
+        Args:
+            week: 参考周
+            window: 参考周的交易（见_window），None表示重新读取
+
+        Returns:
+            用户特征DataFrame
+        """
+        window = window if window is not None else self._window(week)
+        n = self.store.n_users
+        user = window['user']
+        rel_week = window['rel_week']
+
+        features = {'user': np.arange(n)}
+        end = self._prefix_end(rel_week, self.feature_weeks['user_transaction_feature_weeks'])
+        features.update(self._price_channel_features(user, window, end, n, 'user'))
+        features.update(self._volumes(
+            user, rel_week, n, self.feature_weeks['user_volume_feature_weeks'], 'user'
+        ))
+        return pd.DataFrame(features, copy=False)
+
+    def item_features(self, week: int, window: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        商品特征，行按稠密商品ID对齐
+
+        item_age_days为窗口内首次销售距参考周开始的天数，item_recency_days为最近一次销售的天数。
+
+        Args:
+            week: 参考周
+            window: 参考周的交易（见_window），None表示重新读取
+
+        Returns:
+            商品特征DataFrame
+        """
+        window = window if window is not None else self._window(week)
+        n = self.store.n_items
+        item = window['item']
+        rel_week = window['rel_week']
+
+        features = {'item': np.arange(n)}
+        end = self._prefix_end(rel_week, self.feature_weeks['item_transaction_feature_weeks'])
+        features.update(self._price_channel_features(item, window, end, n, 'item'))
+
+        # day为距锚定日期的天数，参考周开始于day = 7 * week
+        end = self._prefix_end(rel_week, self.feature_weeks['item_age_feature_weeks'])
+        days = grouped_stats(item[:end], window['day'][:end].astype(np.int64) - 7 * week, n)
+        features['item_age_days'] = days['max'].astype(np.float32)
+        features['item_recency_days'] = days['min'].astype(np.float32)
+
+        features.update(self._volumes(
+            item, rel_week, n, self.feature_weeks['item_volume_feature_weeks'], 'item'
+        ))
+        return pd.DataFrame(features, copy=False)
+
+    def user_item_features(self, week: int, window: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        用户-商品购买量特征（只包含窗口内购买过的组合）
+
+        Args:
+            week: 参考周
+            window: 参考周的交易（见_window），None表示重新读取
+
+        Returns:
+            用户-商品特征DataFrame，按(user, item)排序
+        """
+        window = window if window is not None else self._window(week)
+        num_weeks = self.feature_weeks['user_item_volume_feature_weeks']
+        rel_week = window['rel_week']
+        end = self._prefix_end(rel_week, num_weeks)
+
+        keys, inverse = np.unique(
+            pack_user_item(window['user'][:end], window['item'][:end]), return_inverse=True
+        )
+        user, item = unpack_user_item(keys)
+        features = {'user': user, 'item': item}
+        features.update(self._volumes(inverse, rel_week[:end], len(keys), num_weeks, 'user_item'))
+        return pd.DataFrame(features, copy=False)
+
+    def create_features(self, week: int) -> None:
+        """
+        生成并保存参考周的全部交易聚合特征
+
+        Args:
+            week: 参考周
+        """
+        logger.info(f"生成交易聚合特征: week: {week}")
+        window = self._window(week)
+        outputs = {
+            'user': self.user_features(week, window),
+            'item': self.item_features(week, window),
+            'user_item': self.user_item_features(week, window),
+        }
+        for name, df in outputs.items():
+            save_path = os.path.join(self.features_dir, f'{name}_transaction_week{week}.pkl')
+            df.to_pickle(save_path)
+            logger.info(f"特征已保存: {save_path}")
+
+    def generate_all_features(self, weeks: Optional[List[int]] = None) -> None:
+        """
+        为所有参考周生成交易聚合特征
+
+        Args:
+            weeks: 参考周，默认0..13
+        """
+        logger.info("开始生成交易聚合特征...")
+        for week in (weeks if weeks is not None else range(14)):
+            self.create_features(week)
+        logger.info("交易聚合特征生成完成！")
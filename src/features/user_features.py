@@ -2,29 +2,129 @@
 用户特征生成模块
 
 生成基于用户历史行为的聚合特征
+
+onehot聚合特征有两种引擎：
+- sparse（默认）：窗口内按行归一化的用户×商品CSR矩阵乘以商品×类别onehot稀疏矩阵，
+  一次得到全部属性列的用户平均值，输出按稠密用户ID对齐的float32块
+- vaex：逐列onehot、join、groupby的原始实现，作为参考
+
+sparse引擎生成多个窗口时按周计算部分和，再用后缀和得到每个窗口的特征（见features.windowed）
 """
 
 import os
+import numpy as np
 import pandas as pd
 import vaex
+from scipy import sparse
 from logzero import logger
-from typing import List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from data.store import DataStore, get_data_store
+from features.windowed import suffix_window_aggregates
 
 
 class UserFeatureGenerator:
     """用户特征生成器"""
     
-    def __init__(self, data_dir: str):
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None, engine: str = 'sparse'):
         """
         初始化特征生成器
         
         Args:
             data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            engine: onehot聚合特征的计算引擎，'sparse' 或 'vaex'
         """
+        if engine not in ('sparse', 'vaex'):
+            raise ValueError(f"不支持的引擎: {engine}")
+        self.engine = engine
         self.data_dir = data_dir
         self.processed_dir = os.path.join(data_dir, "processed")
         self.user_features_dir = os.path.join(data_dir, "user_features")
         os.makedirs(self.user_features_dir, exist_ok=True)
+        self.store = store if store is not None else get_data_store(self.processed_dir)
+        self._onehot: Optional[Tuple[List[str], List[np.ndarray], sparse.csr_matrix]] = None
+    
+    def _target_columns(self) -> List[str]:
+        """需要onehot编码的商品属性列"""
+        return [c for c in self.store.table('items').columns if c.endswith('_idx')]
+    
+    def _item_onehot(self) -> Tuple[List[str], List[np.ndarray], sparse.csr_matrix]:
+        """
+        商品×类别onehot矩阵，全部属性列横向拼接（首次使用时构建）
+        
+        Returns:
+            (属性列名, 各属性列的类别值, (n_item, 类别总数) 的CSR矩阵)
+        """
+        if self._onehot is None:
+            items = self.store.table('items')
+            item_ids = items['item'].values
+            n_item = int(item_ids.max()) + 1 if len(item_ids) else 0
+            
+            target_columns = self._target_columns()
+            col_values, onehots = [], []
+            for col in target_columns:
+                values, codes = np.unique(items[col].values, return_inverse=True)
+                col_values.append(values)
+                onehots.append(sparse.csr_matrix(
+                    (np.ones(len(codes)), (item_ids, codes)), shape=(n_item, len(values))
+                ))
+            self._onehot = (target_columns, col_values, sparse.hstack(onehots, format='csr'))
+        return self._onehot
+    
+    def _ohe_partial(self, tr: pd.DataFrame) -> Dict[str, Any]:
+        """
+        一段交易的onehot部分和
+        
+        Args:
+            tr: 交易（user, item）
+            
+        Returns:
+            counts: 每个用户的交易数 (n_user,)
+            sums: 每个用户的商品onehot之和 (n_user, 类别总数) 稀疏矩阵
+        """
+        _, _, onehot = self._item_onehot()
+        n_user = self.store.n_users
+        user_item = sparse.csr_matrix(
+            (np.ones(len(tr), dtype=np.float64), (tr['user'].values, tr['item'].values)),
+            shape=(n_user, onehot.shape[0])
+        )
+        return {
+            'counts': np.bincount(tr['user'].values, minlength=n_user).astype(np.float64),
+            'sums': (user_item @ onehot).tocsr(),
+        }
+    
+    def _ohe_blocks(self, counts: np.ndarray, sums: sparse.csr_matrix) -> Iterator[Tuple[str, List[str], np.ndarray]]:
+        """由onehot部分和得到平均值，逐个属性列转为稠密块"""
+        target_columns, col_values, _ = self._item_onehot()
+        product = (sparse.diags(1 / np.maximum(counts, 1)) @ sums).tocsc()
+        no_transactions = counts == 0
+        
+        offset = 0
+        for col, values in zip(target_columns, col_values):
+            block = product[:, offset:offset + len(values)].toarray().astype(np.float32)
+            block[no_transactions] = np.nan
+            names = [f'user_ohe_agg_{col}_{v}_mean' for v in values]
+            offset += len(values)
+            yield col, names, block
+    
+    def user_ohe_agg_blocks(self, week: int) -> Iterator[Tuple[str, List[str], np.ndarray]]:
+        """
+        用稀疏矩阵乘法一次计算全部属性列的onehot聚合特征
+        
+        用户的特征为其窗口内每笔交易的商品onehot的平均值，即
+        (按行归一化的用户×商品交易次数矩阵) × (商品×类别onehot矩阵)。
+        乘积保持稀疏，逐个属性列转为稠密块，内存只与单个属性列的类别数有关。
+        
+        Args:
+            week: 时间窗口
+            
+        Yields:
+            (属性列名, 特征列名, (n_user, n_category) 的float32数组)，
+            行按稠密用户ID对齐，窗口内没有交易的用户为NaN
+        """
+        partial = self._ohe_partial(self.store.transactions_since(week, ['user', 'item']))
+        return self._ohe_blocks(partial['counts'], partial['sums'])
     
     def create_user_ohe_agg(self, week: int) -> None:
         """
@@ -34,18 +134,39 @@ class UserFeatureGenerator:
         Args:
             week: 时间窗口
         """
+        if self.engine == 'sparse':
+            self._create_user_ohe_agg_sparse(week)
+        else:
+            self._create_user_ohe_agg_vaex(week)
+    
+    def _create_user_ohe_agg_sparse(self, week: int) -> None:
+        """稀疏矩阵引擎：一次计算全部属性列后按列保存"""
+        logger.info(f"处理onehot聚合特征: week: {week}")
+        self._save_ohe_blocks(week, self.user_ohe_agg_blocks(week))
+    
+    def _save_ohe_blocks(self, week: int, blocks: Iterator[Tuple[str, List[str], np.ndarray]]) -> None:
+        """按属性列保存onehot聚合特征"""
+        users = self.store.table('users', ['user'])['user'].values
+        for col, names, block in blocks:
+            users_processed = pd.DataFrame(block[users], columns=names, copy=False)
+            users_processed.insert(0, 'user', users)
+            users_processed = users_processed.sort_values(by='user').reset_index(drop=True)
+            
+            save_path = os.path.join(self.user_features_dir, f'user_ohe_agg_week{week}_{col}.pkl')
+            users_processed.to_pickle(save_path)
+            logger.info(f"特征已保存: {save_path}")
+    
+    def _create_user_ohe_agg_vaex(self, week: int) -> None:
+        """vaex引擎：逐列join和groupby（参考实现）"""
         # 读取数据
-        transactions = pd.read_pickle(os.path.join(self.processed_dir, 'transactions_train.pkl'))[
-            ['user', 'item', 'week']
-        ]
-        users = pd.read_pickle(os.path.join(self.processed_dir, 'users.pkl'))
-        items = pd.read_pickle(os.path.join(self.processed_dir, 'items.pkl'))
+        users = self.store.table('users', ['user'])
+        items = self.store.table('items')
         
         # 筛选时间窗口内的交易
-        tr = vaex.from_pandas(transactions.query(f"week >= @week")[['user', 'item']])
+        tr = vaex.from_pandas(self.store.transactions_since(week, ['user', 'item']))
         
         # 获取需要编码的列
-        target_columns = [c for c in items.columns if c.endswith('_idx')]
+        target_columns = self._target_columns()
         
         for col in target_columns:
             logger.info(f"处理特征: {col}, week: {week}")
@@ -78,12 +199,23 @@ class UserFeatureGenerator:
             users_processed.to_pickle(save_path)
             logger.info(f"特征已保存: {save_path}")
     
-    def generate_all_features(self) -> None:
-        """为所有时间窗口生成用户特征"""
+    def generate_all_features(self, incremental: bool = True) -> None:
+        """
+        为所有时间窗口生成用户特征
+        
+        Args:
+            incremental: sparse引擎下按周计算部分和，用后缀和得到全部窗口（只遍历一次交易）
+        """
         logger.info("开始生成用户特征...")
         
-        for week in range(14):
-            self.create_user_ohe_agg(week)
+        weeks = list(range(14))
+        if self.engine == 'sparse' and incremental:
+            for week, total in suffix_window_aggregates(self.store, weeks, self._ohe_partial, ['user', 'item']):
+                logger.info(f"处理onehot聚合特征: week: {week}")
+                self._save_ohe_blocks(week, self._ohe_blocks(total['counts'], total['sums']))
+        else:
+            for week in weeks:
+                self.create_user_ohe_agg(week)
         
         logger.info("用户特征生成完成！")
 
@@ -0,0 +1,47 @@
+"""
+滑动窗口聚合模块
+
+多个时间窗口"week >= w"的特征，相邻窗口只相差一周的数据：
+- 每周的部分聚合（计数、求和等可加的量）只计算一次
+- 从最旧的窗口开始依次加上新一周的部分聚合（后缀和），得到每个窗口的聚合
+- 生成多个窗口只需要遍历一次交易，而不是每个窗口各遍历一次
+"""
+
+import pandas as pd
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from data.store import DataStore
+
+
+def suffix_window_aggregates(
+    store: DataStore,
+    weeks: List[int],
+    partial: Callable[[pd.DataFrame], Dict[str, Any]],
+    columns: Optional[List[str]] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    依次得到每个窗口 week >= w 的聚合
+
+    partial只能返回可加的量（计数、求和，稀疏矩阵或NumPy数组），
+    窗口的聚合是窗口内各周部分聚合之和。
+
+    Args:
+        store: 数据仓库
+        weeks: 窗口起始周
+        partial: 由一段交易计算部分聚合，返回 名称 -> 可加的值
+        columns: partial需要的交易列
+
+    Yields:
+        (w, 窗口 week >= w 的聚合)，按w从大到小（窗口从小到大）
+    """
+    weeks = sorted(set(weeks), reverse=True)
+    if not weeks:
+        return
+
+    # 最旧的窗口一次计算，之后每次加上新的一段
+    total = partial(store.transactions_since(weeks[0], columns))
+    yield weeks[0], total
+    for prev_week, week in zip(weeks, weeks[1:]):
+        part = partial(store.transactions_between(week, prev_week - week, columns))
+        total = {name: total[name] + part[name] for name in total}
+        yield week, total
@@ -0,0 +1,209 @@
+"""
+向量召回模块
+
+使用LightFM模型的用户/商品表示做内积检索，生成候选：
+- LightFM的打分为 user_emb·item_emb + user_bias + item_bias，
+  对同一用户user_bias是常数，因此用 [user_emb, 1]·[item_emb, item_bias] 做内积检索
+- 支持暴力检索（flat）和近似检索（ivf / hnsw），在召回率和速度之间取舍
+- 对所有目标用户分批做top-K检索
+- 作为候选策略时使用候选周的LightFM模型（只用 week >= week 的交易训练），索引类型和维度来自配置
+"""
+
+import os
+import faiss
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, Optional, Tuple
+
+from features.embedding_store import EmbeddingStore, Embeddings, lightfm_feature_dim
+
+# 支持的索引类型
+INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+
+
+def _augment(embeddings: np.ndarray, last_column: np.ndarray) -> np.ndarray:
+    """在表示向量后追加一列，返回连续的float32数组"""
+    return np.ascontiguousarray(
+        np.hstack([embeddings, last_column.reshape(-1, 1)]), dtype=np.float32
+    )
+
+
+class EmbeddingRetriever:
+    """基于LightFM表示的内积检索器"""
+
+    def __init__(
+        self,
+        user_embeddings: np.ndarray,
+        user_biases: np.ndarray,
+        item_embeddings: np.ndarray,
+        item_biases: np.ndarray,
+        index_type: str = 'flat',
+        nlist: int = 1024,
+        nprobe: int = 32,
+        hnsw_m: int = 32,
+        ef_search: int = 128
+    ):
+        """
+        初始化并构建商品索引
+
+        Args:
+            user_embeddings: 用户表示 (n_user, dim)
+            user_biases: 用户偏置 (n_user,)
+            item_embeddings: 商品表示 (n_item, dim)
+            item_biases: 商品偏置 (n_item,)
+            index_type: 'flat'（暴力检索）、'ivf' 或 'hnsw'（近似检索）
+            nlist: ivf的聚类中心数
+            nprobe: ivf检索时访问的聚类数
+            hnsw_m: hnsw每个节点的连接数
+            ef_search: hnsw检索时的候选队列长度
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+
+        # 用户向量追加常数1，商品向量追加偏置，内积即为LightFM打分（去掉用户偏置）
+        self.user_vectors = _augment(user_embeddings, np.ones(len(user_biases)))
+        self.user_biases = np.asarray(user_biases, dtype=np.float32)
+        item_vectors = _augment(item_embeddings, item_biases)
+        dim = item_vectors.shape[1]
+
+        if index_type == 'flat':
+            index = faiss.IndexFlatIP(dim)
+        elif index_type == 'ivf':
+            nlist = min(nlist, len(item_vectors))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(item_vectors)
+            index.nprobe = nprobe
+        else:
+            index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = ef_search
+        index.add(item_vectors)
+
+        self.index = index
+        self.index_type = index_type
+        logger.info(f"商品索引已构建: {index_type}, {len(item_vectors)}个商品, 维度{dim}")
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Embeddings, **kwargs) -> 'EmbeddingRetriever':
+        """
+        由嵌入存储中的表示构建检索器
+
+        Args:
+            embeddings: Embeddings
+            **kwargs: 索引参数，见__init__
+
+        Returns:
+            检索器
+        """
+        return cls(embeddings.user_embeddings, embeddings.user_biases,
+                   embeddings.item_embeddings, embeddings.item_biases, **kwargs)
+
+    @classmethod
+    def from_lightfm(cls, lfm_dir: str, week: int, dim: int, model_type: str = 'i_i',
+                     **kwargs) -> 'EmbeddingRetriever':
+        """
+        从保存的LightFM模型的导出嵌入构建检索器
+
+        Args:
+            lfm_dir: LightFM模型目录
+            week: 时间窗口
+            dim: 嵌入维度
+            model_type: 模型类型
+            **kwargs: 索引参数，见__init__
+
+        Returns:
+            检索器
+        """
+        embeddings = EmbeddingStore(lfm_dir).load(week, dim, model_type)
+        return cls.from_embeddings(embeddings, **kwargs)
+
+    def search(self, users: np.ndarray, k: int, batch_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        分批检索每个用户的top-K商品
+
+        Args:
+            users: 用户ID
+            k: 每个用户的商品数
+            batch_size: 每批用户数
+
+        Returns:
+            (分数 (n, k), 商品ID (n, k))，分数已加回用户偏置
+        """
+        users = np.asarray(users, dtype=np.int64)
+        k = min(k, self.index.ntotal)
+        scores = np.empty((len(users), k), dtype=np.float32)
+        items = np.empty((len(users), k), dtype=np.int64)
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            scores[start:start + len(batch)], items[start:start + len(batch)] = \
+                self.index.search(self.user_vectors[batch], k)
+        scores += self.user_biases[users].reshape(-1, 1)
+        return scores, items
+
+    def create_candidates(self, target_users: np.ndarray, num_items: int,
+                          batch_size: int = 65536) -> pd.DataFrame:
+        """
+        创建向量召回候选
+
+        Args:
+            target_users: 目标用户
+            num_items: 每个用户的商品数
+            batch_size: 每批用户数
+
+        Returns:
+            候选DataFrame：user, item, lfm_score, lfm_rank, strategy
+        """
+        target_users = np.asarray(target_users, dtype=np.int64)
+        scores, items = self.search(target_users, num_items, batch_size)
+        k = items.shape[1]
+
+        # 近似索引结果不足k个时用-1填充
+        valid = items.ravel() >= 0
+        candidates = pd.DataFrame({
+            'user': np.repeat(target_users, k)[valid],
+            'item': items.ravel()[valid],
+            'lfm_score': scores.ravel()[valid],
+            'lfm_rank': np.tile(np.arange(1, k + 1, dtype=np.float64), len(target_users))[valid],
+        })
+        candidates['strategy'] = 'lfm'
+        return candidates
+
+
+def retriever_params_from_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    配置中model段的向量召回参数
+
+    Args:
+        config: 配置
+
+    Returns:
+        {'index_type': 索引类型, 'dim': LightFM维度（未设置时为排序特征使用的维度）}
+    """
+    model_config = (config or {}).get('model') or {}
+    dim = model_config.get('retriever_dim')
+    return {
+        'index_type': str(model_config.get('retriever_index', 'flat')),
+        'dim': int(dim) if dim is not None else lightfm_feature_dim(config),
+    }
+
+
+def build_retriever(data_dir: str, week: int, candidate_params: Dict[str, Any],
+                    retriever_params: Dict[str, Any]) -> Optional[EmbeddingRetriever]:
+    """
+    构建候选周的向量召回检索器
+
+    Args:
+        data_dir: 数据目录路径
+        week: 候选周
+        candidate_params: 候选参数（retriever_num_items为0时不使用向量召回）
+        retriever_params: 向量召回参数，见retriever_params_from_config
+
+    Returns:
+        检索器，未启用时为None
+    """
+    if not candidate_params.get('retriever_num_items'):
+        return None
+    return EmbeddingRetriever.from_lightfm(
+        os.path.join(data_dir, 'lfm'), week, retriever_params['dim'], index_type=retriever_params['index_type']
+    )
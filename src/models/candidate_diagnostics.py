@@ -0,0 +1,216 @@
+"""
+候选诊断模块
+
+把各训练周的候选与下一周的真实购买对齐，按策略统计：
+- recall：被该策略召回的(用户, 商品)购买占全部购买的比例
+- precision：该策略的不重复候选中被购买的比例
+- unique_recall：只有该策略召回的购买占全部购买的比例
+- 每个目标用户的候选数分位数
+
+候选和购买都用打包的(user, item) int64 key表示，用排序数组+二分查找求交集；
+热门候选（BroadcastCandidates）不展开，按用户和商品分别判断是否命中。
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from logzero import logger
+from typing import Any, Dict, List, Optional
+
+from data.store import DataStore, get_data_store
+from models.ann_retrieval import build_retriever, retriever_params_from_config
+from models.candidate_generation import CandidateGenerator, candidate_params_from_config
+from models.candidate_set import BroadcastCandidates, CandidateSet, isin_keys, pack_user_item, unpack_user_item
+from utils.config import DEFAULT_CONFIG_PATH, load_config
+
+# 候选数分位数
+PERCENTILES = (50, 90, 99)
+
+
+class CandidateDiagnostics:
+    """候选召回率和覆盖诊断"""
+
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（使用其中model段的候选和向量召回参数）
+        """
+        self.data_dir = data_dir
+        self.store = store if store is not None else get_data_store(os.path.join(data_dir, 'processed'))
+        self.candidate_params = candidate_params_from_config(config)
+        self.retriever_params = retriever_params_from_config(config)
+        self._generator: Optional[CandidateGenerator] = None
+
+    @property
+    def generator(self) -> CandidateGenerator:
+        """各周共用的候选生成器"""
+        if self._generator is None:
+            self._generator = CandidateGenerator(
+                self.store.table('transactions_train'), self.store.table('items'), store=self.store
+            )
+        return self._generator
+
+    @staticmethod
+    def _strategy_keys(candidates: CandidateSet) -> Dict[str, np.ndarray]:
+        """展开表示的候选：各策略不重复的(user, item) key"""
+        keys: Dict[str, List[np.ndarray]] = {}
+        for part in candidates.parts:
+            if isinstance(part, BroadcastCandidates):
+                continue
+            strategy = part['strategy'].values
+            part_keys = pack_user_item(part['user'].values, part['item'].values)
+            for name in pd.unique(strategy):
+                keys.setdefault(name, []).append(part_keys[strategy == name])
+        return {name: np.unique(np.concatenate(arrays)) for name, arrays in keys.items()}
+
+    def _union_per_user(self, candidates: CandidateSet, n_users: int) -> np.ndarray:
+        """全部策略合并后每个用户不重复的候选数（热门候选不展开，只扣除与展开候选的重叠）"""
+        keys = list(self._strategy_keys(candidates).values())
+        keys = np.unique(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+        users, items = unpack_user_item(keys)
+        per_user = np.bincount(users, minlength=n_users)
+        for part in candidates.parts:
+            if isinstance(part, BroadcastCandidates):
+                part_items = np.unique(part.items['item'].values)
+                overlap = np.isin(users, part.users) & np.isin(items, part_items)
+                per_user[part.users] += len(part_items)
+                per_user -= np.bincount(users[overlap], minlength=n_users)
+                users, items = users[~overlap], items[~overlap]
+        return per_user
+
+    def evaluate(self, candidates: CandidateSet, target_users: np.ndarray,
+                 label_keys: np.ndarray) -> pd.DataFrame:
+        """
+        按策略统计候选对真实购买的召回情况
+
+        Args:
+            candidates: 候选集合（create_candidates(compact=True)的结果）
+            target_users: 目标用户
+            label_keys: 真实购买的不重复(user, item) key
+
+        Returns:
+            每个策略一行，最后一行为全部策略合并（strategy为'all'）
+        """
+        n_users = self.store.n_users
+        label_users, label_items = unpack_user_item(label_keys)
+        num_labels = len(label_keys)
+
+        stats = []
+        hits = []
+        for name, keys in self._strategy_keys(candidates).items():
+            user, _ = unpack_user_item(keys)
+            stats.append({
+                'strategy': name,
+                'candidates': len(keys),
+                'per_user': np.bincount(user, minlength=n_users)[target_users],
+            })
+            hits.append(isin_keys(label_keys, keys))
+        for part in candidates.parts:
+            if not isinstance(part, BroadcastCandidates):
+                continue
+            items = np.unique(part.items['item'].values)
+            per_user = np.zeros(n_users, dtype=np.int64)
+            per_user[part.users] = len(items)
+            stats.append({
+                'strategy': part.strategy,
+                'candidates': len(part.users) * len(items),
+                'per_user': per_user[target_users],
+            })
+            hits.append(np.isin(label_users, part.users) & np.isin(label_items, items))
+
+        hits = np.vstack(hits) if hits else np.zeros((0, num_labels), dtype=bool)
+        hit_count = hits.sum(axis=0)
+        rows = []
+        for stat, hit in zip(stats, hits):
+            num_hits = int(hit.sum())
+            rows.append({
+                'strategy': stat['strategy'],
+                'candidates': stat['candidates'],
+                'hits': num_hits,
+                'recall': num_hits / max(num_labels, 1),
+                'precision': num_hits / max(stat['candidates'], 1),
+                'unique_recall': int((hit & (hit_count == 1)).sum()) / max(num_labels, 1),
+                **{f'per_user_p{p}': float(np.percentile(stat['per_user'], p)) if len(target_users) else 0.0
+                   for p in PERCENTILES},
+            })
+
+        # 全部策略合并
+        num_hits = int((hit_count > 0).sum())
+        per_user = self._union_per_user(candidates, n_users)[target_users]
+        num_candidates = int(per_user.sum())
+        rows.append({
+            'strategy': 'all',
+            'candidates': num_candidates,
+            'hits': num_hits,
+            'recall': num_hits / max(num_labels, 1),
+            'precision': num_hits / max(num_candidates, 1),
+            'unique_recall': np.nan,
+            **{f'per_user_p{p}': float(np.percentile(per_user, p)) if len(target_users) else 0.0
+               for p in PERCENTILES},
+        })
+        return pd.DataFrame(rows)
+
+    def evaluate_week(self, week: int) -> pd.DataFrame:
+        """
+        诊断一个训练周：候选来自 week >= week 的交易，真实购买为 week - 1 的购买
+
+        目标用户与训练时一致，为下一周有购买的用户。
+
+        Args:
+            week: 训练周（>= 1）
+
+        Returns:
+            各策略的诊断结果（含week列）
+        """
+        target = self.store.transactions_between(week - 1, 1, ['user', 'item'])
+        target_users = np.unique(target['user'].values)
+        label_keys = np.unique(pack_user_item(target['user'].values, target['item'].values))
+        retriever = build_retriever(self.data_dir, week, self.candidate_params, self.retriever_params)
+        candidates = self.generator.create_candidates(target_users, week, compact=True, retriever=retriever,
+                                                      **self.candidate_params)
+
+        result = self.evaluate(candidates, target_users, label_keys)
+        result.insert(0, 'week', week)
+        return result
+
+    def sweep(self, weeks: List[int]) -> pd.DataFrame:
+        """
+        依次诊断多个训练周
+
+        Args:
+            weeks: 训练周列表
+
+        Returns:
+            全部周的诊断结果
+        """
+        results = []
+        for week in weeks:
+            result = self.evaluate_week(week)
+            logger.info(f"候选诊断 week{week}:\n{result.to_string(index=False)}")
+            results.append(result)
+        return pd.concat(results, ignore_index=True)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='候选召回率诊断')
+    parser.add_argument('--data_dir', type=str, default='data', help='数据目录路径')
+    parser.add_argument('--config', type=str, default=DEFAULT_CONFIG_PATH, help='配置文件路径')
+    parser.add_argument('--weeks', type=int, nargs='+', default=[1, 2, 3, 4], help='训练周')
+    args = parser.parse_args()
+
+    diagnostics = CandidateDiagnostics(args.data_dir, config=load_config(args.config))
+    result = diagnostics.sweep(args.weeks)
+    output_path = os.path.join(args.data_dir, 'candidate_diagnostics.csv')
+    result.to_csv(output_path, index=False)
+    logger.info(f"诊断结果已保存: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
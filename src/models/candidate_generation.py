@@ -10,23 +10,102 @@
 
 import pandas as pd
 import numpy as np
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple, Optional, Union
 from logzero import logger
 
+from data.store import DataStore
+from data.transaction_index import TransactionIndex
+from models.candidate_kernels import repurchase_kernel
+from models.sharded_candidates import create_user_candidates_sharded
+from models.item2item import CoPurchaseIndex
+from models.candidate_set import (BroadcastCandidates, CandidateSet, anti_join, candidate_keys,
+                                  drop_duplicate_user_item, unpack_user_item)
+
+
+def candidate_params_from_config(config: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    配置中model段的候选参数（训练、推理和诊断共用，作为create_candidates的参数）
+    
+    Args:
+        config: 配置
+        
+    Returns:
+        候选参数
+    """
+    model_config = (config or {}).get('model') or {}
+    return {
+        'popular_num_items': int(model_config.get('popular_num_items', 60)),
+        'popular_weeks': int(model_config.get('popular_weeks', 1)),
+        'item2item_num_items': int(model_config.get('item2item_num_items', 12)),
+        'copurchase_num_items': int(model_config.get('copurchase_num_items', 12)),
+        'retriever_num_items': int(model_config.get('retriever_num_items', 12)),
+    }
+
 
 class CandidateGenerator:
     """候选生成器"""
     
-    def __init__(self, transactions: pd.DataFrame, items: pd.DataFrame):
+    def __init__(
+        self,
+        transactions: Optional[pd.DataFrame] = None,
+        items: Optional[pd.DataFrame] = None,
+        store: Optional[DataStore] = None,
+        engine: str = 'numpy'
+    ):
         """
         初始化候选生成器
         
         Args:
             transactions: 交易数据
             items: 商品数据
+            store: 共享数据仓库，未传入transactions/items时从中读取
+            engine: 计算引擎，'numpy'（数组实现）或 'pandas'（参考实现）
         """
-        self.transactions = transactions
-        self.items = items
+        if store is None and (transactions is None or items is None):
+            raise ValueError("需要传入transactions和items，或者传入store")
+        if engine not in ('numpy', 'pandas'):
+            raise ValueError(f"不支持的计算引擎: {engine}")
+        self.engine = engine
+        self.store = store
+        self.transactions = transactions if transactions is not None else store.table('transactions_train')
+        self.items = items if items is not None else store.table('items')
+        self._copurchase_indexes = {}
+        self._index: Optional[TransactionIndex] = None
+    
+    @property
+    def index(self) -> TransactionIndex:
+        """交易的时间分区索引（交易来自store时复用store的索引）"""
+        if self._index is None:
+            if self.store is not None and self.transactions is self.store.table('transactions_train'):
+                self._index = self.store.transaction_index()
+            else:
+                self._index = TransactionIndex(self.transactions, ['user', 'item', 'week', 'day'])
+        return self._index
+    
+    def _transactions_since(self, week_start: int, columns: List[str]) -> pd.DataFrame:
+        """筛选 week >= week_start 的交易（pandas引擎用query作为参考实现）"""
+        if self.engine == 'pandas':
+            return self.transactions.query(f"@week_start <= week")[columns]
+        return self.index.since(week_start, columns)
+    
+    def _transactions_between(self, week_start: int, num_weeks: int, columns: List[str]) -> pd.DataFrame:
+        """筛选 week_start <= week < week_start + num_weeks 的交易（pandas引擎用query作为参考实现）"""
+        if self.engine == 'pandas':
+            return self.transactions.query(
+                f"@week_start <= week < @week_start + @num_weeks"
+            )[columns]
+        return self.index.between(week_start, num_weeks, columns)
+    
+    def _unique_user_item(self, tr: pd.DataFrame) -> pd.DataFrame:
+        """按user-item去重，保留第一次出现的行（pandas引擎用drop_duplicates作为参考实现）"""
+        if self.engine == 'pandas':
+            return tr.drop_duplicates(['user', 'item'], ignore_index=True)
+        return drop_duplicate_user_item(tr)
+    
+    def _popular_items(self, tr: pd.DataFrame, num_items: int) -> np.ndarray:
+        """按购买用户数降序取热门商品（同数量按item升序，与交易行顺序无关）"""
+        volume = tr.groupby('item').size()
+        return volume.sort_values(ascending=False, kind='stable').index.values[:num_items]
     
     def create_candidates_repurchase(
         self, 
@@ -47,10 +126,47 @@ class CandidateGenerator:
         Returns:
             候选商品DataFrame
         """
+        if self.engine == 'pandas':
+            return self._create_candidates_repurchase_pandas(
+                strategy, target_users, week_start, max_items_per_user)
+        
+        # 筛选交易数据：用按user下标的布尔表代替isin
+        tr = self._transactions_since(week_start, ['user', 'item', 'week', 'day'])
+        user = tr['user'].values.astype(np.int64)
+        target_users = np.asarray(target_users, dtype=np.int64)
+        is_target = np.zeros(max(user.max(initial=-1), target_users.max(initial=-1)) + 1, dtype=bool)
+        is_target[target_users] = True
+        mask = is_target[user]
+        
+        result = repurchase_kernel(
+            user[mask],
+            tr['item'].values[mask].astype(np.int64),
+            tr['week'].values[mask].astype(np.int64),
+            tr['day'].values[mask].astype(np.int64),
+            max_items_per_user
+        )
+        
+        candidates = pd.DataFrame({
+            'user': result['user'].astype(tr['user'].dtype),
+            'item': result['item'].astype(tr['item'].dtype),
+            f'{strategy}_week_rank': result['week_rank'],
+            f'{strategy}_volume_rank': result['volume_rank'],
+            'rank_meta': result['rank_meta'],
+        })
+        candidates['strategy'] = strategy
+        return candidates
+    
+    def _create_candidates_repurchase_pandas(
+        self,
+        strategy: str,
+        target_users: np.ndarray,
+        week_start: int,
+        max_items_per_user: int = 1234567890
+    ) -> pd.DataFrame:
+        """创建重购候选（pandas参考实现，参数同create_candidates_repurchase）"""
         # 筛选交易数据
-        tr = self.transactions.query(
-            f"user in @target_users and @week_start <= week"
-        )[['user', 'item', 'week', 'day']].drop_duplicates(ignore_index=True)
+        tr = self._transactions_since(week_start, ['user', 'item', 'week', 'day'])
+        tr = tr[tr['user'].isin(target_users)].drop_duplicates(ignore_index=True)
         
         # 计算各种排名
         gr_day = tr.groupby(['user', 'item'])['day'].min().reset_index(name='day')
@@ -98,13 +214,15 @@ class CandidateGenerator:
         Returns:
             候选商品DataFrame
         """
+        if self.engine == 'numpy':
+            return self.create_candidates_popular_compact(
+                target_users, week_start, num_weeks, num_items).expand()
+        
         # 筛选时间窗口内的交易
-        tr = self.transactions.query(
-            f"@week_start <= week < @week_start + @num_weeks"
-        )[['user', 'item']].drop_duplicates(ignore_index=True)
+        tr = self._transactions_between(week_start, num_weeks, ['user', 'item']).drop_duplicates(ignore_index=True)
         
         # 获取热门商品
-        popular_items = tr['item'].value_counts().index.values[:num_items]
+        popular_items = self._popular_items(tr, num_items)
         popular_items_df = pd.DataFrame({
             'item': popular_items,
             'rank': range(num_items),
@@ -123,37 +241,146 @@ class CandidateGenerator:
         
         return candidates.drop_duplicates(ignore_index=True)
     
-    def create_candidates_category_popular(
+    def create_candidates_popular_compact(
+        self,
+        target_users: np.ndarray,
+        week_start: int,
+        num_weeks: int,
+        num_items: int
+    ) -> BroadcastCandidates:
+        """
+        创建热门商品候选（紧凑表示，只保存一份热门商品列表）
+        
+        Args:
+            target_users: 目标用户
+            week_start: 开始周数
+            num_weeks: 周数范围
+            num_items: 热门商品数量
+            
+        Returns:
+            热门商品候选
+        """
+        tr = self._unique_user_item(self._transactions_between(week_start, num_weeks, ['user', 'item']))
+        popular_items = self._popular_items(tr, num_items)
+        popular_items_df = pd.DataFrame({
+            'item': popular_items,
+            'pop_rank': np.arange(len(popular_items)),
+        })
+        return BroadcastCandidates(target_users, popular_items_df, 'pop')
+    
+    def copurchase_index(self, week_start: int, num_weeks: int, top_k: int = 50) -> CoPurchaseIndex:
+        """
+        获取时间窗口内的共同购买近邻索引（同一窗口只构建一次）
+        
+        Args:
+            week_start: 开始周数
+            num_weeks: 周数范围
+            top_k: 每个商品保留的近邻数
+            
+        Returns:
+            近邻索引
+        """
+        key = (week_start, num_weeks, top_k)
+        if key not in self._copurchase_indexes:
+            tr = self._transactions_between(week_start, num_weeks, ['user', 'item'])
+            self._copurchase_indexes[key] = CoPurchaseIndex.build(
+                tr['user'].values, tr['item'].values, len(self.items), top_k
+            )
+        return self._copurchase_indexes[key]
+    
+    def create_candidates_item2item(
+        self,
+        target_users: np.ndarray,
+        week_start: int,
+        num_items: int,
+        index_weeks: int = 4,
+        seed_weeks: int = 4,
+        top_k: int = 50
+    ) -> pd.DataFrame:
+        """
+        创建Item2Item候选：用户近期购买的商品通过共同购买近邻索引展开
+        
+        Args:
+            target_users: 目标用户
+            week_start: 开始周数
+            num_items: 每个用户最大商品数
+            index_weeks: 构建共同购买索引的周数范围
+            seed_weeks: 取用户近期购买作为种子的周数范围
+            top_k: 每个商品保留的近邻数
+            
+        Returns:
+            候选商品DataFrame
+        """
+        index = self.copurchase_index(week_start, index_weeks, top_k)
+        
+        seeds = self._transactions_between(week_start, seed_weeks, ['user', 'item'])
+        seeds = self._unique_user_item(seeds[np.isin(seeds['user'].values, target_users)])
+        result = index.expand(seeds['user'].values, seeds['item'].values, num_items)
+        
+        candidates = pd.DataFrame({
+            'user': result['user'],
+            'item': result['item'],
+            'item2item_score': result['score'],
+            'item2item_rank': result['rank'],
+        })
+        candidates['strategy'] = 'item2item'
+        return candidates
+    
+    def category_popular_items(
         self,
-        base_candidates: pd.DataFrame,
         week_start: int,
         num_weeks: int,
         num_items_per_category: int,
         category: str
     ) -> pd.DataFrame:
         """
-        创建类别热门候选
+        计算各类别内的热门商品（与用户无关）
         
         Args:
-            base_candidates: 基础候选
             week_start: 开始周数
             num_weeks: 周数范围
             num_items_per_category: 每个类别商品数
             category: 类别列名
             
         Returns:
-            候选商品DataFrame
+            包含item, category, cat_volume_rank列的DataFrame
         """
-        # 计算类别内热门商品
-        tr = self.transactions.query(
-            f"@week_start <= week < @week_start + @num_weeks"
-        )[['user', 'item']].drop_duplicates()
+        tr = self._unique_user_item(self._transactions_between(week_start, num_weeks, ['user', 'item']))
         
         tr = tr.groupby('item').size().reset_index(name='volume')
         tr = tr.merge(self.items[['item', category]], on='item')
         tr['cat_volume_rank'] = tr.groupby(category)['volume'].rank(ascending=False, method='min')
         tr = tr.query(f"cat_volume_rank <= @num_items_per_category").reset_index(drop=True)
-        tr = tr[['item', category, 'cat_volume_rank']].reset_index(drop=True)
+        return tr[['item', category, 'cat_volume_rank']].reset_index(drop=True)
+    
+    def create_candidates_category_popular(
+        self,
+        base_candidates: pd.DataFrame,
+        week_start: int,
+        num_weeks: int,
+        num_items_per_category: int,
+        category: str,
+        category_items: Optional[pd.DataFrame] = None
+    ) -> pd.DataFrame:
+        """
+        创建类别热门候选
+        
+        Args:
+            base_candidates: 基础候选
+            week_start: 开始周数
+            num_weeks: 周数范围
+            num_items_per_category: 每个类别商品数
+            category: 类别列名
+            category_items: 预先计算好的category_popular_items结果（分片执行时使用）
+            
+        Returns:
+            候选商品DataFrame
+        """
+        # 计算类别内热门商品
+        if category_items is None:
+            category_items = self.category_popular_items(
+                week_start, num_weeks, num_items_per_category, category)
+        tr = category_items
         
         # 合并到基础候选
         candidates = base_candidates[['user', 'item']].merge(
@@ -180,6 +407,9 @@ class CandidateGenerator:
         Returns:
             过滤后的候选
         """
+        if self.engine == 'numpy':
+            return anti_join(candidates_target, candidates_reference)
+        
         tmp = candidates_reference[['user', 'item']].reset_index(drop=True)
         tmp['flag'] = 1
         candidates = candidates_target.merge(tmp, on=['user', 'item'], how='left')
@@ -191,8 +421,13 @@ class CandidateGenerator:
         week: int,
         popular_num_items: int = 60,
         popular_weeks: int = 1,
-        item2item_num_items: int = 12
-    ) -> pd.DataFrame:
+        item2item_num_items: int = 12,
+        compact: bool = False,
+        num_workers: int = 1,
+        copurchase_num_items: int = 0,
+        retriever=None,
+        retriever_num_items: int = 0
+    ) -> Union[pd.DataFrame, CandidateSet]:
         """
         创建综合候选
         
@@ -202,22 +437,91 @@ class CandidateGenerator:
             popular_num_items: 热门商品数量
             popular_weeks: 热门商品时间窗口
             item2item_num_items: Item2Item商品数量
+            compact: 是否返回紧凑的CandidateSet（热门候选不展开）
+            num_workers: 大于1时将目标用户分片，用多进程并行生成与用户相关的候选
+            copurchase_num_items: 共同购买Item2Item候选的每用户商品数，0表示不使用
+            retriever: 向量召回检索器（ann_retrieval.EmbeddingRetriever），None表示不使用
+            retriever_num_items: 向量召回候选的每用户商品数
             
         Returns:
-            综合候选DataFrame
+            综合候选DataFrame，compact为True时返回CandidateSet
         """
         logger.info(f"创建候选 (week: {week})")
         
+        # 与用户无关的部分只计算一次
+        candidates_popular = self.create_candidates_popular_compact(
+            target_users, week, popular_weeks, popular_num_items
+        )
+        dept_items = self.category_popular_items(week, 1, 6, 'department_no_idx')
+        
+        # 与用户相关的候选：重购、Item2Item、类别热门
+        if num_workers > 1:
+            candidates_repurchase, candidates_dept = create_user_candidates_sharded(
+                self, target_users, week, item2item_num_items, dept_items, num_workers
+            )
+        else:
+            candidates_repurchase, candidates_dept = self.create_user_candidates(
+                target_users, week, item2item_num_items, dept_items
+            )
+        
+        # 共同购买Item2Item候选
+        candidates_item2item = None
+        if copurchase_num_items > 0:
+            candidates_item2item = self.create_candidates_item2item(
+                target_users, week, copurchase_num_items
+            )
+            candidates_item2item = self.drop_common_user_item(candidates_item2item, candidates_repurchase)
+        
+        # 向量召回候选
+        candidates_lfm = None
+        if retriever is not None and retriever_num_items > 0:
+            candidates_lfm = retriever.create_candidates(target_users, retriever_num_items)
+            candidates_lfm = self.drop_common_user_item(candidates_lfm, candidates_repurchase)
+        
+        # 删除meta列
+        candidates_explicit = []
+        for part in [candidates_repurchase, candidates_dept, candidates_item2item, candidates_lfm]:
+            if part is None:
+                continue
+            meta_columns = [c for c in part.columns if c.endswith('_meta')]
+            candidates_explicit.append(part.drop(meta_columns, axis=1))
+        
+        # 合并所有候选（热门候选保持紧凑表示）
+        candidates = CandidateSet(
+            candidates_explicit[:1] + [candidates_popular] + candidates_explicit[1:]
+        )
+        
+        # 统计信息
+        logger.info(f"候选数量: {len(candidates)}")
+        logger.info(f"重复率: {len(candidates) / self._count_unique_user_item(candidates)}")
+        logger.info(f"策略分布:\n{candidates.strategy_volumes()}")
+        
+        return candidates if compact else candidates.to_frame()
+    
+    def create_user_candidates(
+        self,
+        target_users: np.ndarray,
+        week: int,
+        item2item_num_items: int,
+        dept_items: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        创建与用户相关的候选（各用户之间互不影响，可按用户分片执行）
+        
+        Args:
+            target_users: 目标用户
+            week: 时间窗口
+            item2item_num_items: Item2Item商品数量
+            dept_items: 各department内的热门商品（category_popular_items的结果）
+            
+        Returns:
+            (重购候选, 类别热门候选)
+        """
         # 重购候选
         candidates_repurchase = self.create_candidates_repurchase(
             'repurchase', target_users, week
         )
         
-        # 热门候选
-        candidates_popular = self.create_candidates_popular(
-            target_users, week, popular_weeks, popular_num_items
-        )
-        
         # Item2Item候选
         candidates_item2item2 = self.create_candidates_repurchase(
             'item2item2', target_users, week, item2item_num_items
@@ -225,27 +529,25 @@ class CandidateGenerator:
         
         # 类别热门候选
         candidates_dept = self.create_candidates_category_popular(
-            self.transactions, self.items, candidates_item2item2, week, 1, 6, 'department_no_idx'
+            candidates_item2item2, week, 1, 6, 'department_no_idx', category_items=dept_items
         )
         candidates_dept = self.drop_common_user_item(candidates_dept, candidates_repurchase)
         
-        # 合并所有候选
-        candidates = pd.concat([
-            candidates_repurchase,
-            candidates_popular,
-            candidates_dept,
-        ])
-        
-        # 统计信息
-        logger.info(f"候选数量: {len(candidates)}")
-        logger.info(f"重复率: {len(candidates) / len(candidates[['user', 'item']].drop_duplicates())}")
-        
-        volumes = candidates.groupby('strategy').size().reset_index(name='volume').sort_values(
-            by='volume', ascending=False
-        ).reset_index(drop=True)
-        volumes['ratio'] = volumes['volume'] / volumes['volume'].sum()
-        logger.info(f"策略分布:\n{volumes}")
+        return candidates_repurchase, candidates_dept
+    
+    def _count_unique_user_item(self, candidates: CandidateSet) -> int:
+        """统计候选集合中不重复的user-item对数量（基于user-item key，热门候选不展开）"""
+        keys = np.unique(np.concatenate([
+            candidate_keys(part) for part in candidates.parts
+            if not isinstance(part, BroadcastCandidates)
+        ]))
+        users, items = unpack_user_item(keys)
         
-        # 删除meta列
-        meta_columns = [c for c in candidates.columns if c.endswith('_meta')]
-        return candidates.drop(meta_columns, axis=1)
+        num_unique = len(keys)
+        for part in candidates.parts:
+            if isinstance(part, BroadcastCandidates):
+                # 已计入的key中属于该热门候选的部分不重复计数
+                overlap = np.isin(users, part.users) & np.isin(items, part.items['item'].values)
+                num_unique += len(part) - int(overlap.sum())
+                users, items = users[~overlap], items[~overlap]
+        return num_unique
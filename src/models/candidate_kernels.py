@@ -0,0 +1,162 @@
+"""
+候选生成数组计算模块
+
+基于NumPy数组的分组排名等向量化计算，替代pandas的groupby/rank/merge
+"""
+
+import numpy as np
+from typing import Dict
+
+
+def run_starts(*keys: np.ndarray) -> np.ndarray:
+    """
+    计算已排序数组中每段相同key的起始位置
+
+    Args:
+        *keys: 已按字典序排好的若干key数组
+
+    Returns:
+        每段的起始下标
+    """
+    n = len(keys[0])
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    changed = np.zeros(n, dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(changed)
+
+
+def sort_order(*keys: np.ndarray) -> np.ndarray:
+    """
+    按若干整数key字典序排序（第一个key优先）
+
+    各key的取值范围能压进一个int64时，合并成单个key做一次argsort，否则退回lexsort。
+
+    Args:
+        *keys: 整数key数组
+
+    Returns:
+        排序下标
+    """
+    if len(keys[0]) == 0:
+        return np.zeros(0, dtype=np.int64)
+    lows = [int(k.min()) for k in keys]
+    bits = [max(int(k.max()) - low, 0).bit_length() for k, low in zip(keys, lows)]
+    if sum(bits) > 63:
+        return np.lexsort(keys[::-1])
+
+    packed = np.zeros(len(keys[0]), dtype=np.int64)
+    for key, low, b in zip(keys, lows, bits):
+        packed <<= b
+        packed |= key.astype(np.int64) - low
+    return np.argsort(packed)
+
+
+def grouped_rank(
+    groups: np.ndarray,
+    values: np.ndarray,
+    method: str = 'average',
+    ascending: bool = True
+) -> np.ndarray:
+    """
+    组内排名，结果与 df.groupby(groups)[values].rank(method, ascending) 一致
+
+    Args:
+        groups: 分组key
+        values: 排名的值
+        method: 'average' 或 'min'
+        ascending: 是否升序
+
+    Returns:
+        与输入对齐的排名（float64，从1开始）
+    """
+    n = len(groups)
+    ranks = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return ranks
+
+    sort_values = values if ascending else -values
+    if sort_values.dtype.kind in 'iu':
+        order = sort_order(groups, sort_values)
+    else:
+        order = np.lexsort((sort_values, groups))
+    g = groups[order]
+    v = sort_values[order]
+
+    # 每个分组内的位置（从0开始）
+    group_starts = run_starts(g)
+    group_lengths = np.diff(np.append(group_starts, n))
+    position = np.arange(n) - np.repeat(group_starts, group_lengths)
+
+    # 并列值取同一排名
+    tie_starts = run_starts(g, v)
+    tie_lengths = np.diff(np.append(tie_starts, n))
+    first = position[tie_starts]
+    if method == 'average':
+        tie_rank = first + (tie_lengths + 1) / 2.0
+    elif method == 'min':
+        tie_rank = first + 1.0
+    else:
+        raise ValueError(f"不支持的排名方式: {method}")
+
+    ranks[order] = np.repeat(tie_rank, tie_lengths)
+    return ranks
+
+
+def repurchase_kernel(
+    user: np.ndarray,
+    item: np.ndarray,
+    week: np.ndarray,
+    day: np.ndarray,
+    max_items_per_user: int
+) -> Dict[str, np.ndarray]:
+    """
+    单次排序计算重购候选
+
+    按(user, item, day, week)排序一次，在同一组数组上得到每个user-item的
+    最早day/week、购买天数以及组内排名，并截取每个用户的top商品。
+
+    Args:
+        user: 交易的用户ID
+        item: 交易的商品ID
+        week: 交易所在周
+        day: 交易所在天
+        max_items_per_user: 每个用户最大商品数
+
+    Returns:
+        列名到数组的字典：user, item, week_rank, volume_rank, rank_meta（按user, item排序）
+    """
+    order = sort_order(user, item, day, week)
+    user, item, week, day = user[order], item[order], week[order], day[order]
+
+    # 去掉重复的(user, item, week, day)
+    unique_rows = run_starts(user, item, week, day)
+    user, item, week, day = user[unique_rows], item[unique_rows], week[unique_rows], day[unique_rows]
+
+    # 每个user-item的聚合：排序后组内第一行即最早的day
+    pair_starts = run_starts(user, item)
+    pair_user = user[pair_starts]
+    pair_item = item[pair_starts]
+    pair_day = day[pair_starts]
+    pair_week = np.minimum.reduceat(week, pair_starts) if len(pair_starts) else week[:0]
+    pair_volume = np.diff(np.append(pair_starts, len(user)))
+
+    day_rank = grouped_rank(pair_user, pair_day)
+    week_rank = grouped_rank(pair_user, pair_week)
+    volume_rank = grouped_rank(pair_user, pair_volume, ascending=False)
+
+    # 10**9 * day_rank + volume_rank，排名都是0.5的整数倍，乘2后用整数排序
+    rank_meta_key = (2 * 10**9 * day_rank + 2 * volume_rank).astype(np.int64)
+    rank_meta = grouped_rank(pair_user, rank_meta_key, method='min')
+
+    keep = rank_meta <= max_items_per_user
+    return {
+        'user': pair_user[keep],
+        'item': pair_item[keep],
+        'week_rank': week_rank[keep],
+        'volume_rank': volume_rank[keep],
+        'rank_meta': rank_meta[keep],
+    }
+
@@ -0,0 +1,224 @@
+"""
+候选集合模块
+
+候选的紧凑表示：
+- 与用户无关的策略（如全局热门）只保存一份商品列表和排名，
+  需要时再按用户分块展开，内存与耗时只随商品数增长
+- 与用户相关的策略保存为普通的DataFrame
+
+以及基于(user, item)合并int64 key的去重、反连接等向量化操作
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional, Tuple, Union
+
+# user-item合并key中item所占的位数
+ITEM_BITS = 32
+
+
+def pack_user_item(user: np.ndarray, item: np.ndarray) -> np.ndarray:
+    """
+    将(user, item)合并为单个int64 key
+
+    Args:
+        user: 用户ID（非负）
+        item: 商品ID（非负，小于2^32）
+
+    Returns:
+        int64 key
+    """
+    return (np.asarray(user, dtype=np.int64) << ITEM_BITS) | np.asarray(item, dtype=np.int64)
+
+
+def unpack_user_item(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    将int64 key拆回(user, item)
+
+    Args:
+        keys: pack_user_item生成的key
+
+    Returns:
+        (用户ID, 商品ID)
+    """
+    return keys >> ITEM_BITS, keys & ((1 << ITEM_BITS) - 1)
+
+
+def candidate_keys(candidates: pd.DataFrame) -> np.ndarray:
+    """候选DataFrame的user-item key"""
+    return pack_user_item(candidates['user'].values, candidates['item'].values)
+
+
+def isin_keys(keys: np.ndarray, reference_keys: np.ndarray) -> np.ndarray:
+    """
+    判断keys中每个元素是否出现在reference_keys中（排序数组+二分查找）
+
+    Args:
+        keys: 待判断的key
+        reference_keys: 参考key（可以无序、可以重复）
+
+    Returns:
+        布尔数组
+    """
+    reference = np.unique(reference_keys)
+    if len(reference) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(reference, keys), len(reference) - 1)
+    return reference[positions] == keys
+
+
+def anti_join(candidates: pd.DataFrame, reference: pd.DataFrame) -> pd.DataFrame:
+    """
+    去掉candidates中在reference里出现过的user-item对（保持原顺序）
+
+    Args:
+        candidates: 目标候选
+        reference: 参考候选
+
+    Returns:
+        过滤后的候选
+    """
+    mask = ~isin_keys(candidate_keys(candidates), candidate_keys(reference))
+    return candidates[mask].reset_index(drop=True)
+
+
+def first_occurrence_mask(keys: np.ndarray) -> np.ndarray:
+    """
+    每个key第一次出现的位置为True（与drop_duplicates(keep='first')一致）
+
+    Args:
+        keys: key数组
+
+    Returns:
+        布尔数组
+    """
+    _, first = np.unique(keys, return_index=True)
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[first] = True
+    return mask
+
+
+def drop_duplicate_user_item(candidates: pd.DataFrame) -> pd.DataFrame:
+    """按user-item去重，保留第一次出现的行"""
+    return candidates[first_occurrence_mask(candidate_keys(candidates))].reset_index(drop=True)
+
+
+class BroadcastCandidates:
+    """对所有目标用户相同的候选（用户 × 商品列表，不物化）"""
+
+    def __init__(self, users: np.ndarray, items: pd.DataFrame, strategy: str):
+        """
+        初始化
+
+        Args:
+            users: 目标用户（重复的用户只保留第一次出现）
+            items: 商品列表，包含item列以及排名等商品级别的列
+            strategy: 策略名称
+        """
+        self.users = pd.unique(np.asarray(users))
+        self.items = items.reset_index(drop=True)
+        self.strategy = strategy
+
+    def __len__(self) -> int:
+        return len(self.users) * len(self.items)
+
+    def expand(self, users: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        展开为user-item候选
+
+        Args:
+            users: 需要展开的用户（需为self.users的子集），默认全部用户
+
+        Returns:
+            候选DataFrame，按用户依次排列，每个用户内按商品列表顺序
+        """
+        if users is None:
+            users = self.users
+        n_items = len(self.items)
+        candidates = {'user': np.repeat(users, n_items)}
+        for col in self.items.columns:
+            candidates[col] = np.tile(self.items[col].values, len(users))
+        candidates = pd.DataFrame(candidates)
+        candidates['strategy'] = self.strategy
+        return candidates
+
+
+class CandidateSet:
+    """多个策略的候选集合（保持各策略的拼接顺序，按需展开）"""
+
+    def __init__(self, parts: List[Union[pd.DataFrame, BroadcastCandidates]]):
+        """
+        初始化
+
+        Args:
+            parts: 各策略的候选，DataFrame或BroadcastCandidates
+        """
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+    def strategy_volumes(self) -> pd.DataFrame:
+        """
+        各策略的候选数量（不展开）
+
+        Returns:
+            包含strategy, volume, ratio列的DataFrame，按volume降序
+        """
+        volumes = {}
+        for part in self.parts:
+            if isinstance(part, BroadcastCandidates):
+                volumes[part.strategy] = volumes.get(part.strategy, 0) + len(part)
+            else:
+                for strategy, volume in part['strategy'].value_counts().items():
+                    volumes[strategy] = volumes.get(strategy, 0) + volume
+        volumes = pd.DataFrame({'strategy': list(volumes.keys()), 'volume': list(volumes.values())})
+        volumes = volumes.sort_values(by='volume', ascending=False).reset_index(drop=True)
+        volumes['ratio'] = volumes['volume'] / volumes['volume'].sum()
+        return volumes
+
+    def to_frame(self) -> pd.DataFrame:
+        """展开全部候选为一个DataFrame"""
+        return pd.concat([
+            part.expand() if isinstance(part, BroadcastCandidates) else part
+            for part in self.parts
+        ])
+
+    def iter_chunks(self, num_users: int) -> Iterator[pd.DataFrame]:
+        """
+        按用户ID区间分块展开候选
+
+        每块只包含user在[start, start + num_users)内的候选，块内各策略顺序与to_frame一致。
+
+        Args:
+            num_users: 每块的用户ID区间长度
+
+        Yields:
+            候选DataFrame
+        """
+        # 各部分按user排序一次，之后每块用二分查找切片
+        sorted_parts = []
+        max_user = -1
+        for part in self.parts:
+            if isinstance(part, BroadcastCandidates):
+                users = np.sort(part.users)
+                sorted_parts.append((part, users))
+            else:
+                part = part.iloc[np.argsort(part['user'].values, kind='stable')]
+                users = part['user'].values
+                sorted_parts.append((part, users))
+            if len(users):
+                max_user = max(max_user, int(users[-1]))
+
+        for start in range(0, max_user + 1, num_users):
+            chunk = []
+            for part, users in sorted_parts:
+                lo, hi = np.searchsorted(users, [start, start + num_users])
+                if hi == lo:
+                    continue
+                if isinstance(part, BroadcastCandidates):
+                    chunk.append(part.expand(users[lo:hi]))
+                else:
+                    chunk.append(part.iloc[lo:hi])
+            if chunk:
+                yield pd.concat(chunk, ignore_index=True)
@@ -0,0 +1,271 @@
+"""
+批量推理模块
+
+用训练好的排序模型为全部用户生成top-12推荐，并写出提交文件：
+- 用户按ID区间分片，每个分片独立生成候选、拼接特征、打分，峰值内存只与分片大小有关
+- 每个用户的候选连续存放，补齐成 (用户数, 最大候选数) 的矩阵后用argpartition取top-K，
+  不做全量排序和groupby
+- 候选不足K个（包括没有候选）的用户用热门商品补齐
+- 稠密ID通过mp_customer_id.pkl / mp_article_id.pkl映射回原始ID，逐分片写入CSV
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from catboost import CatBoost
+from logzero import logger
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from data.store import DataStore, get_data_store
+from features.embedding_store import lightfm_feature_dim
+from features.feature_assembly import build_feature_assembler
+from models.ann_retrieval import EmbeddingRetriever, build_retriever, retriever_params_from_config
+from models.candidate_generation import CandidateGenerator, candidate_params_from_config
+from models.candidate_kernels import run_starts
+from models.candidate_set import first_occurrence_mask, pack_user_item
+from models.training import candidate_feature_columns, merge_candidate_rows
+
+
+def load_ranker(model_dir: str) -> Tuple[Callable[[np.ndarray], np.ndarray], Dict[str, Any]]:
+    """
+    读取训练阶段保存的排序模型
+
+    Args:
+        model_dir: 模型目录（包含features.json）
+
+    Returns:
+        (打分函数：特征矩阵 -> 分数, 特征清单)
+    """
+    with open(os.path.join(model_dir, 'features.json')) as f:
+        manifest = json.load(f)
+    if manifest['backend'] == 'LightGBM':
+        booster = lgb.Booster(model_file=manifest['model_path'])
+        return booster.predict, manifest
+    model = CatBoost()
+    model.load_model(manifest['model_path'])
+    return model.predict, manifest
+
+
+def load_id_mapping(processed_dir: str, name: str) -> np.ndarray:
+    """
+    稠密ID到原始ID的映射数组
+
+    Args:
+        processed_dir: processed目录
+        name: customer_id 或 article_id
+
+    Returns:
+        ids[稠密ID] = 原始ID（字符串）
+    """
+    mp = pd.read_pickle(os.path.join(processed_dir, f'mp_{name}.pkl'))
+    ids = np.empty(len(mp), dtype=object)
+    ids[mp['idx'].values] = mp['val'].astype(str).values
+    return ids.astype(str)
+
+
+def top_k_per_user(user: np.ndarray, item: np.ndarray, score: np.ndarray,
+                   k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    每个用户分数最高的K个商品
+
+    同一用户的候选必须连续存放。候选补齐成 (用户数, 最大候选数) 的矩阵，
+    用argpartition取出前K个，再只对这K个排序。
+
+    Args:
+        user: 用户ID（同一用户连续）
+        item: 商品ID
+        score: 分数
+        k: 每个用户的商品数
+
+    Returns:
+        (user, item, 名次)，每个用户按名次升序，最多K行
+    """
+    if len(user) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    starts = run_starts(user)
+    lengths = np.diff(np.append(starts, len(user)))
+    width = int(lengths.max())
+    position = np.arange(len(user)) - np.repeat(starts, lengths)
+    group = np.repeat(np.arange(len(starts)), lengths)
+
+    padded = np.full((len(starts), width), -np.inf)
+    padded[group, position] = score
+    index = np.full((len(starts), width), -1, dtype=np.int64)
+    index[group, position] = np.arange(len(user))
+
+    k = min(k, width)
+    if k < width:
+        top = np.argpartition(-padded, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(width), (len(starts), width))
+    order = np.argsort(-np.take_along_axis(padded, top, axis=1), axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+
+    rows = np.take_along_axis(index, top, axis=1)
+    rank = np.broadcast_to(np.arange(k), rows.shape)
+    valid = rows >= 0
+    rows = rows[valid]
+    return user[rows], item[rows], rank[valid]
+
+
+def fill_with_popular(users: np.ndarray, user: np.ndarray, item: np.ndarray, rank: np.ndarray,
+                      popular_items: np.ndarray, k: int) -> np.ndarray:
+    """
+    用热门商品补齐推荐列表
+
+    Args:
+        users: 分片内的全部用户
+        user: 已推荐的用户ID
+        item: 已推荐的商品ID
+        rank: 名次（0..K-1）
+        popular_items: 热门商品（按热度降序，至少K个时每个用户都能补满）
+        k: 每个用户的商品数
+
+    Returns:
+        (len(users), K) 的商品ID矩阵，行与users对应；热门商品不足时用-1填充
+    """
+    n_popular = len(popular_items)
+    # 已推荐的商品在前，热门商品在后，去掉重复后每个用户取前K个
+    all_user = np.concatenate([user, np.repeat(users, n_popular)])
+    all_item = np.concatenate([item, np.tile(popular_items, len(users))])
+    all_rank = np.concatenate([rank, np.tile(np.arange(k, k + n_popular), len(users))])
+
+    order = np.lexsort((all_rank, all_user))
+    all_user, all_item = all_user[order], all_item[order]
+    keep = first_occurrence_mask(pack_user_item(all_user, all_item))
+    all_user, all_item = all_user[keep], all_item[keep]
+
+    starts = run_starts(all_user)
+    lengths = np.diff(np.append(starts, len(all_user)))
+    position = np.arange(len(all_user)) - np.repeat(starts, lengths)
+    keep = position < k
+
+    result = np.full((len(users), k), -1, dtype=np.int64)
+    row = np.searchsorted(users, all_user[keep])
+    result[row, position[keep]] = all_item[keep]
+    return result
+
+
+class BatchPredictor:
+    """分片批量推理"""
+
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None, shard_users: int = 100_000, k: int = 12):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（使用其中model段的候选和向量召回参数、lightfm段的特征维度）
+            shard_users: 每个分片的用户ID区间长度
+            k: 每个用户的推荐数
+        """
+        self.data_dir = data_dir
+        self.processed_dir = os.path.join(data_dir, 'processed')
+        self.store = store if store is not None else get_data_store(self.processed_dir)
+        self.candidate_params = candidate_params_from_config(config)
+        self.candidate_columns = candidate_feature_columns(self.candidate_params)
+        self.lfm_dim = lightfm_feature_dim(config)
+        self.retriever_params = retriever_params_from_config(config)
+        self._retrievers: Dict[int, Optional[EmbeddingRetriever]] = {}
+        self.shard_users = shard_users
+        self.k = k
+
+    def retriever(self, week: int) -> Optional[EmbeddingRetriever]:
+        """候选周的向量召回检索器（未启用时为None，每周只构建一次）"""
+        if week not in self._retrievers:
+            self._retrievers[week] = build_retriever(
+                self.data_dir, week, self.candidate_params, self.retriever_params
+            )
+        return self._retrievers[week]
+
+    def predict(self, output_path: str, week: int = 0) -> None:
+        """
+        为全部用户生成推荐并写出提交文件
+
+        Args:
+            output_path: 提交文件路径（CSV：customer_id,prediction）
+            week: 候选和特征使用的时间窗口（week >= week 的交易）
+        """
+        score_fn, manifest = load_ranker(os.path.join(self.data_dir, 'models'))
+        assembler = build_feature_assembler(
+            self.data_dir, week, self.store, lfm_dim=self.lfm_dim, candidate_columns=self.candidate_columns
+        )
+        if assembler.columns != manifest['columns']:
+            raise ValueError("推理特征列与训练时不一致，请检查week的特征产物是否齐全")
+
+        customer_ids = load_id_mapping(self.processed_dir, 'customer_id')
+        article_ids = load_id_mapping(self.processed_dir, 'article_id')
+        generator = CandidateGenerator(
+            self.store.table('transactions_train'), self.store.table('items'), store=self.store
+        )
+        popular_items = generator.create_candidates_popular_compact(
+            np.zeros(0, dtype=np.int64), week, self.candidate_params['popular_weeks'], self.k
+        ).items['item'].values
+
+        n_users = self.store.n_users
+        with open(output_path, 'w') as f:
+            f.write('customer_id,prediction\n')
+            for start in range(0, n_users, self.shard_users):
+                users = np.arange(start, min(start + self.shard_users, n_users))
+                recommendations = self._predict_shard(generator, assembler, score_fn, users, week, popular_items)
+                self._write_shard(f, customer_ids[users], article_ids, recommendations)
+                logger.info(f"推理进度: {users[-1] + 1}/{n_users}")
+        logger.info(f"提交文件已保存: {output_path}")
+
+    def shard_features(self, generator: CandidateGenerator, assembler, users: np.ndarray,
+                       week: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一个分片的候选和特征
+
+        Args:
+            generator: 候选生成器
+            assembler: 特征拼接器
+            users: 分片内的用户
+            week: 时间窗口
+
+        Returns:
+            (user, item, 特征矩阵)，按(user, item)排序
+        """
+        candidates = generator.create_candidates(users, week, retriever=self.retriever(week), **self.candidate_params)
+        user, item, values = merge_candidate_rows(candidates, self.candidate_columns)
+        del candidates
+        features = assembler.assemble(
+            user, item, pd.DataFrame(values, columns=self.candidate_columns, copy=False)
+        )
+        return user, item, features
+
+    def _predict_shard(self, generator: CandidateGenerator, assembler, score_fn,
+                       users: np.ndarray, week: int, popular_items: np.ndarray) -> np.ndarray:
+        """一个分片：生成候选、拼接特征、打分、取top-K、补齐"""
+        user, item, features = self.shard_features(generator, assembler, users, week)
+        score = np.asarray(score_fn(features), dtype=np.float64)
+        del features
+        top_user, top_item, rank = top_k_per_user(user, item, score, self.k)
+        return fill_with_popular(users, top_user, top_item, rank, popular_items, self.k)
+
+    @staticmethod
+    def _write_shard(f, customer_ids: np.ndarray, article_ids: np.ndarray, recommendations: np.ndarray) -> None:
+        """将一个分片的推荐写入CSV"""
+        lines = customer_ids.astype(object) + ','
+        for j in range(recommendations.shape[1]):
+            column = recommendations[:, j]
+            articles = np.where(column >= 0, article_ids[np.maximum(column, 0)], '').astype(object)
+            separator = np.where((column >= 0) & (j > 0), ' ', '').astype(object)
+            lines = lines + separator + articles
+        f.write('\n'.join(lines))
+        f.write('\n')
+
+
+def main():
+    """主函数"""
+    predictor = BatchPredictor("data")
+    predictor.predict(os.path.join("data", "submission.csv"))
+
+
+if __name__ == "__main__":
+    main()
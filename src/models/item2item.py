@@ -0,0 +1,164 @@
+"""
+Item2Item共同购买模块
+
+基于时间窗口内的共同购买关系构建商品近邻索引：
+- 用户×商品稀疏矩阵的转置乘积得到商品×商品共同购买次数
+- 按商品分块计算，内存只与分块大小有关
+- 每个商品只保留top-K近邻，保存为CSR结构（indptr, indices, scores）
+- 用户的近期购买商品通过索引展开为候选，全部为向量化计算
+"""
+
+import numpy as np
+from scipy import sparse
+from logzero import logger
+from typing import Dict
+
+from models.candidate_kernels import grouped_rank, run_starts
+from models.candidate_set import isin_keys, pack_user_item, unpack_user_item
+
+
+class CoPurchaseIndex:
+    """商品共同购买近邻索引（CSR结构）"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, scores: np.ndarray):
+        """
+        初始化
+
+        Args:
+            indptr: 商品i的近邻为indices[indptr[i]:indptr[i + 1]]
+            indices: 近邻商品ID（每个商品内按分数降序）
+            scores: 近邻的共同购买分数
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def n_items(self) -> int:
+        return len(self.indptr) - 1
+
+    @classmethod
+    def build(
+        cls,
+        user: np.ndarray,
+        item: np.ndarray,
+        n_items: int,
+        top_k: int = 50,
+        block_size: int = 1024
+    ) -> 'CoPurchaseIndex':
+        """
+        由交易构建共同购买近邻索引
+
+        Args:
+            user: 交易的用户ID
+            item: 交易的商品ID
+            n_items: 商品总数
+            top_k: 每个商品保留的近邻数
+            block_size: 每次计算的商品行数（控制内存上限）
+
+        Returns:
+            近邻索引
+        """
+        keys = np.unique(pack_user_item(user, item))
+        user, item = unpack_user_item(keys)
+        n_users = int(user.max()) + 1 if len(user) else 0
+
+        # 用户×商品购买矩阵，及其转置（商品×用户）
+        user_item = sparse.csr_matrix(
+            (np.ones(len(keys), dtype=np.float32), (user, item)), shape=(n_users, n_items)
+        )
+        item_user = user_item.T.tocsr()
+
+        counts = np.zeros(n_items, dtype=np.int64)
+        indices, scores = [], []
+        for block_start in range(0, n_items, block_size):
+            block_end = min(block_start + block_size, n_items)
+            co = (item_user[block_start:block_end] @ user_item).tocoo()
+            rows = co.row.astype(np.int64) + block_start
+            cols = co.col.astype(np.int64)
+            vals = co.data
+
+            # 去掉自身，按行内分数降序（同分按商品ID升序）保留top-K
+            keep = rows != cols
+            rows, cols, vals = rows[keep], cols[keep], vals[keep]
+            order = np.lexsort((cols, -vals, rows))
+            rows, cols, vals = rows[order], cols[order], vals[order]
+            starts = run_starts(rows)
+            lengths = np.diff(np.append(starts, len(rows)))
+            position = np.arange(len(rows)) - np.repeat(starts, lengths)
+            keep = position < top_k
+
+            counts += np.bincount(rows[keep], minlength=n_items)
+            indices.append(cols[keep].astype(np.int32))
+            scores.append(vals[keep].astype(np.float32))
+
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        index = cls(
+            indptr,
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+            np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+        )
+        logger.info(f"共同购买索引: {n_items}个商品, {len(index.indices)}条近邻")
+        return index
+
+    def save(self, path: str) -> None:
+        """保存索引"""
+        np.savez(path, indptr=self.indptr, indices=self.indices, scores=self.scores)
+
+    @classmethod
+    def load(cls, path: str) -> 'CoPurchaseIndex':
+        """读取索引"""
+        data = np.load(path)
+        return cls(data['indptr'], data['indices'], data['scores'])
+
+    def neighbors(self, item: int) -> np.ndarray:
+        """商品的近邻"""
+        return self.indices[self.indptr[item]:self.indptr[item + 1]]
+
+    def expand(
+        self,
+        seed_user: np.ndarray,
+        seed_item: np.ndarray,
+        max_items_per_user: int,
+        exclude_seeds: bool = True
+    ) -> Dict[str, np.ndarray]:
+        """
+        将用户的种子商品通过近邻索引展开为候选
+
+        同一用户从多个种子得到的同一商品，分数相加。
+
+        Args:
+            seed_user: 种子的用户ID
+            seed_item: 种子商品ID
+            max_items_per_user: 每个用户最大商品数
+            exclude_seeds: 是否去掉用户自己的种子商品
+
+        Returns:
+            列名到数组的字典：user, item, score, rank（按user, item排序）
+        """
+        seed_item = np.asarray(seed_item, dtype=np.int64)
+        starts = self.indptr[seed_item]
+        lengths = self.indptr[seed_item + 1] - starts
+
+        # 每个种子的近邻区间拼接成一次gather
+        total = int(lengths.sum())
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+        users = np.repeat(np.asarray(seed_user, dtype=np.int64), lengths)
+
+        keys = pack_user_item(users, self.indices[offsets])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        score = np.bincount(inverse, weights=self.scores[offsets], minlength=len(keys))
+
+        if exclude_seeds:
+            keep = ~isin_keys(keys, pack_user_item(seed_user, seed_item))
+            keys, score = keys[keep], score[keep]
+
+        user, item = unpack_user_item(keys)
+        rank = grouped_rank(user, score, method='min', ascending=False)
+        keep = rank <= max_items_per_user
+        return {
+            'user': user[keep],
+            'item': item[keep],
+            'score': score[keep],
+            'rank': rank[keep],
+        }
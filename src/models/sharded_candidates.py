@@ -0,0 +1,147 @@
+"""
+分片并行候选生成模块
+
+将目标用户切分为多个分片，用进程池并行生成与用户相关的候选：
+- 交易索引中时间窗口内按user排序的交易放入共享内存，各进程直接映射，不通过pickle传输
+- 每个分片只看到自己用户范围内的交易切片
+- 与用户无关的部分（热门商品、类别热门商品表）在主进程计算一次
+"""
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from logzero import logger
+from typing import Dict, List, Optional, Tuple
+
+
+class SharedArrays:
+    """放在共享内存中的一组NumPy数组"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        """
+        将数组复制到共享内存
+
+        Args:
+            arrays: 数组名到数组的字典
+        """
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self._blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        """释放共享内存"""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> 'SharedArrays':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach_shared_arrays(spec: Dict[str, tuple]) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    """
+    在子进程中映射共享内存数组
+
+    Args:
+        spec: SharedArrays.spec
+
+    Returns:
+        (数组字典, 共享内存句柄列表；使用完数组后需要close)
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+    return arrays, blocks
+
+
+def _create_shard_candidates(
+    generator_cls: type,
+    engine: str,
+    spec: Dict[str, tuple],
+    start: int,
+    end: int,
+    shard_users: np.ndarray,
+    items: pd.DataFrame,
+    week: int,
+    item2item_num_items: int,
+    dept_items: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """子进程：为一个用户分片生成候选"""
+    arrays, blocks = attach_shared_arrays(spec)
+    try:
+        transactions = pd.DataFrame({k: v[start:end] for k, v in arrays.items()}, copy=False)
+        generator = generator_cls(transactions, items, engine=engine)
+        candidates_repurchase, candidates_dept = generator.create_user_candidates(
+            shard_users, week, item2item_num_items, dept_items
+        )
+        # 返回结果前断开对共享内存的引用
+        candidates_repurchase = candidates_repurchase.copy()
+        candidates_dept = candidates_dept.copy()
+        del generator, transactions, arrays
+    finally:
+        for block in blocks:
+            block.close()
+    return candidates_repurchase, candidates_dept
+
+
+def create_user_candidates_sharded(
+    generator,
+    target_users: np.ndarray,
+    week: int,
+    item2item_num_items: int,
+    dept_items: pd.DataFrame,
+    num_workers: int,
+    num_shards: Optional[int] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    分片并行执行CandidateGenerator.create_user_candidates
+
+    Args:
+        generator: CandidateGenerator
+        target_users: 目标用户
+        week: 时间窗口
+        item2item_num_items: Item2Item商品数量
+        dept_items: 各department内的热门商品
+        num_workers: 进程数
+        num_shards: 分片数，默认等于进程数
+
+    Returns:
+        (重购候选, 类别热门候选)，按分片顺序拼接
+    """
+    columns = ['user', 'item', 'week', 'day']
+
+    # 时间窗口内按user排序的交易，每个分片对应一段连续的行
+    window = generator.index.by_user(week)
+    arrays = {c: window.columns[c] for c in columns}
+
+    shards = [s for s in np.array_split(np.unique(target_users), num_shards or num_workers) if len(s)]
+    items = generator.items[['item', 'department_no_idx']]
+    logger.info(f"分片生成候选: {len(shards)}个分片, {num_workers}个进程")
+
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(max_workers=num_workers) as pool:
+        del arrays
+        futures = []
+        for shard in shards:
+            start, end = window.users_range(shard[0], shard[-1])
+            futures.append(pool.submit(
+                _create_shard_candidates, type(generator), generator.engine, shared.spec,
+                start, end, shard, items, week, item2item_num_items, dept_items
+            ))
+        results = [future.result() for future in futures]
+
+    candidates_repurchase = pd.concat([r[0] for r in results], ignore_index=True)
+    candidates_dept = pd.concat([r[1] for r in results], ignore_index=True)
+    return candidates_repurchase, candidates_dept
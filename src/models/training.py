@@ -0,0 +1,452 @@
+"""
+排序模型训练模块
+
+按周生成候选和特征，分块写入磁盘后训练排序模型：
+- 每个训练周的候选按用户区间分块，特征为连续的float32矩阵（.npy），
+  另存user/item/label；块内按(user, item)排序，同一用户的候选连续，构成一个排序组
+- 后端的原生数据集（LightGBM二进制数据集 / CatBoost量化Pool）按数据和参数的指纹缓存，
+  重新运行和调参时直接读取
+- 排序组为(周, 用户)：同一用户在不同训练周的候选属于不同的组
+- LightGBM通过Sequence按批读取内存映射的分块构建数据集，内存与训练集大小无关；
+  CatBoost（默认）没有分块构建Pool的接口，首次构建量化Pool时需要把全部训练周的特征读入内存
+- 最近的一周作为验证集做early stopping
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from catboost import CatBoost, Pool
+from logzero import logger
+from typing import Any, Dict, List, Optional, Tuple
+
+from data.storage import table_mtime
+from data.store import DataStore, get_data_store
+from features.embedding_store import lightfm_feature_dim
+from features.feature_assembly import build_feature_assembler
+from models.ann_retrieval import build_retriever, retriever_params_from_config
+from models.candidate_generation import CandidateGenerator, candidate_params_from_config
+from models.candidate_kernels import run_starts
+from models.candidate_set import isin_keys, pack_user_item, unpack_user_item
+from utils.config import load_config
+
+# 候选表中作为特征的列（各策略的排名和分数，没有该策略的候选为NaN）
+CANDIDATE_FEATURE_COLUMNS = [
+    'repurchase_week_rank', 'repurchase_volume_rank',
+    'pop_rank',
+    'item2item_score', 'item2item_rank',
+    'cat_volume', 'cat_volume_rank',
+    'lfm_rank',
+]
+
+# 可选策略的列：(create_candidates中控制该策略的参数, 列)，参数为0时策略不启用，列不作为特征
+OPTIONAL_CANDIDATE_COLUMNS = [
+    ('copurchase_num_items', ['item2item_score', 'item2item_rank']),
+    ('retriever_num_items', ['lfm_rank']),
+]
+
+BACKENDS = ('LightGBM', 'CatBoost')
+
+
+def candidate_feature_columns(candidate_params: Dict[str, Any]) -> List[str]:
+    """
+    启用的候选策略对应的特征列（未启用的策略的列全为NaN，不作为特征）
+
+    Args:
+        candidate_params: create_candidates的候选参数
+
+    Returns:
+        CANDIDATE_FEATURE_COLUMNS中启用的列（顺序不变）
+    """
+    disabled = {
+        column
+        for param, columns in OPTIONAL_CANDIDATE_COLUMNS if not candidate_params.get(param, 0)
+        for column in columns
+    }
+    return [column for column in CANDIDATE_FEATURE_COLUMNS if column not in disabled]
+
+
+def merge_candidate_rows(candidates: pd.DataFrame,
+                         columns: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    合并同一(user, item)的多条候选（来自不同策略），各列取非NaN的最大值
+
+    Args:
+        candidates: 候选
+        columns: 需要保留的数值列（候选中没有的列为NaN）
+
+    Returns:
+        (user, item, (n, len(columns)) 的float32数组)，按(user, item)排序
+    """
+    keys = pack_user_item(candidates['user'].values, candidates['item'].values)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = np.full((len(keys), len(columns)), np.nan, dtype=np.float32)
+    for i, column in enumerate(columns):
+        if column in candidates.columns:
+            values[:, i] = candidates[column].to_numpy(dtype=np.float32)[order]
+
+    starts = run_starts(keys)
+    if len(starts):
+        values = np.fmax.reduceat(values, starts, axis=0)
+    user, item = unpack_user_item(keys[starts])
+    return user, item, values
+
+
+class WeekData:
+    """一个训练周写在磁盘上的分块数据"""
+
+    def __init__(self, week_dir: str):
+        """
+        读取分块清单（特征矩阵使用内存映射）
+
+        Args:
+            week_dir: 周目录
+        """
+        self.week_dir = week_dir
+        with open(os.path.join(week_dir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+
+    @property
+    def columns(self) -> List[str]:
+        return self.manifest['columns']
+
+    @property
+    def num_rows(self) -> int:
+        return sum(chunk['rows'] for chunk in self.manifest['chunks'])
+
+    def features(self) -> List[np.ndarray]:
+        """各块的特征矩阵（内存映射）"""
+        return [
+            np.load(os.path.join(self.week_dir, f"{chunk['name']}.npy"), mmap_mode='r')
+            for chunk in self.manifest['chunks']
+        ]
+
+    def _meta(self, key: str) -> np.ndarray:
+        arrays = []
+        for chunk in self.manifest['chunks']:
+            with np.load(os.path.join(self.week_dir, f"{chunk['name']}_meta.npz")) as data:
+                arrays.append(data[key])
+        return np.concatenate(arrays) if arrays else np.zeros(0)
+
+    def labels(self) -> np.ndarray:
+        return self._meta('label').astype(np.float32)
+
+    def users(self) -> np.ndarray:
+        return self._meta('user')
+
+    def group_sizes(self) -> np.ndarray:
+        """排序组（用户）大小，按行顺序"""
+        user = self.users()
+        return np.diff(np.append(run_starts(user), len(user)))
+
+
+class RankingDataBuilder:
+    """训练周候选和特征的分块生成器"""
+
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None, chunk_users: int = 200_000):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（使用其中model段的候选和向量召回参数、lightfm段的特征维度）
+            chunk_users: 每块的用户ID区间长度
+        """
+        self.data_dir = data_dir
+        self.train_dir = os.path.join(data_dir, 'train')
+        self.store = store if store is not None else get_data_store(os.path.join(data_dir, 'processed'))
+        self.candidate_params = candidate_params_from_config(config)
+        self.candidate_columns = candidate_feature_columns(self.candidate_params)
+        self.lfm_dim = lightfm_feature_dim(config)
+        self.retriever_params = retriever_params_from_config(config)
+        self.chunk_users = chunk_users
+
+    def week_dir(self, week: int) -> str:
+        return os.path.join(self.train_dir, f'week{week}')
+
+    def is_up_to_date(self, week: int) -> bool:
+        """分块数据已完整写出、候选参数、候选特征列、LightFM维度和向量召回参数一致且不早于交易数据"""
+        path = os.path.join(self.week_dir(week), 'manifest.json')
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('candidate_params') != self.candidate_params or \
+                manifest.get('candidate_columns') != self.candidate_columns or \
+                manifest.get('lfm_dim') != self.lfm_dim or \
+                manifest.get('retriever_params') != self.retriever_params:
+            return False
+        return os.path.getmtime(path) >= table_mtime(self.store.processed_dir, 'transactions_train')
+
+    def build_week(self, week: int) -> WeekData:
+        """
+        生成一个训练周的分块数据：候选来自 week >= week 的交易，标签为 week - 1 的购买
+
+        Args:
+            week: 训练周（>= 1）
+
+        Returns:
+            WeekData
+        """
+        week_dir = self.week_dir(week)
+        if self.is_up_to_date(week):
+            logger.info(f"训练数据已是最新，跳过: {week_dir}")
+            return WeekData(week_dir)
+        os.makedirs(week_dir, exist_ok=True)
+        manifest_path = os.path.join(week_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        # 目标用户和标签：下一周有购买的用户及其购买的商品
+        target = self.store.transactions_between(week - 1, 1, ['user', 'item'])
+        target_users = np.unique(target['user'].values)
+        label_keys = np.unique(pack_user_item(target['user'].values, target['item'].values))
+
+        generator = CandidateGenerator(
+            self.store.table('transactions_train'), self.store.table('items'), store=self.store
+        )
+        retriever = build_retriever(self.data_dir, week, self.candidate_params, self.retriever_params)
+        candidates = generator.create_candidates(target_users, week, compact=True, retriever=retriever,
+                                                 **self.candidate_params)
+        assembler = build_feature_assembler(
+            self.data_dir, week, self.store, lfm_dim=self.lfm_dim, candidate_columns=self.candidate_columns
+        )
+
+        chunks = []
+        for i, chunk in enumerate(candidates.iter_chunks(self.chunk_users)):
+            user, item, values = merge_candidate_rows(chunk, self.candidate_columns)
+            label = isin_keys(pack_user_item(user, item), label_keys)
+            name = f'chunk{i:04d}'
+            assembler.assemble_to_file(
+                os.path.join(week_dir, f'{name}.npy'), user, item,
+                pd.DataFrame(values, columns=self.candidate_columns, copy=False)
+            )
+            np.savez(os.path.join(week_dir, f'{name}_meta.npz'),
+                     user=user.astype(np.int32), item=item.astype(np.int32), label=label.astype(np.uint8))
+            chunks.append({'name': name, 'rows': len(user), 'positives': int(label.sum())})
+            logger.info(f"训练数据分块: week{week} {name}, {len(user)}行, 正样本{int(label.sum())}")
+
+        # 清单最后写出，作为分块数据完整的标记
+        manifest = {
+            'week': week,
+            'columns': assembler.columns,
+            'chunks': chunks,
+            'candidate_params': self.candidate_params,
+            'candidate_columns': self.candidate_columns,
+            'lfm_dim': self.lfm_dim,
+            'retriever_params': self.retriever_params,
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return WeekData(week_dir)
+
+
+def _fingerprint(weeks: List[WeekData], params: Dict[str, Any]) -> str:
+    """数据集指纹：各周的分块清单（含修改时间）和数据集参数"""
+    payload = {
+        'weeks': [
+            (w.week_dir, w.manifest, os.path.getmtime(os.path.join(w.week_dir, 'manifest.json')))
+            for w in weeks
+        ],
+        'params': params,
+    }
+    return hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class _ChunkSequence(lgb.Sequence):
+    """将内存映射的特征块作为LightGBM的Sequence，按批读取"""
+
+    def __init__(self, features: np.ndarray, batch_size: int = 65536):
+        self.features = features
+        self.batch_size = batch_size
+
+    def __getitem__(self, idx):
+        return self.features[idx]
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+
+class RankerTrainer:
+    """排序模型训练器"""
+
+    def __init__(self, data_dir: str, store: Optional[DataStore] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        """
+        初始化
+
+        Args:
+            data_dir: 数据目录路径
+            store: 共享数据仓库，默认使用进程内共享实例
+            config: 配置（model、lightgbm、catboost段）
+        """
+        self.data_dir = data_dir
+        self.config = config or {}
+        self.model_dir = os.path.join(data_dir, 'models')
+        self.cache_dir = os.path.join(data_dir, 'train', 'cache')
+        os.makedirs(self.model_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        model_config = self.config.get('model') or {}
+        self.backend = model_config.get('type', 'CatBoost')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"不支持的模型类型: {self.backend}")
+        self.train_weeks = int(model_config.get('train_weeks', 6))
+        self.builder = RankingDataBuilder(data_dir, store, self.config)
+
+    def _build_weeks(self, valid_week: int) -> Tuple[List[WeekData], WeekData]:
+        """生成训练周和验证周的分块数据"""
+        valid = self.builder.build_week(valid_week)
+        train = [
+            self.builder.build_week(week)
+            for week in range(valid_week + 1, valid_week + 1 + self.train_weeks)
+        ]
+        for week_data in train:
+            if week_data.columns != valid.columns:
+                raise ValueError(f"训练周与验证周的特征列不一致: {week_data.week_dir}")
+        return train, valid
+
+    def _lightgbm_datasets(self, train: List[WeekData], valid: WeekData,
+                           params: Dict[str, Any]) -> Tuple[lgb.Dataset, lgb.Dataset]:
+        """构建或读取缓存的LightGBM二进制数据集"""
+        key = _fingerprint(train + [valid], params)
+        train_path = os.path.join(self.cache_dir, f'lgb_train_{key}.bin')
+        valid_path = os.path.join(self.cache_dir, f'lgb_valid_{key}.bin')
+
+        if os.path.exists(train_path) and os.path.exists(valid_path):
+            logger.info(f"读取缓存的LightGBM数据集: {key}")
+            train_set = lgb.Dataset(train_path, params=params)
+            return train_set, lgb.Dataset(valid_path, reference=train_set, params=params)
+
+        columns = train[0].columns
+        train_set = lgb.Dataset(
+            [_ChunkSequence(f) for w in train for f in w.features()],
+            label=np.concatenate([w.labels() for w in train]),
+            group=np.concatenate([w.group_sizes() for w in train]),
+            feature_name=columns, params=params, free_raw_data=False,
+        ).construct()
+        valid_set = lgb.Dataset(
+            [_ChunkSequence(f) for f in valid.features()],
+            label=valid.labels(), group=valid.group_sizes(),
+            reference=train_set, params=params, free_raw_data=False,
+        ).construct()
+        train_set.save_binary(train_path)
+        valid_set.save_binary(valid_path)
+        logger.info(f"LightGBM数据集已缓存: {key}")
+        return train_set, valid_set
+
+    def _catboost_pools(self, train: List[WeekData], valid: WeekData,
+                        params: Dict[str, Any]) -> Tuple[Pool, Pool]:
+        """
+        构建或读取缓存的CatBoost量化Pool
+
+        CatBoost没有分块构建Pool的接口，首次构建时读入全部训练周的float32特征矩阵，
+        量化后只保存量化结果，之后直接读取量化Pool。训练集不能放入内存时请使用LightGBM。
+        """
+        # group_id的编码方式计入指纹，旧版本按用户分组的缓存不会被读取
+        key = _fingerprint(train + [valid], {**params, 'group_id': 'week_user'})
+        train_path = os.path.join(self.cache_dir, f'cb_train_{key}.bin')
+        valid_path = os.path.join(self.cache_dir, f'cb_valid_{key}.bin')
+        borders_path = os.path.join(self.cache_dir, f'cb_borders_{key}.tsv')
+
+        if os.path.exists(train_path) and os.path.exists(valid_path):
+            logger.info(f"读取缓存的CatBoost Pool: {key}")
+            return Pool(f'quantized://{train_path}'), Pool(f'quantized://{valid_path}')
+
+        def make_pool(weeks: List[WeekData]) -> Pool:
+            # 排序组为(周, 用户)，与LightGBM按周的group_sizes一致
+            return Pool(
+                np.concatenate([f for w in weeks for f in w.features()]),
+                label=np.concatenate([w.labels() for w in weeks]),
+                group_id=np.concatenate([
+                    (np.int64(i) << 32) | w.users().astype(np.int64) for i, w in enumerate(weeks)
+                ]),
+                feature_names=weeks[0].columns,
+            )
+
+        train_pool = make_pool(train)
+        train_pool.quantize(**params)
+        train_pool.save_quantization_borders(borders_path)
+        train_pool.save(train_path)
+        del train_pool
+
+        valid_pool = make_pool([valid])
+        valid_pool.quantize(input_borders=borders_path, **params)
+        valid_pool.save(valid_path)
+        del valid_pool
+
+        logger.info(f"CatBoost Pool已缓存: {key}")
+        return Pool(f'quantized://{train_path}'), Pool(f'quantized://{valid_path}')
+
+    def _train_lightgbm(self, train: List[WeekData], valid: WeekData) -> str:
+        lgb_config = dict(self.config.get('lightgbm') or {})
+        num_boost_round = int(lgb_config.pop('num_boost_round', 1000))
+        early_stopping_rounds = int(lgb_config.pop('early_stopping_rounds', 20))
+        dataset_params = {'max_bin': int(lgb_config.pop('max_bin', 255))}
+        params = {**lgb_config, **dataset_params, 'verbose': -1}
+        params['learning_rate'] = float(params.get('learning_rate', 0.05))
+
+        train_set, valid_set = self._lightgbm_datasets(train, valid, dataset_params)
+        model = lgb.train(
+            params, train_set, num_boost_round=num_boost_round, valid_sets=[valid_set],
+            callbacks=[lgb.early_stopping(early_stopping_rounds), lgb.log_evaluation(50)],
+        )
+        save_path = os.path.join(self.model_dir, 'lgb_ranker.txt')
+        model.save_model(save_path, num_iteration=model.best_iteration)
+        logger.info(f"LightGBM最佳迭代: {model.best_iteration}, {dict(model.best_score)}")
+        return save_path
+
+    def _train_catboost(self, train: List[WeekData], valid: WeekData) -> str:
+        cb_config = dict(self.config.get('catboost') or {})
+        pool_params = {'border_count': int(cb_config.pop('border_count', 254))}
+        params = {'early_stopping_rounds': 100, 'verbose': 50, **cb_config}
+
+        train_pool, valid_pool = self._catboost_pools(train, valid, pool_params)
+        model = CatBoost(params)
+        model.fit(train_pool, eval_set=valid_pool)
+        save_path = os.path.join(self.model_dir, 'catboost_ranker.cbm')
+        model.save_model(save_path)
+        logger.info(f"CatBoost最佳迭代: {model.get_best_iteration()}, {model.get_best_score()}")
+        return save_path
+
+    def train(self, valid_week: int = 1) -> str:
+        """
+        生成训练数据并训练排序模型
+
+        Args:
+            valid_week: 验证周（其后train_weeks周为训练周）
+
+        Returns:
+            模型文件路径
+        """
+        train, valid = self._build_weeks(valid_week)
+        logger.info(f"训练{self.backend}: 训练{sum(w.num_rows for w in train)}行, 验证{valid.num_rows}行")
+        if self.backend == 'CatBoost':
+            logger.warning("CatBoost首次构建量化Pool时会把全部训练周的特征读入内存")
+
+        if self.backend == 'LightGBM':
+            save_path = self._train_lightgbm(train, valid)
+        else:
+            save_path = self._train_catboost(train, valid)
+
+        # 特征清单与模型一起保存，推理时按相同顺序拼接特征
+        with open(os.path.join(self.model_dir, 'features.json'), 'w') as f:
+            json.dump({'backend': self.backend, 'columns': valid.columns, 'model_path': save_path},
+                      f, ensure_ascii=False)
+        logger.info(f"排序模型已保存: {save_path}")
+        return save_path
+
+
+def main():
+    """主函数"""
+    trainer = RankerTrainer("data", config=load_config())
+    trainer.train()
+
+
+if __name__ == "__main__":
+    main()
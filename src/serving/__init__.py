@@ -0,0 +1,3 @@
+"""
+在线服务模块
+"""
@@ -0,0 +1,112 @@
+"""
+在线推荐服务压测模块
+
+用asyncio建立多个keep-alive连接，持续请求 /recommend，统计QPS和p50/p99延迟。
+只依赖标准库和numpy，可以对任意地址的服务运行。
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import numpy as np
+from logzero import logger
+from typing import Dict, List
+from urllib.parse import quote
+
+
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str) -> int:
+    """发送一个GET请求并读完响应，返回状态码"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("连接已关闭")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value.strip())
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def _worker(host: str, port: int, customer_ids: List[str], deadline: float,
+                  rng: np.random.Generator, latencies: List[float], errors: List[int]) -> None:
+    """一个连接：在截止时间前不断发送请求"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            customer_id = customer_ids[int(rng.integers(len(customer_ids)))]
+            start = time.perf_counter()
+            status = await _request(reader, writer, host, f"/recommend?customer_id={quote(customer_id)}")
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host: str, port: int, customer_ids: List[str], concurrency: int = 32,
+                        duration: float = 10.0, seed: int = 0) -> Dict[str, float]:
+    """
+    压测推荐服务
+
+    Args:
+        host: 服务地址
+        port: 服务端口
+        customer_ids: 请求使用的customer_id（均匀随机抽取）
+        concurrency: 并发连接数
+        duration: 压测秒数
+        seed: 随机种子
+
+    Returns:
+        requests, errors, qps, p50_ms, p99_ms
+    """
+    latencies: List[float] = []
+    errors: List[int] = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        _worker(host, port, customer_ids, deadline, np.random.default_rng(seed + i), latencies, errors)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    latency_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'qps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latency_ms, 50)) if len(latencies) else float('nan'),
+        'p99_ms': float(np.percentile(latency_ms, 99)) if len(latencies) else float('nan'),
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='H&M在线推荐服务压测')
+    parser.add_argument('--data_dir', type=str, default='data', help='数据目录路径（读取customer_id）')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=32, help='并发连接数')
+    parser.add_argument('--duration', type=float, default=10.0, help='压测秒数')
+    parser.add_argument('--num_customers', type=int, default=10_000, help='请求使用的用户数（越少缓存命中越多）')
+    args = parser.parse_args()
+
+    customer_ids = np.load(os.path.join(args.data_dir, 'serving', 'customer_ids_sorted.npy'), mmap_mode='r')
+    sample = np.random.default_rng(0).choice(len(customer_ids), min(args.num_customers, len(customer_ids)),
+                                             replace=False)
+    result = asyncio.run(run_load_test(args.host, args.port, [str(customer_ids[i]) for i in sample],
+                                       args.concurrency, args.duration))
+    logger.info(
+        f"请求数: {result['requests']}, 错误: {result['errors']}, QPS: {result['qps']:.1f}, "
+        f"p50: {result['p50_ms']:.2f}ms, p99: {result['p99_ms']:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
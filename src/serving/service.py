@@ -0,0 +1,424 @@
+"""
+在线推荐服务模块
+
+按请求返回单个用户的推荐：
+- 离线导出服务索引：每个用户的候选商品和特征按稠密用户ID连续存放（CSR结构），
+  保存为内存映射的.npy文件，请求时按偏移直接切片
+- 热点用户的推荐结果放入有上限的LRU缓存
+- 并发请求在短时间窗口内合并为一批，只调用一次排序模型
+- 基于asyncio的HTTP前端：GET /recommend?customer_id=... 与 GET /health
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logzero import logger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from data.store import DataStore, get_data_store
+from features.feature_assembly import build_feature_assembler
+from models.candidate_generation import CandidateGenerator
+from models.inference import BatchPredictor, fill_with_popular, load_id_mapping, load_ranker, top_k_per_user
+from utils.config import DEFAULT_CONFIG_PATH, load_config
+
+
+def export_serving_index(data_dir: str, store: Optional[DataStore] = None,
+                         config: Optional[Dict[str, Any]] = None, week: int = 0,
+                         shard_users: int = 100_000, k: int = 12) -> str:
+    """
+    导出服务索引：全部用户的候选商品和特征
+
+    Args:
+        data_dir: 数据目录路径
+        store: 共享数据仓库，默认使用进程内共享实例
+        config: 配置（候选参数）
+        week: 候选和特征使用的时间窗口
+        shard_users: 每个分片的用户ID区间长度
+        k: 热门补齐商品数
+
+    Returns:
+        服务索引目录
+    """
+    predictor = BatchPredictor(data_dir, store, config, shard_users=shard_users, k=k)
+    store = predictor.store
+    serving_dir = os.path.join(data_dir, 'serving')
+    os.makedirs(serving_dir, exist_ok=True)
+
+    assembler = build_feature_assembler(data_dir, week, store, lfm_dim=predictor.lfm_dim,
+                                        candidate_columns=predictor.candidate_columns)
+    generator = CandidateGenerator(store.table('transactions_train'), store.table('items'), store=store)
+    n_users = store.n_users
+
+    # 第一遍逐分片写出临时文件，之后拼接为连续数组
+    counts = np.zeros(n_users, dtype=np.int64)
+    parts = []
+    for start in range(0, n_users, shard_users):
+        users = np.arange(start, min(start + shard_users, n_users))
+        user, item, features = predictor.shard_features(generator, assembler, users, week)
+        counts += np.bincount(user, minlength=n_users)
+        path = os.path.join(serving_dir, f'part{len(parts):04d}.npz')
+        np.savez(path, item=item.astype(np.int32), features=features)
+        parts.append(path)
+        logger.info(f"服务索引进度: {users[-1] + 1}/{n_users}")
+
+    total = int(counts.sum())
+    items = np.lib.format.open_memmap(os.path.join(serving_dir, 'items.npy'), mode='w+',
+                                      dtype=np.int32, shape=(total,))
+    features = np.lib.format.open_memmap(os.path.join(serving_dir, 'features.npy'), mode='w+',
+                                         dtype=np.float32, shape=(total, len(assembler.columns)))
+    offset = 0
+    for path in parts:
+        with np.load(path) as data:
+            n = len(data['item'])
+            items[offset:offset + n] = data['item']
+            features[offset:offset + n] = data['features']
+        offset += n
+        os.remove(path)
+    items.flush()
+    features.flush()
+    del items, features
+
+    np.save(os.path.join(serving_dir, 'offsets.npy'), np.concatenate([[0], np.cumsum(counts)]))
+    popular = generator.create_candidates_popular_compact(
+        np.zeros(0, dtype=np.int64), week, predictor.candidate_params['popular_weeks'], k
+    ).items['item'].values
+    np.save(os.path.join(serving_dir, 'popular.npy'), popular.astype(np.int64))
+
+    # 原始customer_id排序后保存，请求时二分查找得到稠密ID
+    customer_ids = load_id_mapping(predictor.processed_dir, 'customer_id')
+    order = np.argsort(customer_ids)
+    np.save(os.path.join(serving_dir, 'customer_ids_sorted.npy'), customer_ids[order])
+    np.save(os.path.join(serving_dir, 'customer_users_sorted.npy'), order.astype(np.int32))
+    np.save(os.path.join(serving_dir, 'article_ids.npy'), load_id_mapping(predictor.processed_dir, 'article_id'))
+
+    with open(os.path.join(serving_dir, 'manifest.json'), 'w') as f:
+        json.dump({'week': week, 'columns': assembler.columns, 'rows': total}, f, ensure_ascii=False)
+    logger.info(f"服务索引已保存: {serving_dir} ({total}条候选)")
+    return serving_dir
+
+
+class LRUCache:
+    """有容量上限的LRU缓存（加锁，事件循环线程读取的同时批处理线程可以写入和淘汰）"""
+
+    def __init__(self, max_size: int):
+        """
+        初始化
+
+        Args:
+            max_size: 最多缓存的条目数
+        """
+        self.max_size = max_size
+        self._data: 'OrderedDict[Any, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RecommendationService:
+    """在线推荐服务"""
+
+    def __init__(self, data_dir: str, k: int = 12, cache_size: int = 100_000,
+                 score_fn: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        """
+        读取服务索引（内存映射）和排序模型
+
+        Args:
+            data_dir: 数据目录路径（使用其中的serving和models目录）
+            k: 每个用户的推荐数
+            cache_size: LRU缓存的用户数
+            score_fn: 打分函数，None表示读取训练好的排序模型
+        """
+        serving_dir = os.path.join(data_dir, 'serving')
+        with open(os.path.join(serving_dir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if score_fn is None:
+            score_fn, model_manifest = load_ranker(os.path.join(data_dir, 'models'))
+            if model_manifest['columns'] != self.manifest['columns']:
+                raise ValueError("服务索引的特征列与排序模型不一致")
+        self.score_fn = score_fn
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(serving_dir, f'{name}.npy'), mmap_mode='r')
+
+        self.offsets = load('offsets')
+        self.items = load('items')
+        self.features = load('features')
+        self.popular = np.asarray(load('popular'))
+        self.customer_ids = load('customer_ids_sorted')
+        self.customer_users = load('customer_users_sorted')
+        self.article_ids = load('article_ids')
+        self.k = k
+        self.cache = LRUCache(cache_size)
+
+    def lookup_user(self, customer_id: str) -> Optional[int]:
+        """原始customer_id对应的稠密用户ID，不存在时返回None"""
+        i = int(np.searchsorted(self.customer_ids, customer_id))
+        if i == len(self.customer_ids) or self.customer_ids[i] != customer_id:
+            return None
+        return int(self.customer_users[i])
+
+    def popular_articles(self) -> List[str]:
+        """热门商品（未知用户的推荐）"""
+        return [str(self.article_ids[i]) for i in self.popular[:self.k]]
+
+    def recommend_users(self, users: np.ndarray) -> List[List[str]]:
+        """
+        批量为稠密用户ID生成推荐（一次模型调用）
+
+        Args:
+            users: 稠密用户ID（不要求有序，可以重复）
+
+        Returns:
+            与users对应的article_id列表
+        """
+        unique_users = np.unique(np.asarray(users, dtype=np.int64))
+        starts = self.offsets[unique_users]
+        lengths = self.offsets[unique_users + 1] - starts
+        rows = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) \
+            + np.repeat(starts, lengths)
+
+        user = np.repeat(unique_users, lengths)
+        item = np.asarray(self.items[rows], dtype=np.int64)
+        if len(rows):
+            score = np.asarray(self.score_fn(np.asarray(self.features[rows])), dtype=np.float64)
+        else:
+            score = np.zeros(0)
+        top_user, top_item, rank = top_k_per_user(user, item, score, self.k)
+        recommendations = fill_with_popular(unique_users, top_user, top_item, rank, self.popular, self.k)
+
+        by_user = {
+            u: [str(self.article_ids[i]) for i in row if i >= 0]
+            for u, row in zip(unique_users.tolist(), recommendations)
+        }
+        return [by_user[u] for u in np.asarray(users, dtype=np.int64).tolist()]
+
+    def recommend(self, customer_id: str) -> List[str]:
+        """
+        为单个用户生成推荐
+
+        Args:
+            customer_id: 原始customer_id
+
+        Returns:
+            article_id列表；未知用户返回热门商品
+        """
+        cached = self.cache.get(customer_id)
+        if cached is not None:
+            return cached
+        user = self.lookup_user(customer_id)
+        if user is None:
+            return self.popular_articles()
+        result = self.recommend_users(np.array([user]))[0]
+        self.cache.put(customer_id, result)
+        return result
+
+
+class MicroBatcher:
+    """将并发请求合并为批次，每批只调用一次排序模型"""
+
+    def __init__(self, service: RecommendationService, max_batch_size: int = 256, max_wait_ms: float = 2.0):
+        """
+        初始化
+
+        Args:
+            service: 推荐服务
+            max_batch_size: 每批最多请求数
+            max_wait_ms: 第一个请求到达后最多等待的毫秒数
+        """
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """在当前事件循环中启动批处理任务"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def recommend(self, customer_id: str) -> List[str]:
+        """
+        异步获取推荐（缓存命中时直接返回）
+
+        Args:
+            customer_id: 原始customer_id
+
+        Returns:
+            article_id列表
+        """
+        cached = self.service.cache.get(customer_id)
+        if cached is not None:
+            return cached
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((customer_id, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """取出一批请求：等到第一个请求后，在等待时间内尽量凑满一批"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _recommend_batch(self, customer_ids: List[str]) -> List[List[str]]:
+        """在线程池中执行的批量推荐"""
+        service = self.service
+        users = [service.lookup_user(c) for c in customer_ids]
+        known = [i for i, u in enumerate(users) if u is not None]
+        results = [service.popular_articles()] * len(customer_ids)
+        if known:
+            recommendations = service.recommend_users(np.array([users[i] for i in known]))
+            for i, result in zip(known, recommendations):
+                results[i] = result
+                service.cache.put(customer_ids[i], result)
+        return results
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._recommend_batch, [c for c, _ in batch]
+                )
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                logger.exception(e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+async def _send(writer: asyncio.StreamWriter, status: str, body: Dict[str, Any], keep_alive: bool) -> None:
+    """写出JSON响应"""
+    payload = json.dumps(body, ensure_ascii=False).encode()
+    headers = (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(headers.encode() + payload)
+    await writer.drain()
+
+
+async def _handle(batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """处理一个连接上的请求（支持keep-alive）"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get('connection', '').lower() != 'close'
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] != 'GET':
+                await _send(writer, '405 Method Not Allowed', {'error': 'only GET is supported'}, keep_alive)
+                continue
+            url = urlparse(parts[1])
+            if url.path == '/health':
+                await _send(writer, '200 OK', {'status': 'ok', 'cache_size': len(batcher.service.cache)},
+                            keep_alive)
+            elif url.path == '/recommend':
+                customer_id = parse_qs(url.query).get('customer_id', [None])[0]
+                if customer_id is None:
+                    await _send(writer, '400 Bad Request', {'error': 'customer_id is required'}, keep_alive)
+                else:
+                    articles = await batcher.recommend(customer_id)
+                    await _send(writer, '200 OK', {'customer_id': customer_id, 'articles': articles}, keep_alive)
+            else:
+                await _send(writer, '404 Not Found', {'error': 'not found'}, keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionResetError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service: RecommendationService, host: str = '127.0.0.1', port: int = 8000,
+                max_batch_size: int = 256, max_wait_ms: float = 2.0) -> None:
+    """
+    启动HTTP服务（一直运行）
+
+    Args:
+        service: 推荐服务
+        host: 监听地址
+        port: 监听端口
+        max_batch_size: 每批最多请求数
+        max_wait_ms: 凑批的最长等待毫秒数
+    """
+    batcher = MicroBatcher(service, max_batch_size, max_wait_ms)
+    batcher.start()
+    server = await asyncio.start_server(lambda r, w: _handle(batcher, r, w), host, port)
+    logger.info(f"推荐服务已启动: http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='H&M在线推荐服务')
+    parser.add_argument('--data_dir', type=str, default='data', help='数据目录路径')
+    parser.add_argument('--config', type=str, default=DEFAULT_CONFIG_PATH, help='配置文件路径（导出时的候选参数）')
+    parser.add_argument('--export', action='store_true', help='先导出服务索引')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache_size', type=int, default=100_000, help='LRU缓存的用户数')
+    parser.add_argument('--max_batch_size', type=int, default=256, help='每批最多请求数')
+    parser.add_argument('--max_wait_ms', type=float, default=2.0, help='凑批的最长等待毫秒数')
+    args = parser.parse_args()
+
+    if args.export:
+        export_serving_index(args.data_dir, get_data_store(os.path.join(args.data_dir, 'processed')),
+                             config=load_config(args.config))
+    service = RecommendationService(args.data_dir, cache_size=args.cache_size)
+    asyncio.run(serve(service, args.host, args.port, args.max_batch_size, args.max_wait_ms))
+
+
+if __name__ == "__main__":
+    main()
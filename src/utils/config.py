@@ -0,0 +1,29 @@
+"""
+配置模块
+
+读取configs/config.yaml
+"""
+
+import os
+import yaml
+from typing import Any, Dict
+
+# 默认配置文件路径（相对于项目根目录）
+DEFAULT_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'configs', 'config.yaml'
+)
+
+
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
+    """
+    读取YAML配置
+
+    Args:
+        path: 配置文件路径
+
+    Returns:
+        配置字典，文件为空时返回空字典
+    """
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
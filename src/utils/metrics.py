@@ -1,11 +1,15 @@
 """
 评估指标模块
 
-包含推荐系统常用的评估指标
+包含推荐系统常用的评估指标：
+- apk / mapk / recall_at_k / precision_at_k：基于Python列表的参考实现
+- *_csr：基于CSR结构（offsets, values）的向量化实现，可按用户分块多线程并行，
+  用于全量用户的离线评估
 """
 
 import numpy as np
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 
 def apk(actual: List, predicted: List, k: int = 12) -> float:
@@ -94,3 +98,188 @@ def precision_at_k(actual: List, predicted: List, k: int = 12) -> float:
     
     hits = len(set(actual) & set(predicted))
     return hits / len(predicted)
+
+
+def to_csr(sequences: List[List], vocabulary: Optional[Dict[Any, int]] = None
+           ) -> Tuple[np.ndarray, np.ndarray, Dict[Any, int]]:
+    """
+    将列表的列表转为CSR结构（offsets, values），标签编码为整数
+
+    真实标签和预测标签需要共用同一个vocabulary，编码后才能比较。
+
+    Args:
+        sequences: 标签列表的列表
+        vocabulary: 标签到整数的映射，会被补充新标签；None表示新建
+
+    Returns:
+        (offsets, values, vocabulary)，第i行为values[offsets[i]:offsets[i + 1]]
+    """
+    vocabulary = {} if vocabulary is None else vocabulary
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    values = np.fromiter(
+        (vocabulary.setdefault(v, len(vocabulary)) for s in sequences for v in s),
+        dtype=np.int64, count=int(offsets[-1])
+    )
+    return offsets, values, vocabulary
+
+
+def _row_metrics(actual_offsets: np.ndarray, actual_values: np.ndarray, predicted_offsets: np.ndarray,
+                 predicted_values: np.ndarray, k: int) -> Dict[str, np.ndarray]:
+    """
+    一段连续用户的逐行指标（offsets可以不从0开始）
+
+    预测截断到前k个后按列存放为 (k, 用户数) 的矩阵，每一步都是整列的向量运算：
+    - 与真实标签的第c个逐列比较；真实标签多于c个的用户较少时只取这些用户，
+      总计算量与真实标签数 × k 成正比
+    - 命中位置很稀疏，去重和AP累计只在命中位置上进行；同一行内重复的预测只在第一次出现时计为命中，
+      与apk / recall_at_k / precision_at_k一致
+    """
+    n = len(predicted_offsets) - 1
+    actual_len = np.diff(actual_offsets)
+    predicted_len = np.minimum(np.diff(predicted_offsets), k)
+    actual_starts = actual_offsets[:-1]
+    predicted_starts = predicted_offsets[:-1]
+
+    # 标签都能用int32表示时用int32，减少内存带宽
+    top = max(int(actual_values.max(initial=0)), int(predicted_values.max(initial=0)))
+    dtype = np.int32 if top < np.iinfo(np.int32).max else np.int64
+
+    # 预测矩阵，空位为-1（标签为非负整数，不会命中）；每行恰好k个时直接转置
+    if np.all(np.diff(predicted_offsets) == k):
+        rows = predicted_values[predicted_offsets[0]:predicted_offsets[-1]].reshape(n, k)
+    else:
+        predicted_row = np.repeat(np.arange(n), predicted_len)
+        position = np.arange(int(predicted_len.sum())) - np.repeat(np.cumsum(predicted_len) - predicted_len,
+                                                                   predicted_len)
+        rows = np.full(n * k, -1, dtype=dtype)
+        rows[predicted_row * k + position] = predicted_values[np.repeat(predicted_starts, predicted_len)
+                                                              + position]
+        rows = rows.reshape(n, k)
+    predicted = np.ascontiguousarray(rows.astype(dtype, copy=False).T)
+
+    # 真实标签多于c个的用户：按真实标签数降序排列后的前缀
+    order = None
+    more_than = n - np.cumsum(np.bincount(actual_len, minlength=1))
+    hit = np.zeros((k, n), dtype=bool)
+    for c in range(len(more_than) - 1):
+        m = more_than[c]
+        if m > n // 8:
+            mask = actual_len > c
+            actual = np.full(n, -2, dtype=dtype)
+            actual[mask] = actual_values[actual_starts[mask] + c]
+            for j in range(k):
+                hit[j] |= predicted[j] == actual
+        else:
+            if order is None:
+                order = np.argsort(-actual_len, kind='stable')
+            users = np.sort(order[:m])
+            actual = actual_values[actual_starts[users] + c].astype(dtype)
+            hit[:, users] |= predicted[:, users] == actual
+
+    # 命中很稀疏，之后只处理命中的位置：去掉行内重复的预测，按用户累计命中数和AP
+    position, user = np.nonzero(hit)
+    hit_order = np.lexsort((position, user))
+    position, user = position[hit_order], user[hit_order]
+    earlier = predicted[:, user]
+    duplicated = ((earlier == earlier[position, np.arange(len(user))])
+                  & (np.arange(k)[:, None] < position)).any(axis=0)
+    position, user = position[~duplicated], user[~duplicated]
+
+    group_start = np.flatnonzero(np.r_[True, user[1:] != user[:-1]]) if len(user) else np.zeros(0, np.int64)
+    group_len = np.diff(np.append(group_start, len(user)))
+    rank_in_user = np.arange(len(user)) - np.repeat(group_start, group_len) + 1
+    num_hits = np.bincount(user, minlength=n).astype(np.float64)
+    # 没有命中时bincount返回int64，需要转为float64再做原地除法
+    ap = np.bincount(user, weights=rank_in_user / (position + 1.0), minlength=n).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ap /= np.minimum(actual_len, k)
+        recall = num_hits / actual_len
+        precision = num_hits / predicted_len
+    ap[actual_len == 0] = 0.0
+    recall[actual_len == 0] = 0.0
+    precision[predicted_len == 0] = 0.0
+    return {'apk': ap, 'recall': recall, 'precision': precision}
+
+
+def evaluate_csr(actual_offsets: np.ndarray, actual_values: np.ndarray, predicted_offsets: np.ndarray,
+                 predicted_values: np.ndarray, k: int = 12, n_jobs: int = 1,
+                 chunk_rows: int = 200_000) -> Dict[str, np.ndarray]:
+    """
+    向量化计算每个用户的AP@k、召回率@k、精确率@k
+
+    Args:
+        actual_offsets: 真实标签的行偏移（长度为用户数+1）
+        actual_values: 真实标签（非负整数）
+        predicted_offsets: 预测标签的行偏移（与actual_offsets行数相同）
+        predicted_values: 预测标签（非负整数，按排名顺序）
+        k: 截断位置
+        n_jobs: 并行线程数，>1时按用户分块并行
+        chunk_rows: 并行时每块的用户数
+
+    Returns:
+        apk, recall, precision：逐用户的指标数组
+    """
+    actual_offsets = np.asarray(actual_offsets, dtype=np.int64)
+    predicted_offsets = np.asarray(predicted_offsets, dtype=np.int64)
+    actual_values = np.asarray(actual_values, dtype=np.int64)
+    predicted_values = np.asarray(predicted_values, dtype=np.int64)
+    if len(actual_offsets) != len(predicted_offsets):
+        raise ValueError("真实标签和预测标签的用户数不一致")
+
+    n = len(actual_offsets) - 1
+    if n_jobs <= 1 or n <= chunk_rows:
+        return _row_metrics(actual_offsets, actual_values, predicted_offsets, predicted_values, k)
+
+    # numpy的排序和归约会释放GIL，按用户分块用线程并行
+    def run(start: int) -> Dict[str, np.ndarray]:
+        end = min(start + chunk_rows, n)
+        return _row_metrics(actual_offsets[start:end + 1], actual_values,
+                            predicted_offsets[start:end + 1], predicted_values, k)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        parts = list(executor.map(run, range(0, n, chunk_rows)))
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def mapk_csr(actual_offsets: np.ndarray, actual_values: np.ndarray, predicted_offsets: np.ndarray,
+             predicted_values: np.ndarray, k: int = 12, n_jobs: int = 1) -> float:
+    """
+    向量化计算平均精度@k（与mapk一致）
+
+    Args:
+        actual_offsets: 真实标签的行偏移
+        actual_values: 真实标签
+        predicted_offsets: 预测标签的行偏移
+        predicted_values: 预测标签
+        k: 截断位置
+        n_jobs: 并行线程数
+
+    Returns:
+        平均精度@k
+    """
+    metrics = evaluate_csr(actual_offsets, actual_values, predicted_offsets, predicted_values, k, n_jobs)
+    return float(np.mean(metrics['apk']))
+
+
+def recall_at_k_csr(actual_offsets: np.ndarray, actual_values: np.ndarray, predicted_offsets: np.ndarray,
+                    predicted_values: np.ndarray, k: int = 12, n_jobs: int = 1) -> np.ndarray:
+    """
+    向量化计算逐用户的召回率@k（与recall_at_k一致）
+
+    Returns:
+        逐用户的召回率数组
+    """
+    return evaluate_csr(actual_offsets, actual_values, predicted_offsets, predicted_values, k, n_jobs)['recall']
+
+
+def precision_at_k_csr(actual_offsets: np.ndarray, actual_values: np.ndarray, predicted_offsets: np.ndarray,
+                       predicted_values: np.ndarray, k: int = 12, n_jobs: int = 1) -> np.ndarray:
+    """
+    向量化计算逐用户的精确率@k（与precision_at_k一致）
+
+    Returns:
+        逐用户的精确率数组
+    """
+    return evaluate_csr(actual_offsets, actual_values, predicted_offsets, predicted_values, k, n_jobs)['precision']
@@ -0,0 +1,217 @@
+"""
+流水线运行模块
+
+把各步骤建模为DAG：每个步骤声明输入和输出路径，依赖关系由路径推断
+（步骤的输入位于另一个步骤的输出之下即依赖该步骤）：
+- 指纹：步骤参数、相关的配置段以及输入文件的(路径, 大小, 修改时间)的哈希，
+  与上次成功运行的指纹一致且输出都存在时跳过
+- 并发：依赖都已完成的步骤在子进程中并发执行，同时运行的步骤占用的核数之和不超过预算
+- 断点续跑：每个步骤成功后立即记录指纹；失败时不再启动新步骤，等正在运行的步骤结束后报错，
+  重新运行时已完成的步骤会被跳过
+"""
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from logzero import logger
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+def path_stamps(paths: List[str]) -> List[Any]:
+    """
+    输入路径的文件清单：目录递归展开为其中的全部文件
+
+    Args:
+        paths: 文件或目录路径
+
+    Returns:
+        [路径, 大小, 修改时间(ns)] 的列表，不存在的路径为 [路径, None, None]
+    """
+    stamps = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    stat = os.stat(file_path)
+                    stamps.append([file_path, stat.st_size, stat.st_mtime_ns])
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append([path, stat.st_size, stat.st_mtime_ns])
+        else:
+            stamps.append([path, None, None])
+    return stamps
+
+
+def _is_under(path: str, parent: str) -> bool:
+    """path与parent相同或位于parent之下"""
+    path, parent = os.path.abspath(path), os.path.abspath(parent)
+    return path == parent or path.startswith(parent + os.sep)
+
+
+class Step:
+    """流水线步骤"""
+
+    def __init__(self, name: str, func: Callable[..., None], inputs: List[str], outputs: List[str],
+                 config_sections: Optional[List[str]] = None, params: Optional[Dict[str, Any]] = None,
+                 cores: int = 1):
+        """
+        初始化
+
+        Args:
+            name: 步骤名
+            func: 步骤函数，以func(config, cores, **params)调用（在子进程中执行，需要可pickle）
+            inputs: 读取的文件或目录
+            outputs: 写出的文件或目录
+            config_sections: 影响结果的配置段
+            params: 传给func的参数，同时计入指纹
+            cores: 占用的核数
+        """
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.config_sections = config_sections or []
+        self.params = params or {}
+        self.cores = cores
+
+    def fingerprint(self, config: Dict[str, Any]) -> str:
+        """参数、配置段和输入文件的指纹"""
+        payload = {
+            'params': self.params,
+            'config': {section: config.get(section) for section in self.config_sections},
+            'inputs': path_stamps(self.inputs),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _run_step(func: Callable[..., None], config: Dict[str, Any], cores: int, params: Dict[str, Any]) -> float:
+    """子进程：执行步骤，返回耗时"""
+    start = time.time()
+    func(config, cores, **params)
+    return time.time() - start
+
+
+class Pipeline:
+    """按依赖关系并发执行步骤的流水线"""
+
+    def __init__(self, state_path: str, config: Dict[str, Any], num_cores: Optional[int] = None):
+        """
+        初始化
+
+        Args:
+            state_path: 运行状态文件（各步骤上次成功运行的指纹）
+            config: 配置
+            num_cores: 核数预算，默认为CPU核数
+        """
+        self.state_path = state_path
+        self.config = config
+        self.num_cores = int(num_cores or os.cpu_count() or 1)
+        self.steps: Dict[str, Step] = {}
+
+    def add(self, step: Step) -> None:
+        """添加步骤（按添加顺序决定同时就绪的步骤的启动顺序）"""
+        if step.name in self.steps:
+            raise ValueError(f"步骤重复: {step.name}")
+        self.steps[step.name] = step
+
+    def dependencies(self, name: str) -> Set[str]:
+        """步骤的上游步骤：输入位于其输出之下的步骤"""
+        step = self.steps[name]
+        return {
+            other.name for other in self.steps.values()
+            if other.name != name and any(_is_under(i, o) for i in step.inputs for o in other.outputs)
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        """先写临时文件再替换，中途失败不会留下损坏的状态文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def is_up_to_date(self, name: str, state: Dict[str, Any], fingerprint: str) -> bool:
+        """指纹与上次成功运行一致，且输出都存在"""
+        step = self.steps[name]
+        return state.get(name, {}).get('fingerprint') == fingerprint and \
+            all(os.path.exists(path) for path in step.outputs)
+
+    def run(self, targets: Optional[List[str]] = None, force: bool = False) -> None:
+        """
+        执行步骤
+
+        Args:
+            targets: 要执行的步骤，默认全部；未选中的上游步骤视为已完成
+            force: 忽略指纹，全部重新执行
+        """
+        targets = list(self.steps) if targets is None else targets
+        for name in targets:
+            if name not in self.steps:
+                raise ValueError(f"未知步骤: {name}")
+        pending = [name for name in self.steps if name in targets]
+        dependencies = {name: self.dependencies(name) & set(pending) for name in pending}
+        state = self._load_state()
+        done: Set[str] = set()
+        failed: List[str] = []
+        running: Dict[Future, str] = {}
+        fingerprints: Dict[str, str] = {}
+        used_cores = 0
+
+        with ProcessPoolExecutor(max_workers=self.num_cores) as pool:
+            while pending or running:
+                # 依次检查就绪的步骤：最新的跳过，其余在核数预算内启动
+                launched = True
+                while launched and not failed:
+                    launched = False
+                    for name in list(pending):
+                        if not dependencies[name] <= done:
+                            continue
+                        step = self.steps[name]
+                        fingerprint = step.fingerprint(self.config)
+                        if not force and self.is_up_to_date(name, state, fingerprint):
+                            logger.info(f"步骤已是最新，跳过: {name}")
+                            pending.remove(name)
+                            done.add(name)
+                            launched = True
+                            continue
+                        cores = min(step.cores, self.num_cores)
+                        if used_cores + cores > self.num_cores:
+                            continue
+                        logger.info(f"启动步骤: {name} ({cores}核)")
+                        future = pool.submit(_run_step, step.func, self.config, cores, step.params)
+                        running[future] = name
+                        fingerprints[name] = fingerprint
+                        pending.remove(name)
+                        used_cores += cores
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    used_cores -= min(self.steps[name].cores, self.num_cores)
+                    try:
+                        seconds = future.result()
+                    except Exception as e:
+                        logger.error(f"步骤失败: {name}: {e!r}")
+                        failed.append(name)
+                        continue
+                    logger.info(f"步骤完成: {name} ({seconds:.1f}s)")
+                    done.add(name)
+                    state[name] = {'fingerprint': fingerprints[name], 'seconds': seconds,
+                                   'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+                    self._save_state(state)
+
+        if failed:
+            raise RuntimeError(f"步骤失败: {', '.join(failed)}；未执行: {', '.join(pending) or '无'}。"
+                               f"修复后重新运行即可从失败处继续")
@@ -0,0 +1,94 @@
+"""
+向量化评估指标测试：*_csr与基于列表的参考实现逐用户一致
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.metrics import (apk, evaluate_csr, mapk, mapk_csr, precision_at_k, precision_at_k_csr,
+                           recall_at_k, recall_at_k_csr, to_csr)
+
+
+def _random_rows(rng: np.random.Generator, n: int, max_len: int, vocab_size: int):
+    """随机的标签列表：包含空行和行内重复的标签"""
+    return [rng.integers(0, vocab_size, rng.integers(0, max_len + 1)).tolist() for _ in range(n)]
+
+
+def _assert_matches_reference(actual, predicted, k, n_jobs=1, chunk_rows=200_000):
+    """逐用户与apk / recall_at_k / precision_at_k比较"""
+    actual_offsets, actual_values, vocabulary = to_csr(actual)
+    predicted_offsets, predicted_values, _ = to_csr(predicted, vocabulary)
+    metrics = evaluate_csr(actual_offsets, actual_values, predicted_offsets, predicted_values, k,
+                           n_jobs=n_jobs, chunk_rows=chunk_rows)
+
+    np.testing.assert_allclose(metrics['apk'], [apk(a, p, k) for a, p in zip(actual, predicted)])
+    np.testing.assert_allclose(metrics['recall'], [recall_at_k(a, p, k) for a, p in zip(actual, predicted)])
+    np.testing.assert_allclose(metrics['precision'],
+                               [precision_at_k(a, p, k) for a, p in zip(actual, predicted)])
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_rows_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    k = int(rng.integers(1, 15))
+    n = int(rng.integers(1, 60))
+    vocab_size = int(rng.integers(2, 30))
+    actual = _random_rows(rng, n, 8, vocab_size)
+    predicted = _random_rows(rng, n, 20, vocab_size)
+    _assert_matches_reference(actual, predicted, k)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_parallel_chunks_match_reference(seed):
+    rng = np.random.default_rng(1000 + seed)
+    actual = _random_rows(rng, 500, 6, 40)
+    predicted = _random_rows(rng, 500, 15, 40)
+    _assert_matches_reference(actual, predicted, 12, n_jobs=4, chunk_rows=37)
+
+
+def test_all_miss():
+    actual = [[0, 1], [2], []]
+    predicted = [[3, 4], [5, 5], [6]]
+    _assert_matches_reference(actual, predicted, 12)
+    _assert_matches_reference(actual, predicted, 12, n_jobs=2, chunk_rows=1)
+
+
+def test_all_miss_mapk():
+    assert mapk_csr([0, 1], [1], [0, 1], [2]) == mapk([[1]], [[2]]) == 0.0
+
+
+def test_empty_and_duplicate_rows():
+    actual = [[], [1, 1, 2], [3], [], [4, 5]]
+    predicted = [[1], [1, 1, 2, 1], [], [], [5, 4, 5, 4]]
+    _assert_matches_reference(actual, predicted, 12)
+    _assert_matches_reference(actual, predicted, 2)
+
+
+def test_exact_k_predictions():
+    rng = np.random.default_rng(7)
+    actual = _random_rows(rng, 200, 5, 20)
+    predicted = [rng.integers(0, 20, 12).tolist() for _ in range(200)]
+    _assert_matches_reference(actual, predicted, 12)
+
+
+def test_wrappers_match_reference():
+    rng = np.random.default_rng(11)
+    actual = _random_rows(rng, 100, 6, 25)
+    predicted = _random_rows(rng, 100, 15, 25)
+    actual_offsets, actual_values, vocabulary = to_csr(actual)
+    predicted_offsets, predicted_values, _ = to_csr(predicted, vocabulary)
+    args = (actual_offsets, actual_values, predicted_offsets, predicted_values, 12)
+
+    assert mapk_csr(*args) == pytest.approx(mapk(actual, predicted, 12))
+    np.testing.assert_allclose(recall_at_k_csr(*args), [recall_at_k(a, p) for a, p in zip(actual, predicted)])
+    np.testing.assert_allclose(precision_at_k_csr(*args),
+                               [precision_at_k(a, p) for a, p in zip(actual, predicted)])
+
+
+def test_row_count_mismatch():
+    with pytest.raises(ValueError):
+        evaluate_csr([0, 1], [1], [0, 1, 2], [1, 2])
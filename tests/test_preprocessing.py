@@ -0,0 +1,52 @@
+"""
+预处理测试：分块模式与默认流程写出的数据表一致
+"""
+
+import os
+import shutil
+import sys
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from data.preprocessing import DataPreprocessor
+from data.storage import load_table
+from data.synthetic import SyntheticDataGenerator
+
+TABLES = ['transactions_train', 'users', 'items']
+
+
+@pytest.fixture(scope='module')
+def processed_dirs(tmp_path_factory):
+    """同一份合成原始数据分别用默认流程和分块流程（多个分块）预处理"""
+    default_dir = str(tmp_path_factory.mktemp('default'))
+    SyntheticDataGenerator(default_dir, preset='tiny', seed=0, n_articles=300, n_customers=1_000,
+                           n_transactions=20_000, n_days=60).generate()
+    chunked_dir = str(tmp_path_factory.mktemp('chunked'))
+    shutil.copytree(os.path.join(default_dir, 'raw'), os.path.join(chunked_dir, 'raw'))
+
+    DataPreprocessor(default_dir).process_data()
+    DataPreprocessor(chunked_dir).process_data(chunked=True, chunksize=3_000)
+    return os.path.join(default_dir, 'processed'), os.path.join(chunked_dir, 'processed')
+
+
+@pytest.mark.parametrize('name', TABLES)
+def test_chunked_matches_default_read_pickle(processed_dirs, name):
+    default_dir, chunked_dir = processed_dirs
+    pd.testing.assert_frame_equal(pd.read_pickle(os.path.join(chunked_dir, f'{name}.pkl')),
+                                  pd.read_pickle(os.path.join(default_dir, f'{name}.pkl')))
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('name', TABLES)
+def test_chunked_matches_default_load_table(processed_dirs, name, mmap):
+    default_dir, chunked_dir = processed_dirs
+    pd.testing.assert_frame_equal(load_table(chunked_dir, name, mmap=mmap),
+                                  load_table(default_dir, name, mmap=mmap))
+
+
+def test_chunked_pickle_is_consolidated(processed_dirs):
+    _, chunked_dir = processed_dirs
+    parts_dir = os.path.join(chunked_dir, 'transactions_train.parts')
+    assert not os.path.isdir(parts_dir) or not os.listdir(parts_dir)